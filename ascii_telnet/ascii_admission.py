@@ -0,0 +1,112 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+from __future__ import division, print_function
+
+import socket
+import threading
+
+from ascii_telnet.ascii_metrics import server_stats
+
+BUSY_SCREEN = b"\x1b[2J\x1b[H\r\n  The server is busy, please try again later.\r\n\r\n"
+
+
+class AdmissionControl(object):
+    def __init__(self, max_connections=None, max_per_ip=None, degrade_at=None):
+        """
+        Limits the concurrent connections, in total and per client IP, so bursts of connections
+        or scans can't exhaust threads and memory. Above a load threshold, the playback is degraded,
+        so existing viewers cost less. The limits apply per server process.
+
+        Args:
+            max_connections (int): connections served at once, unlimited when None
+            max_per_ip (int): connections served at once from the same IP address, unlimited when None
+            degrade_at (int): number of connections, from which on the playback is degraded, never when None
+        """
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self.degrade_at = degrade_at
+        self.active = 0
+        self._per_ip = {}  # ip -> active connections
+        self._lock = threading.Lock()
+
+    def admit(self, ip):
+        """
+        Counts a new connection, unless it exceeds a limit.
+
+        Returns:
+            bool: True, when the connection may be served, it must be released afterwards
+        """
+        with self._lock:
+            count = self._per_ip.get(ip, 0)
+            if ((self.max_connections is not None and self.active >= self.max_connections) or
+                    (self.max_per_ip is not None and count >= self.max_per_ip)):
+                server_stats.increment("connections_rejected")
+                return False
+            self.active += 1
+            self._per_ip[ip] = count + 1
+            return True
+
+    def release(self, ip):
+        with self._lock:
+            self.active -= 1
+            count = self._per_ip.pop(ip) - 1
+            if count:
+                self._per_ip[ip] = count
+
+    @property
+    def degraded(self):
+        """
+        bool: the server is under load, players should lower their frame rate and send deltas only
+        """
+        return self.degrade_at is not None and self.active >= self.degrade_at
+
+
+def client_ip(client_address):
+    """
+    Returns:
+        str: the IP address of a client address, the address itself for non-IP sockets, e.g. handed over ones
+    """
+    if isinstance(client_address, tuple):
+        return client_address[0]
+    return client_address
+
+
+def reject(sock):
+    """
+    Shows the busy screen, without waiting for a slow client, and closes the connection.
+    """
+    try:
+        sock.setblocking(False)
+        sock.send(BUSY_SCREEN)
+        sock.shutdown(socket.SHUT_WR)
+        # unread input would reset the connection on close, and the client might miss the busy screen
+        while sock.recv(4096):
+            pass
+    except (OSError, socket.error):
+        pass
+    sock.close()
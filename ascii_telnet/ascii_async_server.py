@@ -0,0 +1,529 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from __future__ import division, print_function
+
+import asyncio
+import socket
+
+from ascii_telnet.ascii_admission import BUSY_SCREEN, client_ip
+from ascii_telnet.ascii_catalog import MovieMenu
+from ascii_telnet.ascii_handoff import HandoffReceiver
+from ascii_telnet.ascii_metrics import server_stats
+from ascii_telnet.ascii_movie import movie_registry
+from ascii_telnet.ascii_pacing import SEND_BUFFER_BYTES, LinkPacer, unsent_bytes
+from ascii_telnet.ascii_player import PlaybackControls, VT100Player, WindowResizes
+from ascii_telnet.ascii_protocol import (CHARACTER_MODE, DO_NAWS, REQUEST_USER, WILL_COMPRESS2, StreamCompressor,
+                                         TelnetParser, shared_blocks)
+from ascii_telnet.ascii_scheduler import monotonic
+
+
+class _Connection(object):
+    def __init__(self, writer):
+        """
+        Keeps track of the transport's send buffer of one connection.
+        """
+        self.writer = writer
+        self.transport = writer.transport
+        # the protocol is paused while anything is buffered, so drain() waits until the buffer is empty
+        self.transport.set_write_buffer_limits(high=0)
+        self.needs_sync = False  # frames were dropped, the next frame must be a full one
+        self.compressor = None  # StreamCompressor, once the client accepted compression
+        self.pacer = None  # LinkPacer, when the playback adapts to the client's link
+        self._pending = None  # (data, shared) of the newest frame, waiting for the send buffer to drain
+        self._flusher = None  # task, which sends the pending frame
+        self._buffered = 0
+        self._last_progress = asyncio.get_event_loop().time()
+        self._waiter = None  # future, which the playback is waiting for
+
+    def write(self, data, shared=False, is_delta=False):
+        """
+        Writes data right away, when the send buffer is empty. Otherwise the data waits until
+        the buffer drained, replacing the stale frame waiting before, so a slow client always
+        gets the newest frame.
+
+        Args:
+            data (bytes): VT100 stream of a frame
+            shared (bool): the very same bytes are sent to other clients, so they are compressed only once
+            is_delta (bool): the frame only contains changes to the previous frames
+
+        Returns:
+            bool: False, when frames were dropped and the next frame needs to be a full one
+        """
+        if self.transport.get_write_buffer_size() == 0 and self._pending is None:
+            self._send(data, shared)
+            return True
+        if self._pending is not None:
+            self._pending = None
+            if is_delta:
+                # this frame only makes sense on top of the dropped one
+                server_stats.increment("frames_dropped", 2)
+                return False
+            server_stats.increment("frames_dropped")
+        self._pending = (data, shared)
+        if self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._flush())
+        return True
+
+    async def _flush(self):
+        try:
+            while self._pending is not None and not self.transport.is_closing():
+                await self.writer.drain()
+                if self.transport.get_write_buffer_size() == 0 and self._pending is not None:
+                    data, shared = self._pending
+                    self._pending = None
+                    self._send(data, shared)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._flusher = None
+
+    def _send(self, data, shared):
+        if self.pacer is not None:
+            probe = self.pacer.rtt.probe()
+            if probe:
+                data, shared = data + probe, False
+        if self.compressor is not None:
+            if shared:
+                compressed = self.compressor.splice(data, shared_blocks.get(data))
+            else:
+                compressed = self.compressor.compress(data)
+            server_stats.increment("compression_saved_bytes", len(data) - len(compressed))
+            data = compressed
+        start = monotonic()
+        self.writer.write(data)
+        server_stats.observe("write_seconds", monotonic() - start)
+        server_stats.increment("bytes_sent", len(data))
+        server_stats.increment("frames_sent")
+
+    async def sleep(self, delay):
+        """
+        Waits for the given seconds, or until wake() is called.
+        """
+        loop = asyncio.get_event_loop()
+        self._waiter = loop.create_future()
+        timer = loop.call_later(delay, self.wake)
+        try:
+            await self._waiter
+        finally:
+            timer.cancel()
+            self._waiter = None
+
+    def wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def enable_compression(self, telnet):
+        """
+        Starts compressing, once the client accepted it.
+
+        Args:
+            telnet (ascii_protocol.TelnetParser): parser of the client's input
+        """
+        if telnet.compress2 and self.compressor is None:
+            self.compressor = StreamCompressor()
+
+    def unsent_bytes(self):
+        """
+        Returns:
+            int: bytes of the pending frame and bytes buffered by the transport and the socket, which weren't sent yet
+        """
+        unsent = self.transport.get_write_buffer_size() + (unsent_bytes(self.writer.get_extra_info("socket")) or 0)
+        if self._pending is not None:
+            unsent += len(self._pending[0])
+        return unsent
+
+    def stalled_for(self):
+        """
+        Returns:
+            float: seconds since the transport last made progress in sending the buffered data
+        """
+        now = asyncio.get_event_loop().time()
+        buffered = self.transport.get_write_buffer_size()
+        if buffered == 0 or buffered < self._buffered:
+            self._last_progress = now
+        self._buffered = buffered
+        return now - self._last_progress
+
+
+class AsyncTelnetServer(object):
+    def __init__(self, interface, port, filename, render_cache=None, backlog=1024, channel=None, delta=False,
+                 send_buffer_bytes=SEND_BUFFER_BYTES, stall_timeout=30.0, sock=None, reuse_port=False, naws_timeout=1.0,
+                 compress=False, catalog=None, menu_timeout=60.0, admission=None, adaptive=False):
+        """
+        TCP server, which serves all connections from a single asyncio event loop.
+        Instead of one thread per connection, every connection is a task and frames are
+        paced with the timers of the event loop.
+
+        Args:
+            interface (str): bind to this interface
+            port (int): bind to this port
+            filename (str): file name of the ASCII movie
+            render_cache (ascii_player.RenderCacheRegistry): optional caches of rendered frames per screen size
+            backlog (int): size of the listen queue for not yet accepted connections
+            channel (ascii_channel.BroadcastChannel): optional live channel, all connections watch
+            delta (bool): send only the changed parts of the screen
+            send_buffer_bytes (int): size of the kernel's send buffer per connection (SO_SNDBUF), small,
+                                     so the frames a slow client can't take are dropped instead of piling up
+            stall_timeout (float): seconds without progress in sending, before a client is disconnected
+            sock (socket.socket): optional listening socket to use, instead of binding interface and port
+            reuse_port (bool): allow several processes to bind the same port, see SO_REUSEPORT
+            naws_timeout (float): seconds to wait for the client's window size, before playing at the movie's size
+            compress (bool): offer MCCP2 compression to the clients
+            catalog (ascii_catalog.MovieCatalog): optional catalog, the clients choose a movie of it instead of filename
+            menu_timeout (float): seconds a client may take to choose a movie
+            admission (ascii_admission.AdmissionControl): optional connection limits, connections above them
+                                                          get the busy screen
+            adaptive (bool): measure the round trip time and lower the frame rate on slow links, see ascii_pacing
+        """
+        self.interface = interface
+        self.port = port
+        self.filename = filename
+        self.render_cache = render_cache
+        self.backlog = backlog
+        self.channel = channel
+        self.delta = delta
+        self.send_buffer_bytes = send_buffer_bytes
+        self.stall_timeout = stall_timeout
+        self.sock = sock
+        self.reuse_port = reuse_port
+        self.naws_timeout = naws_timeout
+        self.compress = compress
+        self.catalog = catalog
+        self.menu_timeout = menu_timeout
+        self.admission = admission
+        self.adaptive = adaptive
+        self._viewers = set()  # connections watching the channel
+        self._loop = asyncio.new_event_loop()
+        self._handoff = None
+        self._draining = False
+        self._drain_timeout = None
+
+    async def handle(self, reader, writer):
+        """
+        Plays the movie to one connected client.
+        """
+        ip = client_ip(writer.get_extra_info("peername"))
+        if self.admission is not None and not self.admission.admit(ip):
+            await self.reject(reader, writer)
+            return
+        server_stats.increment("connections_total")
+        server_stats.increment("connections_active")
+        try:
+            await self.play(reader, writer)
+        finally:
+            server_stats.increment("connections_active", -1)
+            if self.admission is not None:
+                self.admission.release(ip)
+
+    async def reject(self, reader, writer):
+        """
+        Shows the busy screen and waits a moment for the client to close the connection,
+        unread input would reset the connection and the client might miss the busy screen.
+        """
+        writer.write(BUSY_SCREEN)
+        try:
+            writer.write_eof()
+            await asyncio.wait_for(reader.read(), 1)
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        writer.close()
+
+    async def play(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None and self.send_buffer_bytes:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer_bytes)
+        connection = _Connection(writer)
+        if self.channel is not None:
+            await self.watch_channel(reader, connection)
+            return
+
+        telnet = TelnetParser()
+        if not await self.negotiate_window_size(reader, connection, telnet):
+            writer.close()
+            return
+        filename = self.filename
+        if self.catalog is not None:
+            filename = await self.choose_movie(reader, connection, telnet)
+            if filename is None:
+                writer.close()
+                return
+        # loading a movie blocks, the other connections keep playing meanwhile
+        movie = await asyncio.get_event_loop().run_in_executor(None, movie_registry.get, filename)
+        width, height = telnet.window_size or (movie.screen_width, movie.screen_height)
+        player = VT100Player(movie, self._render_cache(movie, width, height), self.delta, (width, height))
+
+        def draw_frame(screen_buffer):
+            if not connection.write(screen_buffer.read(), player.frame_shared, player.delta is not None):
+                player.invalidate()
+
+        player.draw_frame = draw_frame
+        resizes = WindowResizes(player, lambda width, height: self._render_cache(movie, width, height))
+        if self.adaptive:
+            connection.pacer = LinkPacer()
+        input_task = asyncio.ensure_future(self.read_input(reader, connection, telnet, PlaybackControls(player),
+                                                           resizes.request))
+        try:
+            for delay in player.steps():
+                if self.admission is not None:
+                    player.degrade(self.admission.degraded)
+                if connection.pacer is not None:
+                    player.adapt(*connection.pacer.update(connection.unsent_bytes()))
+                resizes.apply()
+                connection.stalled_for()
+                await connection.sleep(delay)
+                if writer.transport.is_closing():
+                    print("Client Disconnected.")
+                    break
+                if self._evict(connection):
+                    break
+        finally:
+            player.stop()
+            input_task.cancel()
+            writer.close()
+        if player.delta is not None:
+            print("Delta encoding saved {0} of {1} bytes.".format(player.delta.bytes_saved, player.delta.bytes_full))
+        if connection.pacer is not None:
+            print(connection.pacer.summary())
+
+    async def negotiate_window_size(self, reader, connection, telnet):
+        """
+        Asks the client for its window size (telnet NAWS) and waits a moment for the answer.
+        Also switches the client to character mode, for the playback controls, offers compression
+        and asks for the USER variable, which may name the movie to play from the catalog.
+
+        Returns:
+            bool: False, when the client disconnected
+        """
+        connection.write(DO_NAWS + CHARACTER_MODE + (WILL_COMPRESS2 if self.compress else b"") +
+                         (REQUEST_USER if self.catalog is not None else b""))
+        deadline = asyncio.get_event_loop().time() + self.naws_timeout
+        while not (telnet.naws_negotiated and (self.catalog is None or telnet.environ_negotiated)):
+            timeout = deadline - asyncio.get_event_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                data = await asyncio.wait_for(reader.read(1024), timeout)
+            except asyncio.TimeoutError:
+                break
+            except (ConnectionError, OSError):
+                return False
+            if not data:
+                return False
+            telnet.feed(data)
+        if self.compress:
+            connection.enable_compression(telnet)
+        return True
+
+    async def choose_movie(self, reader, connection, telnet):
+        """
+        Plays the movie named by the client's USER variable ('telnet -l TITLE'), or lets the client
+        choose one from a menu.
+
+        Returns:
+            str: file path of the chosen movie, None when the client disconnected or didn't choose
+        """
+        path = self.catalog.path((telnet.environ or {}).get("USER"))
+        if path is not None:
+            return path
+        menu = MovieMenu(self.catalog, connection.write)
+        menu.show()
+        deadline = asyncio.get_event_loop().time() + self.menu_timeout
+        while menu.choice is None:
+            timeout = deadline - asyncio.get_event_loop().time()
+            if timeout <= 0:
+                return None
+            try:
+                data = await asyncio.wait_for(reader.read(1024), timeout)
+            except (asyncio.TimeoutError, ConnectionError, OSError):
+                return None
+            if not data:
+                return None
+            menu.feed(telnet.feed(data))
+            if self.compress:
+                connection.enable_compression(telnet)
+        return self.catalog.path(menu.choice)
+
+    async def read_input(self, reader, connection, telnet, controls, resize):
+        """
+        Processes the telnet commands and keystrokes the client sends while playing, until it disconnects.
+
+        Args:
+            controls (ascii_player.PlaybackControls): controls of the connection's player
+            resize (callable): called with the new width and height, when the client's window changed its size
+        """
+        try:
+            while True:
+                data = await reader.read(1024)
+                if not data:
+                    break
+                window_size = telnet.window_size
+                timing_marks = telnet.timing_marks
+                keys = telnet.feed(data)
+                if telnet.timing_marks != timing_marks and connection.pacer is not None:
+                    connection.pacer.rtt.on_answer()
+                if self.compress:
+                    connection.enable_compression(telnet)
+                if telnet.window_size != window_size:
+                    resize(*telnet.window_size)
+                if keys:
+                    controls.feed(keys)
+                    if controls.player.interrupted:
+                        connection.wake()  # the player takes the next step right away
+        except (ConnectionError, OSError):
+            pass
+        connection.writer.close()
+        connection.wake()
+
+    def _render_cache(self, movie, width, height):
+        if self.render_cache is None:
+            return None
+        return self.render_cache.get(movie, width, height)
+
+    async def watch_channel(self, reader, connection):
+        """
+        Sends the frames of the live channel, until the client disconnects.
+        """
+        telnet = TelnetParser()
+        if self.compress:
+            connection.write(WILL_COMPRESS2)
+        connection.write(self.channel.sync_frame()[1])
+        self._viewers.add(connection)
+        try:
+            while not self._evict(connection):
+                try:
+                    data = await asyncio.wait_for(reader.read(1024), 1)
+                except asyncio.TimeoutError:
+                    continue
+                if not data:
+                    break
+                telnet.feed(data)  # keystrokes are ignored, only the compression is negotiated
+                if self.compress:
+                    connection.enable_compression(telnet)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._viewers.discard(connection)
+            connection.writer.close()
+
+    def _evict(self, connection):
+        stalled = connection.stalled_for()
+        if stalled > self.stall_timeout:
+            print("Client evicted, stalled for {0:.0f} seconds.".format(stalled))
+            server_stats.increment("clients_evicted")
+            return True
+        return False
+
+    def adopt(self, sock):
+        """
+        Serves a connection, which was accepted by another process, see ascii_handoff.
+        Called from other threads.
+
+        Args:
+            sock (socket.socket): the connected socket
+        """
+        self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._handle_socket(sock), loop=self._loop))
+
+    def serve_handoffs(self, sock):
+        """
+        Also serves connections, which inetd stubs hand over, see ascii_handoff.
+
+        Args:
+            sock (socket.socket): listening Unix domain socket of the stubs
+        """
+        self._handoff = HandoffReceiver(sock, self.adopt)
+        self._handoff.start()
+
+    def stop_accepting(self, drain_timeout=None):
+        """
+        Makes serve_forever() stop accepting connections and return, once the connections in progress
+        finished. Can be called from any thread and from signal handlers.
+
+        Args:
+            drain_timeout (float): seconds to wait for the connections in progress at most, forever when None
+        """
+        self._drain_timeout = drain_timeout
+        if self._handoff is not None:
+            self._handoff.stop()
+        self._loop.call_soon_threadsafe(self._stop_accepting)
+
+    def _stop_accepting(self):
+        self._draining = True
+        self._loop.stop()
+
+    async def _drain(self):
+        deadline = None if self._drain_timeout is None else self._loop.time() + self._drain_timeout
+        while server_stats.connections_active > 0 and (deadline is None or self._loop.time() < deadline):
+            await asyncio.sleep(0.1)
+        return server_stats.connections_active
+
+    async def _handle_socket(self, sock):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        await self.handle(reader, writer)
+
+    def _on_channel_frame(self, frame):
+        # called from the channel's thread
+        self._loop.call_soon_threadsafe(self._broadcast, frame)
+
+    def _broadcast(self, frame):
+        sync_frame = None
+        for connection in list(self._viewers):
+            if connection.transport.is_closing():
+                self._viewers.discard(connection)
+            elif connection.needs_sync:
+                if sync_frame is None:
+                    sync_frame = self.channel.sync_frame()[1]
+                connection.needs_sync = not connection.write(sync_frame, shared=True)
+            elif not connection.write(frame, shared=True, is_delta=self.channel.delta):
+                # a delta only applies on top of the dropped frame
+                connection.needs_sync = True
+
+    def serve_forever(self):
+        """
+        Runs the event loop, until interrupted or stopped with stop_accepting().
+        """
+        loop = self._loop
+        asyncio.set_event_loop(loop)
+        if self.channel is not None:
+            self.channel.add_listener(self._on_channel_frame)
+        if self.sock is not None:
+            start_server = asyncio.start_server(self.handle, sock=self.sock, backlog=self.backlog)
+        else:
+            start_server = asyncio.start_server(self.handle, self.interface, self.port, backlog=self.backlog,
+                                                reuse_port=self.reuse_port or None)
+        server = loop.run_until_complete(start_server)
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            if self._draining:
+                # the playbacks in progress keep running on the loop, without new connections
+                remaining = loop.run_until_complete(self._drain())
+                if remaining:
+                    print("Closing {0} connections, which didn't finish in time.".format(remaining))
+            else:
+                loop.run_until_complete(server.wait_closed())
+            loop.close()
@@ -0,0 +1,142 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+from __future__ import division, print_function
+
+import os
+
+from ascii_telnet.ascii_movie import movie_registry
+from ascii_telnet.ascii_player import VT100Player
+
+
+class MovieCatalog(object):
+    extensions = (".atm", ".txt")  # compiled movies are preferred over text movies of the same title
+
+    def __init__(self, directory, registry=movie_registry):
+        """
+        The movies in a directory, each file is one movie titled by its file name.
+        The directory is listed on each access, so movies can be added and removed while serving.
+
+        Args:
+            directory (str): directory containing the movie files
+            registry (ascii_movie.MovieRegistry): registry, which loads and caches the movies
+        """
+        self.directory = directory
+        self.registry = registry
+
+    def titles(self):
+        """
+        Returns:
+            list: sorted titles of the movies
+        """
+        return sorted(self._files())
+
+    def path(self, title):
+        """
+        Returns:
+            str: file path of the movie with the given title, None when there's no such movie
+        """
+        return self._files().get(title)
+
+    def get(self, title):
+        """
+        Returns:
+            ascii_movie.Movie: the loaded movie with the given title, None when there's no such movie
+        """
+        path = self.path(title)
+        return self.registry.get(path) if path is not None else None
+
+    def _files(self):
+        files = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return files
+        for name in names:
+            title, extension = os.path.splitext(name)
+            if extension not in self.extensions:
+                continue
+            path = os.path.join(self.directory, name)
+            previous = files.get(title)
+            if previous is None or self.extensions.index(extension) < self.extensions.index(previous[1]):
+                files[title] = (path, extension)
+        return dict((title, path) for title, (path, _) in files.items() if os.path.isfile(path))
+
+
+class MovieMenu(object):
+    def __init__(self, catalog, send):
+        """
+        Text menu, which lets a client choose a movie of the catalog by typing its number or title.
+        The client is in character mode, so the menu echoes the typed keys itself.
+
+        Args:
+            catalog (MovieCatalog): the movies to choose from
+            send (callable): sends bytes to the client
+        """
+        self.catalog = catalog
+        self.send = send
+        self.choice = None  # title of the chosen movie
+        self._titles = []
+        self._line = bytearray()
+
+    def show(self):
+        self._titles = self.catalog.titles()
+        lines = [VT100Player.CLEARSCRN + VT100Player.ESC + "[H", "Choose a movie:", ""]
+        for number, title in enumerate(self._titles, 1):
+            lines.append("  {0:>2}) {1}".format(number, title))
+        lines.extend(["", "> "])
+        self.send("\r\n".join(lines).encode("utf-8"))
+
+    def feed(self, data):
+        """
+        Args:
+            data (bytes): keystrokes of the client, without telnet commands
+        """
+        for byte in bytearray(data):
+            if self.choice is not None:
+                return
+            if byte in (13, 10):
+                if self._line:
+                    self._choose(self._line.decode("utf-8", "replace").strip())
+            elif byte in (8, 127):
+                if self._line:
+                    del self._line[-1]
+                    self.send(b"\b \b")
+            elif 32 <= byte < 127:
+                self._line.append(byte)
+                self.send(bytes(bytearray([byte])))
+
+    def _choose(self, text):
+        del self._line[:]
+        title = text
+        if text.isdigit() and 1 <= int(text) <= len(self._titles):
+            title = self._titles[int(text) - 1]
+        if self.catalog.path(title) is not None:
+            self.choice = title
+            self.send(b"\r\n")
+        else:
+            self.send(b"\r\nNo such movie.\r\n> ")
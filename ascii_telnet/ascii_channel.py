@@ -0,0 +1,136 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from __future__ import division, print_function
+
+import threading
+
+from ascii_telnet.ascii_player import VT100Player
+
+
+class BroadcastChannel(object):
+    def __init__(self, movie, render_cache=None, delta=False):
+        """
+        A live channel plays one movie in an endless loop with a single playback clock.
+        Each frame is rendered once and the very same bytes are handed to all viewers.
+        Viewers joining in the middle of the movie start with a full screen sync frame.
+
+        Args:
+            movie (ascii_movie.Movie): Movie Object that the channel will play.
+            render_cache (ascii_player.FrameRenderCache): optional cache of rendered frames
+            delta (bool): publish only the changes between frames, viewers who
+                          missed a frame get the full frame instead
+        """
+        self._player = VT100Player(movie, render_cache, delta)
+        # viewers get the clear screen with their sync frame, not with the channel's first frame
+        self._player._clear_screen_setup_done = True
+        self._player.draw_frame = self._publish
+
+        self._condition = threading.Condition()
+        self._sequence = 0  # number of the latest published frame
+        self._frame = b""  # bytes of the latest published frame
+        self._current = None  # (frame, frame_pos, frame_index) of the latest published frame
+        self._full_frame = b""  # full screen of the latest published frame, rendered on demand
+        self._listeners = []
+        self._thread = None
+
+    @property
+    def delta(self):
+        """
+        bool: frames are published as changes to the previous frame
+        """
+        return self._player.delta is not None
+
+    def start(self):
+        """
+        Starts the playback in a background thread.
+        """
+        self._thread = threading.Thread(target=self._player.play, kwargs={"repeat": True})
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the playback.
+        """
+        self._player.stop()
+
+    def sync_frame(self):
+        """
+        Returns:
+            tuple: (sequence, bytes) of the latest frame, prefixed with a clear screen,
+                   so that a new viewer gets a complete picture
+        """
+        with self._condition:
+            return self._sequence, VT100Player.CLEARSCRN.encode() + self._full()
+
+    def wait_for_frame(self, sequence, timeout=None):
+        """
+        Blocks until a frame newer than the given one was published.
+        Slow viewers skip frames, they always get the latest one.
+
+        Args:
+            sequence (int): sequence number of the last frame, the viewer got
+            timeout (float): seconds to wait at most
+
+        Returns:
+            tuple: (sequence, bytes) of the latest frame, or the given sequence and None on timeout
+        """
+        with self._condition:
+            if self._sequence == sequence:
+                self._condition.wait(timeout)
+            if self._sequence == sequence:
+                return sequence, None
+            if self._sequence != sequence + 1:
+                # a delta only applies on top of the previous frame
+                return self._sequence, self._full()
+            return self._sequence, self._frame
+
+    def add_listener(self, listener):
+        """
+        Registers a callable, which gets every frame's bytes right after publishing.
+        Listeners are called from the channel's thread and must not block.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def _full(self):
+        if self._full_frame is None:
+            self._full_frame = self._player.current_frame_data(self._current)
+        return self._full_frame
+
+    def _publish(self, screen_buffer):
+        frame = screen_buffer.read()
+        with self._condition:
+            self._sequence += 1
+            self._frame = frame
+            self._current = self._player._current
+            self._full_frame = None if self._player.delta is not None else frame
+            self._condition.notify_all()
+        for listener in list(self._listeners):
+            listener(frame)
@@ -0,0 +1,391 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+Compiled movie format (*.atm), which is memory mapped instead of parsed.
+
+Layout, all numbers little endian:
+    header      magic 'ATM1', screen width, screen height, frame width, frame height (4 x uint16),
+                frame count, duration in frame cycles (2 x uint32)
+    index       per frame: payload offset (uint64), payload length, display time (2 x uint32)
+    payloads    per frame: the frame lines, already padded and centered, each terminated by CR LF (UTF-8)
+
+Convert a movie with:
+    python -m ascii_telnet.ascii_compiled -o sw1.atm sample_movies/sw1.txt
+
+Text movies can also be compiled on the fly into shared memory, see load_shared().
+"""
+from __future__ import division, print_function
+
+import errno
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import weakref
+from optparse import OptionParser
+
+from ascii_telnet.ascii_movie import Frame, Movie
+
+MAGIC = b"ATM1"
+HEADER = struct.Struct("<4sHHHHII")
+INDEX_ENTRY = struct.Struct("<QII")
+# directory of the movies compiled by load_shared(), /dev/shm keeps them in memory
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+_finalizers = set()  # weak references of _finalize() on Py2, their callbacks only run while they live
+
+
+class CompiledFrame(Frame):
+    __slots__ = ("payload",)
+
+    def __init__(self, display_time, payload):
+        """
+        A frame backed by a slice of the memory mapped movie file.
+
+        Args:
+            display_time (int): the frame cycles this specific frame should be displayed
+            payload (memoryview): the encoded frame lines, bytes on Py2
+        """
+        self.display_time = display_time
+        self.payload = payload
+
+    @property
+    def data(self):
+        return tuple(bytes(self.payload).decode("utf-8").split("\r\n")[:-1])
+
+    def encode(self):
+        return self.payload
+
+
+class CompiledFrames(object):
+    def __init__(self, movie, frame_count):
+        """
+        Read-only sequence of the frames of a compiled movie, frame objects are created on access.
+
+        Args:
+            movie (CompiledMovie): the movie, which maps the file
+            frame_count (int): number of frames in the movie file
+        """
+        self._movie = movie
+        self._frame_count = frame_count
+
+    def __len__(self):
+        return self._frame_count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._frame_count
+        if not 0 <= index < self._frame_count:
+            raise IndexError("frame index out of range")
+        try:
+            return self._frame(self._movie.buffer(), index)
+        except ValueError:
+            # the movie was closed in between, the file is mapped again
+            return self._frame(self._movie.buffer(), index)
+
+    def __iter__(self):
+        for index in range(self._frame_count):
+            yield self[index]
+
+    @staticmethod
+    def _frame(buf, index):
+        offset, length, display_time = INDEX_ENTRY.unpack_from(buf, HEADER.size + index * INDEX_ENTRY.size)
+        return CompiledFrame(display_time, buf[offset:offset + length])
+
+
+class CompiledMovie(Movie):
+    def __init__(self, width=80, height=24):
+        Movie.__init__(self, width, height)
+        self._filepath = None
+        self._header = None
+        self._mmap = None
+        self._buf = None
+        self._map_lock = threading.Lock()
+
+    def load(self, filepath):
+        """
+        Maps a compiled movie file into memory. Frames are not parsed, but sliced from the mapping
+        when accessed, so loading takes constant time and processes serving the same movie
+        share its memory through the page cache.
+
+        Args:
+            filepath (str): Path to the compiled movie (*.atm)
+
+        Raises:
+            ValueError: the file isn't a compiled movie for this screen size, or it's truncated
+        """
+        if self._loaded:
+            return False
+        start = time.time()
+        self._filepath = filepath
+        self.buffer()  # maps and checks the file
+        magic, screen_width, screen_height, frame_width, frame_height, frame_count, duration = self._header
+        if (screen_width, screen_height) != (self.screen_width, self.screen_height):
+            self.close()
+            raise ValueError("Movie {0} is compiled for a {1}x{2} screen, not {3}x{4}".format(
+                filepath, screen_width, screen_height, self.screen_width, self.screen_height))
+        self._frame_width = frame_width
+        self._frame_height = frame_height
+        self.frames = CompiledFrames(self, frame_count)
+        self._duration = duration
+        self.load_time = time.time() - start
+        self._loaded = True
+        return True
+
+    def buffer(self):
+        """
+        Returns:
+            memoryview: the mapped movie file, mapped again when the movie was closed
+        """
+        buf = self._buf
+        if buf is not None:
+            return buf
+        with self._map_lock:
+            if self._buf is None:
+                self._map()
+            return self._buf
+
+    def _map(self):
+        with open(self._filepath, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError("Not a compiled movie: {0}".format(self._filepath))
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            buf = memoryview(mapping)
+        except TypeError:  # Py2, its mmap doesn't support memoryview, slices are copies then
+            buf = mapping
+        try:
+            header = HEADER.unpack_from(buf)
+            if header[0] != MAGIC:
+                raise ValueError("Not a compiled movie: {0}".format(self._filepath))
+            if self._header is not None and header != self._header:
+                raise ValueError("Compiled movie {0} was changed".format(self._filepath))
+            frame_count = header[5]
+            index_end = HEADER.size + frame_count * INDEX_ENTRY.size
+            if index_end > size:
+                raise ValueError("Compiled movie {0} is truncated, its index of {1} frames doesn't fit "
+                                 "in {2} bytes".format(self._filepath, frame_count, size))
+            if frame_count:
+                offset, length, _ = INDEX_ENTRY.unpack_from(buf, index_end - INDEX_ENTRY.size)
+                if offset < index_end or offset + length > size:
+                    raise ValueError("Compiled movie {0} is truncated, its last frame ends at byte {1} "
+                                     "of {2}".format(self._filepath, offset + length, size))
+        except ValueError:
+            _release(buf, mapping)
+            raise
+        self._header = header
+        self._mmap = mapping
+        self._buf = buf
+
+    def close(self):
+        """
+        Releases the mapping of the movie file. Frames taken from the movie stay valid,
+        players still holding the movie map the file again with the next frame.
+        """
+        with self._map_lock:
+            if self._buf is not None:
+                _release(self._buf, self._mmap)
+                self._buf = None
+                self._mmap = None
+
+    def display_times(self):
+        buf = self.buffer()
+        return [INDEX_ENTRY.unpack_from(buf, HEADER.size + index * INDEX_ENTRY.size)[2]
+                for index in range(len(self.frames))]
+
+    def memory_usage(self):
+        """
+        Returns:
+            int: size in bytes of the mapped movie file, which is shared with other processes
+        """
+        mapping = self._mmap
+        return len(mapping) if mapping is not None else 0
+
+
+def _release(buf, mapping):
+    if buf is not mapping:
+        buf.release()
+    try:
+        mapping.close()
+    except BufferError:
+        pass  # frames in use still export the mapping, it's released together with the last of them
+
+
+def compile_movie(source, target, width=80, height=24):
+    """
+    Converts a movie from the text format into the compiled format.
+
+    Args:
+        source (str): Path to Ascii Movie Data
+        target (str): Path of the compiled movie (*.atm) to write
+        width (int): Movie screen width.
+        height (int): Movie screen height
+    """
+    movie = Movie(width, height)
+    movie.load(source)
+    write_compiled(target, movie.display_times(), [frame.encode() for frame in movie.frames], width, height)
+
+
+def write_compiled(target, display_times, payloads, width=80, height=24):
+    """
+    Writes a compiled movie from frames, which are rendered already.
+
+    Args:
+        target (str): Path of the compiled movie (*.atm) to write
+        display_times (list): display time of every frame, in frame cycles
+        payloads (list): bytes of every frame, see Frame.encode()
+        width (int): Movie screen width, the payloads are centered for
+        height (int): Movie screen height
+    """
+    movie = Movie(width, height)  # for the frame size
+    offset = HEADER.size + len(payloads) * INDEX_ENTRY.size
+    tmp = target + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, width, height, movie._frame_width, movie._frame_height,
+                            len(payloads), sum(display_times)))
+        for display_time, payload in zip(display_times, payloads):
+            f.write(INDEX_ENTRY.pack(offset, len(payload), display_time))
+            offset += len(payload)
+        for payload in payloads:
+            f.write(payload)
+    # replace atomically, servers may have the old file mapped
+    getattr(os, "replace", os.rename)(tmp, target)
+
+
+def load_shared(filepath, width=80, height=24, directory=None):
+    """
+    Loads a text movie through a compiled copy in shared memory. The first process compiles it,
+    other processes on the host serving the same movie file map the same copy read-only, so they
+    only hold their player state. Each process holds a shared lock on the copy, the last process
+    releasing its movie deletes the copy. A changed movie file gets a new copy.
+
+    Args:
+        filepath (str): Path to Ascii Movie Data
+        width (int): Movie screen width.
+        height (int): Movie screen height
+        directory (str): directory of the shared copies, SHARED_DIR by default
+
+    Returns:
+        CompiledMovie: the mapped movie
+    """
+    import fcntl
+
+    directory = directory or SHARED_DIR
+    stat = os.stat(filepath)
+    key = "{0}:{1}:{2}".format(os.path.abspath(filepath), stat.st_mtime, stat.st_size)
+    target = os.path.join(directory, "ascii-telnet-{0}-{1}x{2}.atm".format(
+        hashlib.sha1(key.encode("utf-8")).hexdigest()[:20], width, height))
+    # copies of processes, which were killed before they could delete them
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith("ascii-telnet-") and name.endswith(".atm") and path != target:
+            try:
+                _release_shared(open(path, "rb"), path)
+            except IOError:
+                pass
+    while True:
+        if not os.path.exists(target):
+            tmp = "{0}.{1}.tmp".format(target, os.getpid())
+            compile_movie(filepath, tmp, width, height)
+            try:
+                os.link(tmp, target)  # fails, when another process was faster, its copy is used then
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            finally:
+                os.unlink(tmp)
+        try:
+            lock = open(target, "rb")
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                continue  # deleted by the last process, which used it
+            raise
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        try:
+            current = os.stat(target).st_ino == os.fstat(lock.fileno()).st_ino
+        except OSError:
+            current = False
+        if current:
+            break
+        lock.close()  # deleted, while waiting for the lock
+
+    movie = CompiledMovie(width, height)
+    movie.load(target)
+    _finalize(movie, _release_shared, lock, target)
+    return movie
+
+
+def _finalize(obj, func, *args):
+    """
+    Calls func(*args), once obj is garbage collected. weakref.finalize on Py3.4+.
+    """
+    if hasattr(weakref, "finalize"):
+        weakref.finalize(obj, func, *args)
+        return
+
+    def callback(ref):
+        _finalizers.discard(ref)
+        func(*args)
+
+    _finalizers.add(weakref.ref(obj, callback))
+
+
+def _release_shared(lock, target):
+    import fcntl
+
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        pass  # other processes still use it
+    else:
+        try:
+            if os.stat(target).st_ino == os.fstat(lock.fileno()).st_ino:
+                os.unlink(target)
+        except OSError:
+            pass
+    finally:
+        lock.close()
+
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="Usage: %prog [options] MOVIE_FILE")
+    parser.add_option("-o", "--output", dest="output", metavar="FILE",
+                      help="Compiled movie file to write (default: MOVIE_FILE with extension .atm)")
+    parser.add_option("", "--width", dest="width", type="int", default=80,
+                      help="Screen width the movie is centered for (default 80)")
+    parser.add_option("", "--height", dest="height", type="int", default=24,
+                      help="Screen height the movie is centered for (default 24)")
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error("Exactly one movie file is required.")
+    output = options.output or os.path.splitext(args[0])[0] + ".atm"
+    compile_movie(args[0], output, options.width, options.height)
+    print("Compiled {0} to {1}".format(args[0], output))
@@ -0,0 +1,169 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+  Hands connections accepted by inetd or xinetd over to a resident server process.
+
+  Instead of starting the whole player for every connection, inetd starts a stub,
+  which passes the connection's file descriptor over a Unix domain socket (SCM_RIGHTS)
+  to the server, which has the movie loaded already. This module is imported by the stub,
+  so it must not import anything heavier than the standard library's socket module.
+"""
+from __future__ import division, print_function
+
+import array
+import os
+import select
+import socket
+import stat
+import threading
+import time
+
+ACK = b"\x06"  # the server adopted the connection, the stub may exit
+# file descriptors are passed with sendmsg and recvmsg, which Py2 lacks
+HANDOFF_SUPPORTED = hasattr(socket.socket, "sendmsg")
+
+
+def listen(path, backlog=128):
+    """
+    Binds a Unix domain socket, which receives connections handed over by stubs.
+    A socket file left over from a previous run is replaced.
+
+    Args:
+        path (str): file path of the socket
+        backlog (int): size of the listen queue of the stubs
+
+    Returns:
+        socket.socket: the listening socket
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except OSError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(backlog)
+    return sock
+
+
+def send_socket(path, fd, timeout=5.0):
+    """
+    Hands a connection over to the server listening at path and waits, until it took it.
+
+    Args:
+        path (str): file path of the server's socket
+        fd (int): file descriptor of the connection
+
+    Returns:
+        bool: True, when the server adopted the connection
+    """
+    if not HANDOFF_SUPPORTED:
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendmsg([b"\x00"], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", [fd]))])
+        return sock.recv(1) == ACK
+    except (OSError, socket.error):
+        return False
+    finally:
+        sock.close()
+
+
+def receive_socket(conn):
+    """
+    Receives a connection handed over with send_socket().
+
+    Args:
+        conn (socket.socket): accepted connection of a stub
+
+    Returns:
+        socket.socket: the handed over connection, None when the stub didn't send one
+    """
+    size = array.array("i").itemsize
+    data, ancillary, _, _ = conn.recvmsg(1, socket.CMSG_SPACE(size))
+    for level, kind, payload in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS and len(payload) >= size:
+            fds = array.array("i")
+            fds.frombytes(payload[:len(payload) - len(payload) % size])
+            sock = socket.socket(fileno=fds[0])
+            for fd in fds[1:]:
+                os.close(fd)
+            return sock
+    return None
+
+
+class HandoffReceiver(object):
+    def __init__(self, sock, adopt):
+        """
+        Accepts connections handed over by stubs in a background thread.
+
+        Args:
+            sock (socket.socket): listening Unix domain socket, see listen()
+            adopt (callable): called with each handed over connection, must not block
+        """
+        self.sock = sock
+        self.adopt = adopt
+        self._stopped = False
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """
+        Stops accepting connections, e.g. when a restarted server process took over the socket.
+        """
+        self._stopped = True
+
+    def serve_forever(self):
+        while not self._stopped:
+            try:
+                # polls, so stop() takes effect while the socket is still open in the next server process
+                if not select.select([self.sock], [], [], 0.5)[0]:
+                    continue
+                conn = self.sock.accept()[0]
+            except (OSError, socket.error, ValueError):
+                if self.sock.fileno() < 0:
+                    return  # closed
+                time.sleep(0.1)  # e.g. out of file descriptors
+                continue
+            try:
+                if self._stopped:
+                    return  # without the ACK the stub plays the movie itself
+                conn.settimeout(5.0)
+                client = receive_socket(conn)
+                if client is not None:
+                    self.adopt(client)
+                    conn.sendall(ACK)
+            except (OSError, socket.error) as e:
+                print("Handoff failed: {0}".format(e))
+            finally:
+                conn.close()
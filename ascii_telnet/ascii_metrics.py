@@ -0,0 +1,216 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from __future__ import division, print_function
+
+import threading
+from bisect import bisect_left
+
+try:
+    # noinspection PyCompatibility
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:  # Py2
+    # noinspection PyCompatibility,PyUnresolvedReferences
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+_SECONDS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+# name, Prometheus name, type, help text, histogram buckets
+METRICS = (
+    ("connections_total", "ascii_telnet_connections_total", "counter", "Connections accepted.", None),
+    ("connections_active", "ascii_telnet_connections_active", "gauge", "Connections currently open.", None),
+    ("connections_rejected", "ascii_telnet_connections_rejected_total", "counter",
+     "Connections turned away with the busy screen, because of the connection limits.", None),
+    ("bytes_sent", "ascii_telnet_bytes_sent_total", "counter", "Bytes sent to clients.", None),
+    ("frames_sent", "ascii_telnet_frames_sent_total", "counter", "Frames sent to clients.", None),
+    ("compression_saved_bytes", "ascii_telnet_compression_saved_bytes_total", "counter",
+     "Bytes saved by MCCP2 compression.", None),
+    ("frames_dropped", "ascii_telnet_frames_dropped_total", "counter",
+     "Frames not sent, because the client couldn't keep up.", None),
+    ("clients_evicted", "ascii_telnet_clients_evicted_total", "counter",
+     "Clients disconnected, because they stalled for too long.", None),
+    ("frames_merged", "ascii_telnet_frames_merged_total", "counter",
+     "Frames left out, to lower the frame rate under load or on slow links.", None),
+    ("render_seconds", "ascii_telnet_frame_render_seconds", "histogram",
+     "Time to render a frame for a player.", _SECONDS),
+    ("write_seconds", "ascii_telnet_frame_write_seconds", "histogram",
+     "Time to hand a frame over to the connection.", _SECONDS),
+    ("lateness_seconds", "ascii_telnet_frame_lateness_seconds", "histogram",
+     "Time frames were shown after their deadline.", (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)),
+    ("rtt_seconds", "ascii_telnet_client_rtt_seconds", "histogram",
+     "Round trip times to the clients, including the frames queued ahead, measured with telnet timing marks.",
+     (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)),
+)
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        """
+        Thread safe histogram with fixed buckets, observing a value is a binary search and an increment.
+
+        Args:
+            buckets (tuple): sorted upper bounds of the buckets
+        """
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(buckets) + 1)  # the last bucket counts the values above all bounds
+        self._sum = 0.0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self, name):
+        """
+        Args:
+            name (str): name of the histogram
+
+        Returns:
+            dict: cumulative count per bucket, the sum and the count of the observed values
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        snapshot = {}
+        count = 0
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+            count += bucket_count
+            snapshot[_bucket(name, bound)] = count
+        snapshot[name + "_sum"] = total
+        snapshot[name + "_count"] = count
+        return snapshot
+
+
+def _bucket(name, bound):
+    return '{0}_bucket{{le="{1}"}}'.format(name, bound)
+
+
+class ServerStats(object):
+    def __init__(self):
+        """
+        Thread safe counters and histograms of the server, shared by all connections.
+        """
+        self._lock = threading.Lock()
+        self.connections_total = 0
+        self.connections_active = 0
+        self.connections_rejected = 0  # connections turned away, because of the connection limits
+        self.bytes_sent = 0
+        self.frames_sent = 0
+        self.compression_saved_bytes = 0
+        self.frames_dropped = 0  # frames not sent, because the client couldn't keep up
+        self.clients_evicted = 0  # clients disconnected, because they stalled for too long
+        self.frames_merged = 0  # frames left out, to lower the frame rate under load or on slow links
+        self._histograms = dict((name, Histogram(buckets)) for name, _, _, _, buckets in METRICS if buckets)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def observe(self, name, value):
+        """
+        Adds a value to a histogram, e.g. a duration in seconds.
+        """
+        self._histograms[name].observe(value)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: current value of every counter and histogram bucket
+        """
+        with self._lock:
+            snapshot = dict((name, value) for name, value in vars(self).items() if not name.startswith("_"))
+        for name, histogram in self._histograms.items():
+            snapshot.update(histogram.snapshot(name))
+        return snapshot
+
+
+server_stats = ServerStats()
+
+
+def exposition(snapshot):
+    """
+    Formats statistics in the Prometheus text format.
+
+    Args:
+        snapshot (dict): statistics, see ServerStats.snapshot()
+
+    Returns:
+        str: the metrics page
+    """
+    lines = []
+    for name, metric, metric_type, help_text, buckets in METRICS:
+        lines.append("# HELP {0} {1}".format(metric, help_text))
+        lines.append("# TYPE {0} {1}".format(metric, metric_type))
+        if buckets:
+            for bound in buckets + ("+Inf",):
+                lines.append('{0}_bucket{{le="{1}"}} {2}'.format(metric, bound,
+                                                                 snapshot.get(_bucket(name, bound), 0)))
+            lines.append("{0}_sum {1}".format(metric, snapshot.get(name + "_sum", 0)))
+            lines.append("{0}_count {1}".format(metric, snapshot.get(name + "_count", 0)))
+        else:
+            lines.append("{0} {1}".format(metric, snapshot.get(name, 0)))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = exposition(self.server.stats()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would flood the output
+
+
+class MetricsServer(HTTPServer):
+    def __init__(self, server_address, stats=None, sock=None):
+        """
+        HTTP server for Prometheus, which serves the metrics on /metrics from a background thread.
+
+        Args:
+            server_address (tuple): (interface, port) to listen on
+            stats (callable): returns the statistics to serve, the process' server_stats by default
+            sock (socket.socket): optional listening socket to use, e.g. inherited on a restart
+        """
+        HTTPServer.__init__(self, server_address, MetricsRequestHandler, sock is None)
+        if sock is not None:
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
+        self.stats = stats or server_stats.snapshot
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
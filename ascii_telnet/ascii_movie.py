@@ -27,8 +27,19 @@
 
 from __future__ import division, print_function
 
+import locale
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
 
 class Frame(object):
+    __slots__ = ("display_time", "data")
+
     def __init__(self, display_time=1):
         """
         One frame is typically 67 columns and 13 rows in effective size on screen.
@@ -42,6 +53,38 @@ class Frame(object):
         self.display_time = display_time
         self.data = []  # frame lines
 
+    def encode(self):
+        """
+        Returns:
+            bytes: the frame lines, each terminated by CR LF
+        """
+        return "".join(line + "\r\n" for line in self.data).encode()
+
+
+class PackedFrame(Frame):
+    __slots__ = ("_movie", "_index")
+
+    def __init__(self, movie, index, display_time):
+        """
+        A frame of a loaded movie. The lines are stored in the movie's text buffer,
+        they are sliced and padded only when the frame is rendered.
+
+        Args:
+            movie (Movie): the movie, which stores the lines
+            index (int): index of the frame within the movie
+            display_time (int): the frame cycles this specific frame should be displayed
+        """
+        self.display_time = display_time
+        self._movie = movie
+        self._index = index
+
+    @property
+    def data(self):
+        """
+        tuple: the frame lines, padded and centered on the movie's screen
+        """
+        return tuple(self._movie._pad_line(line) for line in self._movie._frame_text(self._index))
+
 
 class TimeBar(object):
     height = 1
@@ -113,6 +156,23 @@ class TimeBar(object):
                self._empty_timebar[marker_pos + len(self.right_decorator) + 1:]
 
 
+def _delay(line, filepath, line_num):
+    """
+    Returns:
+        int: the frame delay of a movie's delay line
+
+    Raises:
+        ValueError: if the line holds no valid delay, the message tells the file and line number
+    """
+    try:
+        delay = int(line.strip())
+    except ValueError:
+        delay = -1
+    if delay < 0:
+        raise ValueError("{0}:{1}: invalid frame delay {2!r}".format(filepath, line_num + 1, line.strip()))
+    return delay
+
+
 class Movie(object):
     def __init__(self, width=80, height=24):
         """
@@ -126,6 +186,13 @@ class Movie(object):
         """
         self.frames = []
         self._loaded = False
+        self._duration = None
+        self._frame_ends = None  # time index, see frame_ends()
+        # the lines of all frames, stripped and concatenated, the frames only hold their index
+        self._text = ""
+        self._line_offsets = array("L", [0])  # offset of each line in the text, plus the text's length
+        self._frame_starts = array("L")  # index of each frame's first line, plus the number of lines
+        self.load_time = 0.0  # seconds spent in load()
 
         self._frame_width = 67
         self._frame_height = 13
@@ -137,8 +204,19 @@ class Movie(object):
         self.screen_width = width
         self.screen_height = height
 
-        self.left_margin = (self.screen_width - self._frame_width) // 2
-        self.top_margin = (self.screen_height - self._frame_height - TimeBar.height) // 2
+        self.left_margin, self.top_margin = self.margins(width, height)
+
+    def margins(self, width, height):
+        """
+        Args:
+            width (int): screen width
+            height (int): screen height
+
+        Returns:
+            tuple: (left, top) margin, which center the frames on a screen of the given size
+        """
+        return (max((width - self._frame_width) // 2, 0),
+                max((height - self._frame_height - TimeBar.height) // 2, 1))
 
     def load(self, filepath):
         """
@@ -158,29 +236,427 @@ class Movie(object):
         if self._loaded:
             # we don't want to be loaded twice.
             return False
-        self.frames = []
-        current_frame = None
+        start = time.time()
         lines_per_frame = self._frame_height + TimeBar.height  # incl. meta data (time information)
+        chunks = []  # text of each frame, joined right away to keep fewer small strings alive while loading
+        lines = []
+        line_offsets = array("L", [0])
+        frame_starts = array("L")
+        display_times = []
+        offset = 0
 
         with open(filepath) as f:
             for line_num, line in enumerate(f):
-                time_metadata = None
-
                 if line_num % lines_per_frame == 0:
-                    time_metadata = int(line.strip())
-
-                if time_metadata is not None:
-                    current_frame = Frame(display_time=time_metadata)
-                    self.frames.append(current_frame)
+                    display_times.append(_delay(line, filepath, line_num))
+                    frame_starts.append(len(line_offsets) - 1)
+                    chunks.append("".join(lines))
+                    lines = []
                 else:
-                    # First strip every white character from the right
-                    # The amount of white space can be variable
+                    # the amount of white space on the right is variable, padding is added when rendering
                     line = line.rstrip()
-                    # Second fill line out with blanks so that any previous
-                    # characters are overwritten
-                    line = line.ljust(self._frame_width)
-                    # Third center the frame on the screen
-                    line = line.rjust(self.left_margin + self._frame_width)
-                    current_frame.data.append(line)
+                    lines.append(line)
+                    offset += len(line)
+                    line_offsets.append(offset)
+        chunks.append("".join(lines))
+        frame_starts.append(len(line_offsets) - 1)
+        self._text = "".join(chunks)
+        self._line_offsets = line_offsets
+        self._frame_starts = frame_starts
+        # the frames are immutable, so they can be shared safely between players
+        self.frames = tuple(PackedFrame(self, index, display_time) for index, display_time in enumerate(display_times))
+        self._duration = None
+        self._frame_ends = None
+        self.load_time = time.time() - start
         self._loaded = True
         return True
+
+    def close(self):
+        """
+        Releases the resources of the movie, e.g. open files, once it's dropped from the registry.
+        Players still holding the movie keep working.
+        """
+
+    def _frame_text(self, index):
+        """
+        Returns:
+            list: the stripped lines of the frame at the given index
+        """
+        text, line_offsets = self._text, self._line_offsets
+        return [text[line_offsets[line]:line_offsets[line + 1]]
+                for line in range(self._frame_starts[index], self._frame_starts[index + 1])]
+
+    def _pad_line(self, line):
+        # First strip every white character from the right
+        # The amount of white space can be variable
+        line = line.rstrip()
+        # Second fill line out with blanks so that any previous
+        # characters are overwritten
+        line = line.ljust(self._frame_width)
+        # Third center the frame on the screen
+        return line.rjust(self.left_margin + self._frame_width)
+
+    @property
+    def duration(self):
+        """
+        int: length of the movie in frame cycles (15 cycles per second)
+        """
+        if self._duration is None:
+            self._duration = sum(self.display_times())
+        return self._duration
+
+    def display_times(self):
+        """
+        Returns:
+            list: display time of every frame, in frame cycles
+        """
+        return [frame.display_time for frame in self.frames]
+
+    def frame_ends(self):
+        """
+        Time index of the movie, the prefix sums of the frames' display times.
+
+        Returns:
+            array: position of every frame's end, in frame cycles
+        """
+        if self._frame_ends is None:
+            frame_ends = array("L")
+            frame_pos = 0
+            for display_time in self.display_times():
+                frame_pos += display_time
+                frame_ends.append(frame_pos)
+            self._frame_ends = frame_ends
+        return self._frame_ends
+
+    def frame_at(self, frame_pos):
+        """
+        Looks up the frame, which is shown at the given position, with a binary search of the time index.
+
+        Args:
+            frame_pos (int): position in the movie, in frame cycles
+
+        Returns:
+            int: index of the frame, the last frame for positions after the movie's end
+        """
+        frame_ends = self.frame_ends()
+        return min(bisect_right(frame_ends, max(frame_pos, 0)), len(frame_ends) - 1)
+
+    def memory_usage(self):
+        """
+        Estimates the memory used by the frames of this movie.
+
+        Returns:
+            int: size in bytes of the frame objects, the text buffer and its offset tables
+        """
+        size = sys.getsizeof(self.frames) + sum(sys.getsizeof(frame) for frame in self.frames)
+        return size + sys.getsizeof(self._text) + sys.getsizeof(self._line_offsets) + sys.getsizeof(self._frame_starts)
+
+
+class StreamingMovie(Movie):
+    def __init__(self, width=80, height=24, window=None):
+        """
+        A movie, which frames are parsed on demand while playing.
+        Loading only scans the delay lines, so playback starts right away.
+
+        Args:
+            width (int): Movie screen width.
+            height (int): Movie screen height
+            window (int): Number of parsed frames to keep in memory, all when None
+        """
+        Movie.__init__(self, width, height)
+        self.window = window
+        self._filepath = None
+        self._file = None
+        self._offsets = None  # file offset of each frame, plus the end of file
+        self._encoding = locale.getpreferredencoding(False)
+        self._parsed = OrderedDict()  # frame index -> Frame, least recently used first
+        self._file_lock = threading.Lock()
+
+    def load(self, filepath):
+        """
+        Scans the ASCII movie file for the frames' delays and positions, without parsing the frames.
+
+        Args:
+            filepath (str): Path to Ascii Movie Data
+        """
+        if self._loaded:
+            return False
+        start = time.time()
+        lines_per_frame = self._frame_height + TimeBar.height
+        self._offsets = array("L")
+        display_times = array("L")
+        offset = 0
+        self._filepath = filepath
+        self._file = open(filepath, "rb")
+        try:
+            for line_num, line in enumerate(self._file):
+                if line_num % lines_per_frame == 0:
+                    self._offsets.append(offset)
+                    display_times.append(_delay(line.decode(self._encoding, "replace"), filepath, line_num))
+                offset += len(line)
+        except ValueError:
+            self._file.close()
+            self._file = None
+            raise
+        self._offsets.append(offset)
+        self._display_times = display_times
+        self.frames = StreamingFrames(self)
+        self._duration = sum(display_times)
+        self.load_time = time.time() - start
+        self._loaded = True
+        return True
+
+    def display_times(self):
+        return self._display_times
+
+    def close(self):
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def frame(self, index):
+        """
+        Returns:
+            Frame: the frame at the given index, parsed when it's not in memory
+        """
+        with self._file_lock:
+            frame = self._parsed.get(index)
+            if frame is not None:
+                if self.window is not None:
+                    # mark as recently used
+                    self._parsed[index] = self._parsed.pop(index)
+                return frame
+            if self._file is None:
+                # closed, players still holding the movie open the file for each frame
+                with open(self._filepath, "rb") as f:
+                    data = self._read(f, index)
+            else:
+                data = self._read(self._file, index)
+            # split like Movie.load, only at line breaks, not at the other separators of splitlines()
+            lines = data.split(u"\n")
+            if lines[-1] == u"":
+                lines.pop()
+            frame = Frame(display_time=self._display_times[index])
+            frame.data = tuple(self._pad_line(line) for line in lines[1:])
+            self._parsed[index] = frame
+            if self.window is not None and len(self._parsed) > self.window:
+                self._parsed.popitem(last=False)
+            return frame
+
+    def _read(self, f, index):
+        f.seek(self._offsets[index])
+        return f.read(self._offsets[index + 1] - self._offsets[index]).decode(self._encoding)
+
+    def memory_usage(self):
+        """
+        Estimates the memory used by the index and the frames parsed so far.
+        """
+        with self._file_lock:
+            frames = list(self._parsed.values())
+        size = sys.getsizeof(self._offsets) + sys.getsizeof(self._display_times)
+        for frame in frames:
+            size += sys.getsizeof(frame) + sys.getsizeof(frame.data)
+            for line in frame.data:
+                size += sys.getsizeof(line)
+        return size
+
+
+class StreamingFrames(object):
+    def __init__(self, movie):
+        """
+        Read-only sequence of the frames of a streaming movie.
+        """
+        self._movie = movie
+
+    def __len__(self):
+        return len(self._movie._display_times)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("frame index out of range")
+        return self._movie.frame(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._movie.frame(index)
+
+
+class MovieRegistry(object):
+    def __init__(self, streaming=False, window=None, max_bytes=None, shared=False):
+        """
+        Process wide, read-only store of loaded movies.
+        Each movie file is parsed only once per screen size, all players share the same frames.
+        The least recently used movies are dropped, when all movies take more than max_bytes.
+        Files changed on disk are reloaded in the background, players keep the version they started with.
+
+        Args:
+            streaming (bool): Parse text movies on demand while playing, see StreamingMovie
+            window (int): Number of parsed frames a streaming movie keeps in memory, all when None
+            max_bytes (int): Memory limit for the loaded movies, unlimited when None
+            shared (bool): Share text movies with other processes on the host, see ascii_compiled.load_shared
+        """
+        self.streaming = streaming
+        self.window = window
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._movies = OrderedDict()  # (path, width, height) -> (movie, version, size), least recently used first
+        self._reloading = set()  # keys of the movies, which are reloaded right now
+        self._loading = {}  # key -> Event, set once the movie, which is loaded right now, is available
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def get(self, filepath, width=80, height=24):
+        """
+        Returns the loaded movie for the given file, loading it on first access.
+        When the file changed since, it's reloaded in the background and the current version is returned.
+
+        Args:
+            filepath (str): Path to Ascii Movie Data
+            width (int): Movie screen width.
+            height (int): Movie screen height
+
+        Returns:
+            Movie: a loaded movie, which must not be modified by the caller
+        """
+        key = (os.path.abspath(filepath), width, height)
+        version = self._version(filepath)
+        while True:
+            with self._lock:
+                entry = self._movies.pop(key, None)
+                if entry is not None:
+                    if entry[1] != version and version is not None and key not in self._reloading:
+                        self._reloading.add(key)
+                        thread = threading.Thread(target=self._reload, args=(key, filepath, version))
+                        thread.daemon = True
+                        thread.start()
+                    self._movies[key] = entry
+                    dropped = self._evict()
+                    break
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # another thread loads the movie right now, it's taken from the registry once loaded
+            loading.wait()
+        if entry is None:
+            # loading takes a while for large movies, the other movies are available meanwhile
+            try:
+                movie = load_movie(filepath, width, height, self.streaming, self.window, self.shared)
+                entry = (movie, version, movie.memory_usage())
+            finally:
+                with self._lock:
+                    if entry is not None:
+                        self._movies[key] = entry
+                    del self._loading[key]
+                    dropped = self._evict()
+                loading.set()
+        self._notify(dropped)
+        return entry[0]
+
+    def _reload(self, key, filepath, version):
+        try:
+            movie = load_movie(filepath, key[1], key[2], self.streaming, self.window, self.shared)
+        except (IOError, OSError, ValueError) as e:
+            movie = None
+            print("Reloading {0} failed: {1}".format(filepath, e))
+        dropped = []
+        with self._lock:
+            self._reloading.discard(key)
+            entry = self._movies.get(key)
+            if entry is not None:
+                if movie is None:
+                    # keep the current version, until the file changes again
+                    self._movies[key] = (entry[0], version, entry[2])
+                else:
+                    self._movies[key] = (movie, version, movie.memory_usage())
+                    dropped.append(entry[0])
+                    dropped.extend(self._evict())
+        self._notify(dropped)
+
+    @staticmethod
+    def _version(filepath):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def _evict(self):
+        """
+        Returns:
+            list: the dropped movies
+        """
+        dropped = []
+        if self.max_bytes is None:
+            return dropped
+        size = self.memory_usage()
+        while size > self.max_bytes and len(self._movies) > 1:
+            movie, _, movie_size = self._movies.popitem(last=False)[1]
+            size -= movie_size
+            dropped.append(movie)
+        return dropped
+
+    def memory_usage(self):
+        """
+        Returns:
+            int: size in bytes of the loaded movies, as estimated when they were loaded
+        """
+        return sum(entry[2] for entry in list(self._movies.values()))
+
+    def add_listener(self, listener):
+        """
+        Registers a callable, which gets every movie dropped from the registry, because it was
+        reloaded or evicted. E.g. to drop its render caches.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, dropped):
+        for movie in dropped:
+            movie.close()
+            for listener in self._listeners:
+                listener(movie)
+
+    def clear(self):
+        """
+        Forget all loaded movies. Players still holding a movie keep using it.
+        """
+        with self._lock:
+            dropped = [entry[0] for entry in self._movies.values()]
+            self._movies.clear()
+        for movie in dropped:
+            movie.close()
+
+
+def load_movie(filepath, width=80, height=24, streaming=False, window=None, shared=False):
+    """
+    Loads a movie, either from the text format or from the compiled format (*.atm).
+
+    Args:
+        filepath (str): Path to Ascii Movie Data
+        width (int): Movie screen width.
+        height (int): Movie screen height
+        streaming (bool): Parse a text movie on demand while playing, see StreamingMovie
+        window (int): Number of parsed frames a streaming movie keeps in memory, all when None
+        shared (bool): Share a text movie with other processes through a compiled copy in shared memory
+
+    Returns:
+        Movie: the loaded movie
+    """
+    if shared and not filepath.endswith(".atm"):
+        from ascii_telnet.ascii_compiled import load_shared
+        return load_shared(filepath, width, height)
+    if filepath.endswith(".atm"):
+        from ascii_telnet.ascii_compiled import CompiledMovie
+        movie = CompiledMovie(width, height)
+    elif streaming:
+        movie = StreamingMovie(width, height, window)
+    else:
+        movie = Movie(width, height)
+    movie.load(filepath)
+    return movie
+
+
+movie_registry = MovieRegistry()
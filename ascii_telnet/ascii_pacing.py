@@ -0,0 +1,187 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+  Adapts the playback to each client's link.
+
+  The server measures the round trip time to the client with telnet timing marks (RFC 860):
+  the client answers DO TIMING-MARK only after it processed everything sent before, so the
+  round trip includes the frames queued ahead in the send buffers. When it grows above the
+  link's base round trip time, or the socket's send queue fills up, the link doesn't keep up
+  with the movie and the player lowers the frame rate, before the client falls further behind.
+"""
+from __future__ import division, print_function
+
+import struct
+
+from ascii_telnet.ascii_metrics import server_stats
+from ascii_telnet.ascii_protocol import DO_TIMING_MARK
+from ascii_telnet.ascii_scheduler import monotonic
+
+SIOCOUTQNSD = 0x894B  # Linux ioctl: bytes in a socket's send queue, which weren't sent yet
+# send buffer (SO_SNDBUF) of the client sockets, kept small, so the frames a slow client can't take are
+# dropped by the servers, instead of piling up in the kernel, which lets the buffer grow to megabytes
+SEND_BUFFER_BYTES = 16384
+
+
+def unsent_bytes(sock):
+    """
+    Args:
+        sock (socket.socket): a connected TCP socket
+
+    Returns:
+        int: bytes waiting in the kernel's send queue, None when the platform can't tell
+    """
+    try:
+        import fcntl
+        return struct.unpack("i", fcntl.ioctl(sock.fileno(), SIOCOUTQNSD, b"\0\0\0\0"))[0]
+    except (ImportError, IOError, OSError, ValueError):
+        return None
+
+
+class RoundTripTimer(object):
+    probe_interval = 1.0  # seconds between two timing marks
+
+    def __init__(self, clock=monotonic):
+        """
+        Estimates the round trip time of a connection from the answers to timing marks,
+        smoothed like TCP's retransmission timer (RFC 6298). One timing mark is outstanding at most,
+        clients, which never answer, get a single one.
+
+        Args:
+            clock (callable): returns the current time in seconds
+        """
+        self.clock = clock
+        self.srtt = None  # smoothed round trip time in seconds
+        self.rttvar = None  # variation of the round trip time
+        self.min_rtt = None  # lowest round trip time, the link's latency without queued data
+        self.latest = None  # the last measured round trip time
+        self.samples = 0
+        self._sent_at = None  # time the outstanding timing mark was sent
+        self._next_probe = clock()
+
+    def probe(self):
+        """
+        Returns:
+            bytes: a timing mark to send after the data sent so far, when one is due, otherwise empty
+        """
+        now = self.clock()
+        if self._sent_at is not None or now < self._next_probe:
+            return b""
+        self._sent_at = now
+        return DO_TIMING_MARK
+
+    def on_answer(self):
+        """
+        The client answered a timing mark.
+        """
+        if self._sent_at is None:
+            return  # unasked
+        now = self.clock()
+        rtt = now - self._sent_at
+        self._sent_at = None
+        self._next_probe = now + self.probe_interval
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        self.latest = rtt
+        self.samples += 1
+        server_stats.observe("rtt_seconds", rtt)
+
+    @property
+    def current(self):
+        """
+        float: the latest round trip time, or the time the outstanding timing mark takes already,
+               if that is longer, None before the client answered the first one
+        """
+        if self.latest is None:
+            return None
+        if self._sent_at is not None:
+            return max(self.latest, self.clock() - self._sent_at)
+        return self.latest
+
+
+class LinkPacer(object):
+    target_delay = 0.2  # seconds of queued frames ahead of the client, which are tolerated
+    max_unsent_bytes = 8192  # bytes in the send queues, which are tolerated
+    slow_rtt = 0.2  # links with round trip times above this get only the changed parts of the screen
+    max_frame_cycles = 8  # lowest frame rate: each shown frame lasts this many frame cycles, i.e. 2 fps
+    recover_interval = 2.0  # seconds between two steps back to a higher frame rate
+
+    def __init__(self, clock=monotonic):
+        """
+        Chooses the frame rate and encoding for one connection. The frame rate is halved, when
+        the link falls behind, and raised step by step again, once it caught up.
+
+        Args:
+            clock (callable): returns the current time in seconds
+        """
+        self.clock = clock
+        self.rtt = RoundTripTimer(clock)
+        self.frame_cycles = 1  # each shown frame lasts at least this many frame cycles
+        self.delta = False  # send only the changed parts of the screen
+        self.slowdowns = 0  # times the frame rate was lowered
+        self._next_change = clock()
+
+    def update(self, unsent=None):
+        """
+        Adapts frame rate and encoding to the link, called before each frame.
+
+        Args:
+            unsent (int): bytes waiting in the send queues, None when unknown
+
+        Returns:
+            tuple: (frame_cycles, delta), see ascii_player.VT100Player.adapt()
+        """
+        now = self.clock()
+        rtt = self.rtt.current
+        queued = 0.0 if rtt is None else rtt - self.rtt.min_rtt  # time the frames queued ahead take
+        behind = queued > self.target_delay or (unsent is not None and unsent > self.max_unsent_bytes)
+        if behind and now >= self._next_change and self.frame_cycles < self.max_frame_cycles:
+            self.frame_cycles = min(self.frame_cycles * 2, self.max_frame_cycles)
+            self.slowdowns += 1
+            # the queued frames have to go out first, before the lower frame rate shows
+            self._next_change = now + max(rtt or 0.0, self.recover_interval / 4)
+        elif not behind and queued < self.target_delay / 2 and now >= self._next_change and self.frame_cycles > 1:
+            self.frame_cycles -= 1
+            self._next_change = now + self.recover_interval
+        self.delta = self.frame_cycles > 1 or (self.rtt.srtt is not None and self.rtt.srtt > self.slow_rtt)
+        return self.frame_cycles, self.delta
+
+    def summary(self):
+        """
+        Returns:
+            str: the connection's round trip times and adaptations, for the log
+        """
+        if self.rtt.samples == 0:
+            return "Round trip time unknown, the client didn't answer timing marks."
+        return "Round trip time {0:.0f} ms (min {1:.0f} ms), frame rate lowered {2} times.".format(
+            self.rtt.srtt * 1000, self.rtt.min_rtt * 1000, self.slowdowns)
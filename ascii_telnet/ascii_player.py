@@ -27,10 +27,15 @@
 from __future__ import division, print_function
 
 import sys
-import time
+import threading
+from collections import OrderedDict
 from io import BytesIO
 
 from ascii_telnet.ascii_movie import TimeBar
+from ascii_telnet.ascii_metrics import server_stats
+from ascii_telnet.ascii_scheduler import FrameScheduler, monotonic, real_clock
+
+RENDER_CACHE_BYTES = 64 * 1024 * 1024  # default memory limit for the render caches of all screen sizes
 
 
 class VT100Player(object):
@@ -43,7 +48,10 @@ class VT100Player(object):
     CLEARSCRN = ESC + "[2J"  # Clear entire screen
     CLEARDOWN = ESC + "[J"  # Clear screen from cursor down
 
-    def __init__(self, movie):
+    pause_interval = 0.1  # seconds in between two steps, while paused
+    degraded_frame_cycles = 3  # frame cycles each shown frame lasts at least while degraded, i.e. 5 fps at most
+
+    def __init__(self, movie, render_cache=None, delta=False, screen_size=None, clock=None):
         """
         Player class plays a movie.
         It also stores the current position.
@@ -51,32 +59,166 @@ class VT100Player(object):
 
         Args:
             movie (ascii_movie.Movie): Movie Object that the player will play.
+            render_cache (FrameRenderCache): Optional cache of pre-rendered frames for this movie and screen size.
+            delta (bool): Only send the changed parts of the screen, instead of full frames.
+            screen_size (tuple): (width, height) of the client's screen, the movie's screen size by default.
+            clock (ascii_scheduler.RealClock): Clock for the pacing of play(), e.g. a VirtualClock
+                                               to render faster than real time. The real time by default.
 
         """
         self._movie = movie
+        self.delta = DeltaEncoder() if delta else None
+        self._current = None  # (frame, frame_pos, frame_index) of the last loaded frame
+        self.frame_shared = False  # the last loaded frame's bytes are shared with other players
+        self.clock = clock or real_clock
+        self.scheduler = FrameScheduler(clock=self.clock.now)
         self._cursor = 0  # virtual cursor pointing to the current frame
-        self._frame_count = 0
+        self._frame_count = self._movie.duration
 
         self._stopped = False
+        self.paused = False
+        self.interrupted = False  # playback controls were used, a caller waiting for the next frame may stop waiting
+        self._paused_pos = None  # frame position, where the playback was paused
+        self._seek_to = None  # frame position to jump to with the next step
+        self.degraded = False  # the server is under load, see degrade()
+        self.min_frame_cycles = 1  # frames following within this many cycles of a shown frame are left out
+        self._link = (1, False)  # frame cycles and delta encoding for the client's link, see adapt()
+        self._throttled_delta = False  # delta encoding was switched on by degrade() or adapt()
 
         self._clear_screen_setup_done = False
 
-        for f in self._movie.frames:
-            self._frame_count += f.display_time
+        self.resize(*(screen_size or (movie.screen_width, movie.screen_height)), render_cache=render_cache)
+
+    def resize(self, width, height, render_cache=None):
+        """
+        Centers the frames on a screen of the given size. The next frame clears and redraws the whole screen.
 
-        self.timebar = TimeBar(self._frame_count, self._movie.screen_width)
+        Args:
+            width (int): screen width
+            height (int): screen height
+            render_cache (FrameRenderCache): Optional cache of pre-rendered frames for this screen size.
+        """
+        self.screen_width = width
+        self.screen_height = height
+        self.left_margin, self.top_margin = self._movie.margins(width, height)
+        self._render_cache = render_cache
+        self.timebar = TimeBar(self._frame_count, width)
+        if self._current is not None:
+            self._clear_screen_setup_done = False
+            self.invalidate()
 
-    def play(self):
+    def play(self, repeat=False):
         """
         Plays the movie
+
+        Args:
+            repeat (bool): start over from the beginning, when the movie ended
+        """
+        for delay in self.steps(repeat):
+            self.clock.sleep(delay)
+
+    def steps(self, repeat=False):
+        """
+        Plays the movie frame by frame, without waiting in between.
+        This allows the caller to do the pacing, e.g. with timers of an event loop.
+        Frames are due at absolute deadlines, when the caller falls behind,
+        frames are skipped to catch up with the movie's timeline.
+        While paused, the delay is the polling interval for the playback controls.
+
+        Args:
+            repeat (bool): start over from the beginning, when the movie ended
+
+        Yields:
+            float: seconds to wait, before the next frame is due
         """
         self._stopped = False
-        for frame in self._movie.frames:
-            if self._stopped:
+        frames = self._movie.frames
+        frame_ends = self._movie.frame_ends()
+        self.scheduler.start(self._cursor)
+        index = self._movie.frame_at(self._cursor)
+        while True:
+            while index < len(frames):
+                if self._stopped:
+                    return
+                self.interrupted = False
+                if self._seek_to is not None:
+                    # jump straight to the frame, the frames in between aren't rendered at all
+                    index = self._movie.frame_at(self._seek_to)
+                    self._seek_to = None
+                    self._cursor = frame_ends[index] - frames[index].display_time
+                    self.scheduler.start(self._cursor)
+                    self.invalidate()
+                    if self.paused:
+                        self._paused_pos = self._cursor
+                        self._load_frame(frames[index], frame_ends[index], index)
+                if self.paused:
+                    yield self.pause_interval
+                    continue
+                if self._paused_pos is not None:
+                    # resumed, the timeline continues where it was paused
+                    self.scheduler.start(self._paused_pos)
+                    self._paused_pos = None
+                frame = frames[index]
+                # catch up, when behind schedule: skip frames, which should have ended already
+                while index + 1 < len(frames) and self.scheduler.is_due(self._cursor + frame.display_time):
+                    self.scheduler.frames_skipped += 1
+                    self._cursor += frame.display_time
+                    index += 1
+                    frame = frames[index]
+                server_stats.observe("lateness_seconds", self.scheduler.record(self._cursor))
+                shown_at = self._cursor
+                self._cursor += frame.display_time
+                self._load_frame(frame, self._cursor, index)
+                index += 1
+                # lower frame rate: the frame stays on screen instead of the following ones, they're merged into it
+                while (self.min_frame_cycles > 1 and index + 1 < len(frames) and
+                       self._cursor - shown_at < self.min_frame_cycles):
+                    server_stats.increment("frames_merged")
+                    self._cursor += frames[index].display_time
+                    index += 1
+                yield self.scheduler.delay(self._cursor)
+            if not repeat:
                 return
-            self._cursor += frame.display_time
-            self._load_frame(frame, self._cursor)
-            time.sleep(frame.display_time / 15)
+            self.scheduler.shift(self._cursor)
+            self._cursor = 0
+            index = 0
+
+    def degrade(self, degraded):
+        """
+        Under load, the player lowers the frame rate by merging frames and sends only the
+        changed parts of the screen. Both are restored, when the load is gone.
+
+        Args:
+            degraded (bool): the server is under load
+        """
+        if degraded == self.degraded:
+            return
+        self.degraded = degraded
+        self._throttle()
+
+    def adapt(self, frame_cycles, delta):
+        """
+        Adapts the playback to a slow link of the client, see ascii_pacing.LinkPacer.
+        The stronger limit of this and degrade() applies.
+
+        Args:
+            frame_cycles (int): frame cycles each shown frame lasts at least, 1 for the full frame rate
+            delta (bool): send only the changed parts of the screen, even if the player sends full frames
+        """
+        if (frame_cycles, delta) == self._link:
+            return
+        self._link = (frame_cycles, delta)
+        self._throttle()
+
+    def _throttle(self):
+        frame_cycles, delta = self._link
+        self.min_frame_cycles = max(self.degraded_frame_cycles if self.degraded else 1, frame_cycles)
+        if (self.degraded or delta) and self.delta is None:
+            self.delta = DeltaEncoder()
+            self._throttled_delta = True
+        elif not (self.degraded or delta) and self._throttled_delta:
+            self.delta = None
+            self._throttled_delta = False
 
     def stop(self):
         """
@@ -84,30 +226,147 @@ class VT100Player(object):
         """
         self._stopped = True
 
-    def _load_frame(self, frame, frame_pos):
+    @property
+    def position(self):
+        """
+        int: the frame position, which is shown right now
+        """
+        if self._paused_pos is not None:
+            return self._paused_pos
+        return min(int(self.scheduler.position()), self._cursor)
+
+    def pause(self):
+        if not self.paused:
+            self._paused_pos = self.position
+            self.paused = True
+            self.interrupted = True
+
+    def resume(self):
+        if self.paused:
+            self.paused = False
+            self.interrupted = True
+
+    def toggle_pause(self):
+        if self.paused:
+            self.resume()
+        else:
+            self.pause()
+
+    def seek(self, frame_pos):
+        """
+        Jumps to the given position with the next step. The client gets one full repaint.
+
+        Args:
+            frame_pos (int): position in the movie, in frame cycles
+        """
+        self._seek_to = max(0, min(int(frame_pos), self._frame_count - 1))
+        self.interrupted = True
+
+    def seek_by(self, seconds):
+        """
+        Jumps forward or, with negative seconds, backward.
+        """
+        position = self.position if self._seek_to is None else self._seek_to
+        self.seek(position + seconds * self.scheduler.fps)
+
+    def seek_percent(self, percent):
+        """
+        Jumps to the given percentage of the movie's length.
+        """
+        self.seek(self._frame_count * percent // 100)
+
+    def _load_frame(self, frame, frame_pos, frame_index=None):
         """
         Buffer the the frame and then call draw_frame to display it
 
         Args:
             frame (ascii_movie.Frame): Frame data to display
             frame_pos (int):  Where the frame falls in the movie
+            frame_index (int): Index of the frame within the movie, used to look up the render cache
 
         """
-        screenbuf = BytesIO()
+        self._current = (frame, frame_pos, frame_index)
+        start = monotonic()
+        data = full_data = self.current_frame_data()
+        if self.delta is not None:
+            data = self.delta.encode(self._screen_lines(frame, frame_pos), full_data)
+        server_stats.observe("render_seconds", monotonic() - start)
+        # all players get the very same bytes from the render cache, e.g. their compression can be shared
+        self.frame_shared = self._render_cache is not None and data is full_data
+
         if not self._clear_screen_setup_done:
-            screenbuf.write(self.CLEARSCRN.encode())
+            data = self.CLEARSCRN.encode() + data
             self._clear_screen_setup_done = True
+            self.frame_shared = False
+
+        # BytesIO shares the immutable bytes, so no copy is made for cached frames
+        self.draw_frame(BytesIO(data))
+
+    def current_frame_data(self, current=None):
+        """
+        Args:
+            current (tuple): (frame, frame_pos, frame_index) to render instead of the last loaded frame
+
+        Returns:
+            bytes: the full VT100 stream of the last loaded frame
+        """
+        frame, frame_pos, frame_index = current or self._current
+        if self._render_cache is not None and frame_index is not None:
+            return self._render_cache.get(frame_index)
+        return self.render_frame(frame, frame_pos)
+
+    def invalidate(self):
+        """
+        Forget what is on the client's screen, so that the next frame is drawn completely.
+        """
+        if self.delta is not None:
+            self.delta.reset()
+
+    def _screen_lines(self, frame, frame_pos):
+        """
+        Returns:
+            list: (row, line) tuples of what render_frame() draws on screen
+        """
+        lines = [(self.top_margin + row, line) for row, line in enumerate(self._frame_lines(frame))]
+        lines.append((self.screen_height, self.timebar.get_timebar(frame_pos)))
+        return lines
+
+    def _frame_lines(self, frame):
+        """
+        Returns:
+            list: the frame's lines, moved and clipped from the movie's screen to the client's screen
+        """
+        # the movie's lines are centered on the movie's screen, the margins only differ in size
+        shift = self.left_margin - self._movie.left_margin
+        lines = frame.data[:self.screen_height - self.top_margin]
+        if shift > 0:
+            lines = [" " * shift + line for line in lines]
+        elif shift < 0:
+            lines = [line[-shift:] for line in lines]
+        return [line[:self.screen_width] for line in lines]
+
+    def render_frame(self, frame, frame_pos):
+        """
+        Renders the VT100 screen for one frame, including the time bar.
+
+        Args:
+            frame (ascii_movie.Frame): Frame data to display
+            frame_pos (int):  Where the frame falls in the movie
+
+        Returns:
+            bytes: the VT100 stream for this frame
+        """
+        screenbuf = BytesIO()
 
         # center vertical, with respect to the time bar (like letter boxing)
-        screenbuf.write(self._move_cursor(1, self._movie.top_margin))
-        for line in frame.data:
-            screenbuf.write((line + "\r\n").encode())
+        screenbuf.write(self._move_cursor(1, self.top_margin))
+        if (self.screen_width, self.screen_height) == (self._movie.screen_width, self._movie.screen_height):
+            screenbuf.write(frame.encode())
+        else:
+            screenbuf.write("".join(line + "\r\n" for line in self._frame_lines(frame)).encode())
 
         self._update_timebar(screenbuf, frame_pos)
-
-        # now rewind the internal buffer and fire the public event
-        screenbuf.seek(0)
-        self.draw_frame(screenbuf)
+        return screenbuf.getvalue()
 
     def draw_frame(self, screen_buffer):
         """
@@ -132,7 +391,7 @@ class VT100Player(object):
 
         """
         # Move cursor to the bottom of the screen
-        screen_buffer.write(self._move_cursor(1, self._movie.screen_height))
+        screen_buffer.write(self._move_cursor(1, self.screen_height))
 
         screen_buffer.write(self.timebar.get_timebar(frame_pos).encode())
 
@@ -148,8 +407,286 @@ class VT100Player(object):
             str: the VT100 code as a string
 
         """
-        if 0 >= x > self._movie.screen_width or 0 >= y > self._movie.screen_height:
+        if 0 >= x > self.screen_width or 0 >= y > self.screen_height:
             sys.stderr.write("Warning, coordinates out of range. ({0}, {1})\n".format(x, y))
             return "".encode()
         else:
             return (self.ESC + "[{0};{1}H".format(y, x)).encode()
+
+
+class PlaybackControls(object):
+    seek_seconds = 10
+
+    def __init__(self, player):
+        """
+        Controls a player with keystrokes:
+            space or p          pause and resume
+            left arrow or ,     rewind 10 seconds
+            right arrow or .    forward 10 seconds
+            0 to 9              jump to 0% to 90% of the movie
+
+        Args:
+            player (VT100Player): the player to control
+        """
+        self.player = player
+        self._escape = b""  # incomplete escape sequence of the last input
+
+    def feed(self, data):
+        """
+        Args:
+            data (bytes): keystrokes of the client, without telnet commands
+        """
+        data = self._escape + data
+        self._escape = b""
+        index = 0
+        while index < len(data):
+            key = data[index:index + 1]
+            if key == b"\x1b" and (index + 1 == len(data) or data[index + 1:index + 2] in (b"[", b"O")):
+                if index + 3 > len(data):
+                    self._escape = data[index:]  # the rest of the escape sequence follows with the next input
+                    return
+                key = data[index:index + 3]
+            index += len(key)
+            self._on_key(key)
+
+    def _on_key(self, key):
+        if key in (b" ", b"p", b"P"):
+            self.player.toggle_pause()
+        elif key in (b"\x1b[D", b"\x1bOD", b","):
+            self.player.seek_by(-self.seek_seconds)
+        elif key in (b"\x1b[C", b"\x1bOC", b"."):
+            self.player.seek_by(self.seek_seconds)
+        elif key.isdigit():
+            self.player.seek_percent(int(key) * 10)
+
+
+class WindowResizes(object):
+    min_interval = 1.0  # seconds in between two resizes of a player
+
+    def __init__(self, player, render_cache, clock=monotonic):
+        """
+        Applies the window sizes a client reports to its player, at most once per min_interval.
+        Each size gets its own render cache, so a client cycling through window sizes would
+        keep creating caches. Sizes reported in between are held back and only the latest one
+        is applied, once the interval passed.
+
+        Args:
+            player (VT100Player): the player to resize
+            render_cache (callable): returns the render cache for a width and height, or None
+            clock (callable): returns the current time in seconds
+        """
+        self.player = player
+        self.render_cache = render_cache
+        self.clock = clock
+        self.pending = None  # (width, height) held back
+        self._last_resize = None
+
+    def request(self, width, height):
+        """
+        The client's window changed its size, it's applied right away or held back.
+        """
+        self.pending = (width, height)
+        self.apply()
+
+    def apply(self):
+        """
+        Applies the size held back, when the interval passed. Called on every playback step.
+        """
+        if self.pending is None:
+            return
+        now = self.clock()
+        if self._last_resize is not None and now - self._last_resize < self.min_interval:
+            return
+        width, height = self.pending
+        self.pending = None
+        self._last_resize = now
+        self.player.resize(width, height, self.render_cache(width, height))
+
+
+class DeltaEncoder(object):
+    def __init__(self, max_gap=8):
+        """
+        Encodes frames as the difference to the previous frame on the client's screen.
+        Only the changed spans of each line are sent, using VT100 cursor positioning.
+        The full frame is sent on first draw, after reset() and when the delta isn't smaller.
+
+        Args:
+            max_gap (int): unchanged characters in between two changes, which are sent nevertheless,
+                           because they are cheaper than another cursor movement
+        """
+        self.max_gap = max_gap
+        self._screen = {}  # row -> line, what the client's screen shows
+        self.bytes_full = 0  # bytes, which full frames would have cost
+        self.bytes_sent = 0
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_full - self.bytes_sent
+
+    def reset(self):
+        """
+        Forget the client's screen, so the next frame is sent in full.
+        """
+        self._screen = {}
+
+    def encode(self, lines, full_data):
+        """
+        Args:
+            lines (list): (row, line) tuples of the new screen content
+            full_data (bytes): the VT100 stream, which draws the full frame
+
+        Returns:
+            bytes: the VT100 stream to send
+        """
+        data = full_data
+        if self._screen:
+            delta = self._encode_delta(lines)
+            if len(delta) < len(full_data):
+                data = delta
+        for row, line in lines:
+            self._screen[row] = line
+        self.bytes_full += len(full_data)
+        self.bytes_sent += len(data)
+        return data
+
+    def _encode_delta(self, lines):
+        spans = []
+        for row, line in lines:
+            old = self._screen.get(row)
+            if old == line:
+                continue
+            if old is None:
+                spans.append((row, 0, line))
+                continue
+            start = None
+            end = 0
+            for col in range(len(line)):
+                if col < len(old) and old[col] == line[col]:
+                    continue
+                if start is not None and col - end > self.max_gap:
+                    spans.append((row, start, line[start:end]))
+                    start = None
+                if start is None:
+                    start = col
+                end = col + 1
+            if start is not None:
+                spans.append((row, start, line[start:end]))
+        return "".join("{0}[{1};{2}H{3}".format(VT100Player.ESC, row, col + 1, text)
+                       for row, col, text in spans).encode()
+
+
+class FrameRenderCache(object):
+    renderer_bytes = 1024  # estimated size of the renderer, the time bar included
+
+    def __init__(self, movie, screen_size=None):
+        """
+        Shared cache of rendered VT100 frames for one movie and screen size.
+        Every frame (time bar included) is rendered only once, either lazily on first access
+        or ahead of time with prerender(). The rendered frames are immutable bytes and
+        can be handed to any number of players at the same time.
+
+        Args:
+            movie (ascii_movie.Movie): Movie Object, which frames will be rendered.
+            screen_size (tuple): (width, height) of the screen, the movie's screen size by default.
+        """
+        self._movie = movie
+        self._renderer = VT100Player(movie, screen_size=screen_size)
+        self._frames = [None] * len(movie.frames)
+        # bytes of the rendered frames so far, plus the frame list and the renderer, which empty caches take as well
+        self.size = sys.getsizeof(self._frames) + self.renderer_bytes
+        self._positions = movie.frame_ends()
+
+    def get(self, frame_index):
+        """
+        Args:
+            frame_index (int): Index of the frame within the movie
+
+        Returns:
+            bytes: the rendered VT100 stream of this frame
+        """
+        data = self._frames[frame_index]
+        if data is None:
+            # concurrent renders of the same frame are harmless, they produce equal bytes
+            data = self._renderer.render_frame(self._movie.frames[frame_index], self._positions[frame_index])
+            self._frames[frame_index] = data
+            self.size += sys.getsizeof(data)
+        return data
+
+    def prerender(self):
+        """
+        Renders all frames ahead of time.
+        """
+        for frame_index in range(len(self._frames)):
+            self.get(frame_index)
+
+    def memory_usage(self):
+        """
+        Returns:
+            int: size in bytes of the rendered frames so far and of the cache itself
+        """
+        return self.size
+
+
+class RenderCacheRegistry(object):
+    def __init__(self, max_bytes=RENDER_CACHE_BYTES):
+        """
+        Shared render caches for every movie and screen size, which clients asked for.
+        The least recently used caches are dropped, when all caches take more than max_bytes.
+        Players still holding a dropped cache keep using it.
+
+        Args:
+            max_bytes (int): memory limit for the caches, unlimited when None
+        """
+        self.max_bytes = max_bytes
+        self._caches = OrderedDict()  # (movie, width, height) -> FrameRenderCache, least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, movie, width=None, height=None):
+        """
+        Returns the render cache for the given movie and screen size, creating it on first access.
+
+        Args:
+            movie (ascii_movie.Movie): Movie Object, which frames will be rendered.
+            width (int): screen width, the movie's screen width by default
+            height (int): screen height, the movie's screen height by default
+
+        Returns:
+            FrameRenderCache: the shared cache
+        """
+        key = (movie, width or movie.screen_width, height or movie.screen_height)
+        with self._lock:
+            cache = self._caches.pop(key, None)
+            if cache is None:
+                cache = FrameRenderCache(movie, key[1:])
+            self._caches[key] = cache
+            self._evict()
+        return cache
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        size = self.memory_usage()
+        while size > self.max_bytes and len(self._caches) > 1:
+            size -= self._caches.popitem(last=False)[1].size
+
+    def memory_usage(self):
+        """
+        Returns:
+            int: size in bytes of all caches
+        """
+        return sum(cache.size for cache in list(self._caches.values()))
+
+    def discard(self, movie):
+        """
+        Forget the caches of a movie, which was reloaded or dropped. Players still holding a cache keep using it.
+        """
+        with self._lock:
+            for key in [key for key in self._caches if key[0] is movie]:
+                del self._caches[key]
+
+    def clear(self):
+        """
+        Forget all caches. Players still holding a cache keep using it.
+        """
+        with self._lock:
+            self._caches.clear()
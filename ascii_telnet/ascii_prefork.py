@@ -0,0 +1,233 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from __future__ import division, print_function
+
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+from ascii_telnet.ascii_metrics import server_stats
+
+
+class PreforkSupervisor(object):
+    def __init__(self, workers, create_server, server_address, reuse_port=False, stats_interval=5.0,
+                 verbose=False, sock=None, drain_timeout=None):
+        """
+        Runs the server in several worker processes, to make use of more than one CPU core.
+        Either all workers inherit one listening socket from the supervisor, or each worker binds
+        its own socket to the same port with SO_REUSEPORT, which lets the kernel balance connections.
+        Crashed workers are restarted and their statistics are aggregated in the supervisor.
+
+        Args:
+            workers (int): number of worker processes
+            create_server (callable): called in each worker with the listening socket (or None, when reusing
+                                      the port), returns a server object with serve_forever() and
+                                      stop_accepting(drain_timeout) methods
+            server_address (tuple): (interface, port) to listen on
+            reuse_port (bool): let each worker bind its own socket with SO_REUSEPORT
+            stats_interval (float): seconds between statistics reports of the workers
+            verbose (bool): print worker restarts
+            sock (socket.socket): listening socket the workers share, e.g. inherited on a restart,
+                                  bound to server_address when None
+            drain_timeout (float): seconds the workers wait for their connections, after stop_accepting()
+        """
+        self.workers = workers
+        self.create_server = create_server
+        self.server_address = server_address
+        self.reuse_port = reuse_port
+        self.stats_interval = stats_interval
+        self.verbose = verbose
+        self.drain_timeout = drain_timeout
+        self._socket = sock
+        self._pids = {}  # pid -> worker number
+        self._pipes = {}  # read end of the stats pipe -> worker number
+        self._buffers = {}  # worker number -> incomplete line read from its pipe
+        self._worker_stats = {}  # worker number -> latest statistics
+        self._retired_stats = {}  # counters of workers, which exited
+        self._started = {}  # worker number -> time of the last start
+        self._running = False
+        self._draining = False
+
+    def serve_forever(self):
+        """
+        Starts the workers and supervises them, until interrupted or stopped with stop_accepting().
+        """
+        if not self.reuse_port and self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._socket.bind(self.server_address)
+            self._socket.listen(1024)
+        # terminate the workers as well, when the supervisor is terminated
+        signal.signal(signal.SIGTERM, self._terminate)
+        self._running = True
+        for number in range(self.workers):
+            self._spawn(number)
+        try:
+            while self._running:
+                self._read_stats(1)
+                self._reap()
+            if self._draining:
+                if self._socket is not None:
+                    self._socket.close()
+                for pid in list(self._pids):
+                    try:
+                        os.kill(pid, signal.SIGHUP)
+                    except OSError:
+                        pass
+                while self._pids:
+                    self._read_stats(1)
+                    self._reap()
+        finally:
+            self._running = False
+            self.shutdown()
+
+    def shutdown(self):
+        """
+        Terminates all workers.
+        """
+        for pid in list(self._pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self._pids.clear()
+
+    def stop_accepting(self):
+        """
+        Makes the workers stop accepting connections and serve_forever() return, once they finished
+        their connections in progress, up to drain_timeout. Thread safe.
+        """
+        self._draining = True
+        self._running = False
+
+    def _terminate(self, signum, frame):
+        sys.exit(0)
+
+    def stats(self):
+        """
+        Returns:
+            dict: statistics summed up over all workers, as last reported by them
+        """
+        total = dict(self._retired_stats)
+        for worker_stats in self._worker_stats.values():
+            for name, value in worker_stats.items():
+                total[name] = total.get(name, 0) + value
+        return total
+
+    def _spawn(self, number):
+        # don't restart a crashing worker in a tight loop
+        delay = self._started.get(number, 0) + 1 - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        self._started[number] = time.time()
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            self._run_worker(write_end)
+        os.close(write_end)
+        self._pids[pid] = number
+        self._pipes[read_end] = number
+        self._buffers[number] = b""
+
+    def _run_worker(self, stats_fd):
+        """
+        Runs in the forked worker process and never returns.
+        """
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # the supervisor restarts on SIGHUP, the workers only stop accepting then
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            for fd in self._pipes:
+                os.close(fd)
+            reporter = threading.Thread(target=self._report_stats, args=(stats_fd,))
+            reporter.daemon = True
+            reporter.start()
+            server = self.create_server(self._socket)
+            signal.signal(signal.SIGHUP, lambda signum, frame: server.stop_accepting(self.drain_timeout))
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stdout.flush()
+            os._exit(status)
+
+    def _report_stats(self, stats_fd):
+        while True:
+            try:
+                os.write(stats_fd, (json.dumps(server_stats.snapshot()) + "\n").encode())
+            except OSError:
+                # the supervisor is gone, don't keep serving without it
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+            time.sleep(self.stats_interval)
+
+    def _read_stats(self, timeout):
+        if not self._pipes:
+            time.sleep(timeout)
+            return
+        readable = select.select(list(self._pipes), [], [], timeout)[0]
+        for fd in readable:
+            number = self._pipes[fd]
+            data = os.read(fd, 65536)
+            if not data:
+                # the worker is gone
+                del self._pipes[fd]
+                os.close(fd)
+                continue
+            lines = (self._buffers[number] + data).split(b"\n")
+            self._buffers[number] = lines.pop()
+            if lines:
+                self._worker_stats[number] = json.loads(lines[-1].decode())
+
+    def _reap(self):
+        while self._pids:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            number = self._pids.pop(pid, None)
+            if number is None:
+                continue
+            for name, value in self._worker_stats.pop(number, {}).items():
+                if not name.endswith("_active"):
+                    self._retired_stats[name] = self._retired_stats.get(name, 0) + value
+            if not self._running:
+                continue
+            if self.verbose:
+                print("Worker {0} (pid {1}) exited with status {2}, restarting.".format(number, pid, status))
+            self._spawn(number)
@@ -0,0 +1,300 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from __future__ import division, print_function
+
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+# Telnet commands and options, see RFC 854 and RFC 1073 (NAWS, negotiate about window size)
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+ECHO = 1
+SGA = 3  # suppress go ahead
+TIMING_MARK = 6  # RFC 860, the client answers once it processed everything sent before
+NAWS = 31
+NEW_ENVIRON = 39  # RFC 1572, e.g. 'telnet -l NAME' sends the USER variable
+COMPRESS2 = 86  # MCCP2, the MUD client compression protocol, version 2
+# NEW-ENVIRON subnegotiation codes
+ENV_IS, ENV_SEND, ENV_INFO = 0, 1, 2
+ENV_VAR, ENV_VALUE, ENV_ESC, ENV_USERVAR = 0, 1, 2, 3
+
+DO_NAWS = bytes(bytearray([IAC, DO, NAWS]))
+# the server takes over echoing (and echoes nothing), so the client sends every keystroke right away
+CHARACTER_MODE = bytes(bytearray([IAC, WILL, ECHO, IAC, WILL, SGA]))
+WILL_COMPRESS2 = bytes(bytearray([IAC, WILL, COMPRESS2]))
+DO_TIMING_MARK = bytes(bytearray([IAC, DO, TIMING_MARK]))
+# everything the server sends after this is a zlib stream
+START_COMPRESS2 = bytes(bytearray([IAC, SB, COMPRESS2, IAC, SE]))
+# asks for the USER variable right away, clients agreeing with WILL answer it in order
+REQUEST_USER = bytes(bytearray([IAC, DO, NEW_ENVIRON, IAC, SB, NEW_ENVIRON, ENV_SEND, ENV_VAR]) + b"USER" +
+                     bytearray([IAC, SE]))
+
+_DATA, _COMMAND, _OPTION, _SUBNEGOTIATION, _SUBNEGOTIATION_IAC = range(5)
+
+
+class TelnetParser(object):
+    min_size = (20, 5)  # smaller window sizes are raised to this
+    max_size = (1000, 500)  # larger window sizes are capped, they would only bloat the render caches
+
+    def __init__(self):
+        """
+        Separates the telnet commands from the data a client sends.
+        Keeps track of the client's window size, as reported with the NAWS option,
+        of the environment variables the client reports with the NEW-ENVIRON option
+        and counts the client's answers to timing marks.
+        Data may be fed in arbitrary chunks, commands split across chunks are handled.
+        """
+        self.window_size = None  # (width, height) of the client's terminal, when known
+        self.naws_refused = False  # the client won't report its window size
+        self.compress2 = None  # the client accepted (True) or refused (False) MCCP2 compression
+        self.environ = None  # dict of the client's environment variables, when reported
+        self.environ_refused = False  # the client won't report environment variables
+        self.timing_marks = 0  # answers to DO TIMING-MARK, either WILL or WONT
+        self._state = _DATA
+        self._command = None
+        self._subnegotiation = bytearray()
+
+    @property
+    def naws_negotiated(self):
+        """
+        bool: the client either reported its window size or refused to
+        """
+        return self.window_size is not None or self.naws_refused
+
+    @property
+    def environ_negotiated(self):
+        """
+        bool: the client either reported its environment variables or refused to
+        """
+        return self.environ is not None or self.environ_refused
+
+    def feed(self, data):
+        """
+        Args:
+            data (bytes): bytes received from the client
+
+        Returns:
+            bytes: the data, without telnet commands
+        """
+        text = bytearray()
+        for byte in bytearray(data):
+            if self._state == _DATA:
+                if byte == IAC:
+                    self._state = _COMMAND
+                else:
+                    text.append(byte)
+            elif self._state == _COMMAND:
+                if byte == IAC:
+                    text.append(byte)  # escaped 255
+                    self._state = _DATA
+                elif byte in (WILL, WONT, DO, DONT):
+                    self._command = byte
+                    self._state = _OPTION
+                elif byte == SB:
+                    del self._subnegotiation[:]
+                    self._state = _SUBNEGOTIATION
+                else:
+                    self._state = _DATA
+            elif self._state == _OPTION:
+                if byte == NAWS and self._command in (WONT, DONT):
+                    self.naws_refused = True
+                elif byte == NEW_ENVIRON and self._command in (WONT, DONT):
+                    self.environ_refused = True
+                elif byte == COMPRESS2 and self._command in (DO, DONT):
+                    self.compress2 = self._command == DO
+                elif byte == TIMING_MARK and self._command in (WILL, WONT):
+                    self.timing_marks += 1
+                self._state = _DATA
+            elif self._state == _SUBNEGOTIATION:
+                if byte == IAC:
+                    self._state = _SUBNEGOTIATION_IAC
+                else:
+                    self._subnegotiation.append(byte)
+            elif self._state == _SUBNEGOTIATION_IAC:
+                if byte == IAC:
+                    self._subnegotiation.append(byte)
+                    self._state = _SUBNEGOTIATION
+                else:
+                    # IAC SE, or a broken subnegotiation, which ends here as well
+                    self._on_subnegotiation(bytes(self._subnegotiation))
+                    self._state = _DATA
+        return bytes(text)
+
+    def _on_subnegotiation(self, data):
+        if len(data) == 5 and bytearray(data)[0] == NAWS:
+            width, height = struct.unpack("!HH", data[1:])
+            if width and height:  # zero means unknown
+                self.window_size = (min(max(width, self.min_size[0]), self.max_size[0]),
+                                    min(max(height, self.min_size[1]), self.max_size[1]))
+        elif len(data) >= 2 and bytearray(data[:2]) in (bytearray([NEW_ENVIRON, ENV_IS]),
+                                                         bytearray([NEW_ENVIRON, ENV_INFO])):
+            environ = self.environ or {}
+            environ.update(self._parse_environ(bytearray(data[2:])))
+            self.environ = environ
+
+    @staticmethod
+    def _parse_environ(data):
+        """
+        Returns:
+            dict: variable names and values, both as text
+        """
+        variables = {}
+        name = value = None
+        current = None
+        escaped = False
+        for byte in data:
+            if escaped:
+                current.append(byte)
+                escaped = False
+            elif byte == ENV_ESC:
+                escaped = current is not None
+            elif byte in (ENV_VAR, ENV_USERVAR):
+                if name is not None:
+                    variables[name.decode("latin-1")] = value.decode("latin-1") if value is not None else ""
+                name, value = bytearray(), None
+                current = name
+            elif byte == ENV_VALUE and name is not None:
+                value = bytearray()
+                current = value
+            elif current is not None:
+                current.append(byte)
+        if name is not None:
+            variables[name.decode("latin-1")] = value.decode("latin-1") if value is not None else ""
+        return variables
+
+
+class StreamCompressor(object):
+    def __init__(self, level=zlib.Z_DEFAULT_COMPRESSION):
+        """
+        The compressed stream (MCCP2) of one connection. The first output starts the compression,
+        every output ends with a flush, so the client can display each frame right away.
+
+        Args:
+            level (int): zlib compression level
+        """
+        self._compressor = zlib.compressobj(level)
+        self._started = False
+        self._history = False  # data was compressed with this stream's own history since the last reset
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def compress(self, data):
+        """
+        Args:
+            data (bytes): data to send
+
+        Returns:
+            bytes: the compressed data, to send instead
+        """
+        output = self._start() + self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._history = True
+        return self._count(data, output)
+
+    def splice(self, data, block):
+        """
+        Splices a block, which was compressed once for many connections, into this stream.
+
+        Args:
+            data (bytes): data to send
+            block (bytes): the data compressed with compress_block()
+
+        Returns:
+            bytes: the compressed data, to send instead
+        """
+        output = self._start()
+        if self._history:
+            # the data following the block must not refer to data before it
+            output += self._compressor.flush(zlib.Z_FULL_FLUSH)
+            self._history = False
+        return self._count(data, output + block)
+
+    def _start(self):
+        if self._started:
+            return b""
+        self._started = True
+        # the zlib header, the blocks spliced into the stream don't have one
+        return START_COMPRESS2 + self._compressor.flush(zlib.Z_FULL_FLUSH)
+
+    def _count(self, data, output):
+        self.bytes_in += len(data)
+        self.bytes_out += len(output)
+        return output
+
+
+def compress_block(data, level=zlib.Z_DEFAULT_COMPRESSION):
+    """
+    Compresses data independently of anything sent before or after, see StreamCompressor.splice().
+
+    Returns:
+        bytes: raw deflate blocks, ending with a full flush
+    """
+    compressor = zlib.compressobj(level)
+    return (compressor.compress(data) + compressor.flush(zlib.Z_FULL_FLUSH))[2:]  # without the zlib header
+
+
+class BlockCache(object):
+    def __init__(self, max_blocks=4096):
+        """
+        Compresses data, which is sent to many connections, only once, e.g. frames of a render cache
+        or of a live channel. Blocks are looked up by the identity of the data, which is kept alive
+        by the cache, the least recently used blocks are dropped.
+
+        Args:
+            max_blocks (int): number of compressed blocks to keep
+        """
+        self.max_blocks = max_blocks
+        self._blocks = OrderedDict()  # id(data) -> (data, block)
+        self._lock = threading.Lock()
+
+    def get(self, data):
+        """
+        Returns:
+            bytes: the data compressed with compress_block()
+        """
+        key = id(data)
+        with self._lock:
+            entry = self._blocks.pop(key, None)
+            if entry is not None and entry[0] is data:
+                self._blocks[key] = entry
+                return entry[1]
+        # concurrent compression of the same data is harmless, the blocks are equal
+        block = compress_block(data)
+        with self._lock:
+            self._blocks[key] = (data, block)
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+        return block
+
+
+shared_blocks = BlockCache()
@@ -0,0 +1,115 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+Exports a movie as a timestamped recording in the asciicast format (version 2), which
+asciinema and other terminal players can replay. The movie is rendered with a virtual clock,
+so the export takes seconds instead of the movie's length, but records the exact bytes and
+points in time a telnet client would get.
+
+Export a movie with:
+    python -m ascii_telnet.ascii_recording -o sw1.cast sample_movies/sw1.txt
+"""
+from __future__ import division, print_function
+
+import io
+import json
+import os
+from optparse import OptionParser
+
+from ascii_telnet.ascii_movie import load_movie
+from ascii_telnet.ascii_player import VT100Player
+from ascii_telnet.ascii_scheduler import VirtualClock
+
+
+def record(movie, output, screen_size=None, delta=False, title=None):
+    """
+    Plays the movie with a virtual clock and writes every frame with its point in time.
+
+    Args:
+        movie (ascii_movie.Movie): the movie to record
+        output (file): text file to write the recording to
+        screen_size (tuple): (width, height) of the recorded screen, the movie's screen size by default
+        delta (bool): record only the changed parts of the screen
+        title (str): optional title of the recording
+
+    Returns:
+        float: duration of the recording in seconds
+    """
+    clock = VirtualClock()
+    player = VT100Player(movie, delta=delta, screen_size=screen_size, clock=clock)
+    header = {"version": 2, "width": player.screen_width, "height": player.screen_height}
+    if title:
+        header["title"] = title
+    output.write(_json_line(header))
+
+    def draw_frame(screen_buffer):
+        event = [round(clock.now(), 6), "o", screen_buffer.read().decode("utf-8")]
+        output.write(_json_line(event))
+
+    player.draw_frame = draw_frame
+    player.play()
+    return clock.now()
+
+
+def _json_line(value):
+    # json.dumps gives str on Py2, the unicode format makes it text for io files on both versions
+    return u"%s\n" % json.dumps(value)
+
+
+def read_recording(input_file):
+    """
+    Returns:
+        tuple: (header dict, list of (seconds, bytes) of each frame)
+    """
+    header = json.loads(input_file.readline())
+    frames = []
+    for line in input_file:
+        seconds, kind, data = json.loads(line)
+        if kind == "o":
+            frames.append((seconds, data.encode("utf-8")))
+    return header, frames
+
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="Usage: %prog [options] MOVIE_FILE")
+    parser.add_option("-o", "--output", dest="output", metavar="FILE",
+                      help="Recording to write (default: MOVIE_FILE with extension .cast)")
+    parser.add_option("", "--width", dest="width", type="int", default=80,
+                      help="Screen width of the recording (default 80)")
+    parser.add_option("", "--height", dest="height", type="int", default=24,
+                      help="Screen height of the recording (default 24)")
+    parser.add_option("", "--delta", dest="delta", action="store_true", default=False,
+                      help="Record only the changed parts of the screen")
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error("Exactly one movie file is required.")
+    output = options.output or os.path.splitext(args[0])[0] + ".cast"
+    with io.open(output, "w", encoding="utf-8") as f:
+        duration = record(load_movie(args[0]), f, (options.width, options.height), options.delta,
+                          os.path.basename(args[0]))
+    print("Recorded {0:.0f} seconds of {1} to {2}".format(duration, args[0], output))
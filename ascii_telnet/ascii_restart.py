@@ -0,0 +1,196 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+  Restarts the server without downtime, e.g. to play a new movie or to run updated code.
+
+  On SIGHUP the server starts a new server process, which inherits the listening sockets
+  and accepts connections right away. Connections arriving meanwhile wait in the listen backlog
+  of the shared socket, none are refused. Once the new process is ready, the old one stops
+  accepting and finishes the playbacks in progress, up to a deadline, before it exits.
+"""
+from __future__ import division, print_function
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+from ascii_telnet.ascii_metrics import server_stats
+from ascii_telnet.ascii_scheduler import monotonic
+
+LISTEN_FDS = "ASCII_TELNET_LISTEN_FDS"  # name=fd,... of the sockets inherited from the previous process
+READY_FD = "ASCII_TELNET_READY_FD"  # pipe, which tells the previous process that this one is serving
+# the sockets are passed on with Popen(pass_fds) and taken over with socket(fileno), which Py2 lacks
+RESTART_SUPPORTED = sys.version_info >= (3, 2)
+
+
+def bind(server_address, reuse_port=False, backlog=1024):
+    """
+    Binds the listening TCP socket of the server.
+
+    Args:
+        server_address (tuple): (interface, port) to listen on
+        reuse_port (bool): allow several processes to bind the same port, see SO_REUSEPORT
+        backlog (int): size of the listen queue for not yet accepted connections
+
+    Returns:
+        socket.socket: the listening socket
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(server_address)
+    sock.listen(backlog)
+    return sock
+
+
+def inherited_sockets():
+    """
+    Takes over the listening sockets of the process, which restarted into this one.
+
+    Returns:
+        dict: name -> socket.socket, empty when this process wasn't started by a restart
+    """
+    sockets = {}
+    for entry in os.environ.pop(LISTEN_FDS, "").split(","):
+        if entry:
+            name, fd = entry.split("=")
+            sockets[name] = socket.socket(fileno=int(fd))
+    return sockets
+
+
+def notify_ready(pid_file=None):
+    """
+    Tells the previous process, if any, that this process serves the connections now.
+
+    Args:
+        pid_file (str): optional file to write the process ID to, for sending the next SIGHUP
+    """
+    if pid_file:
+        with open(pid_file, "w") as f:
+            f.write("{0}\n".format(os.getpid()))
+    fd = os.environ.pop(READY_FD, None)
+    if fd is not None:
+        try:
+            os.write(int(fd), b"1")
+        finally:
+            os.close(int(fd))
+
+
+def wait_for_connections(timeout):
+    """
+    Waits for the connections in progress to finish.
+
+    Args:
+        timeout (float): seconds to wait at most, forever when None
+
+    Returns:
+        int: number of connections still open
+    """
+    deadline = None if timeout is None else monotonic() + timeout
+    while server_stats.connections_active > 0 and (deadline is None or monotonic() < deadline):
+        threading.Event().wait(0.1)
+    return server_stats.connections_active
+
+
+class GracefulRestart(object):
+    def __init__(self, sockets, stop_accepting, command=None, verbose=False):
+        """
+        Restarts the server on SIGHUP, see install().
+
+        Args:
+            sockets (dict): name -> listening socket, which the new process inherits, see inherited_sockets()
+            stop_accepting (callable): called from a background thread, once the new process is ready,
+                                       it must make the server stop accepting and drain its connections
+            command (list): command line of the new process, the current one by default
+            verbose (bool): print the progress of the restart
+        """
+        self.sockets = sockets
+        self.stop_accepting = stop_accepting
+        self.command = command or [sys.executable] + sys.argv
+        self.verbose = verbose
+        self._restarting = False
+        self._lock = threading.Lock()
+
+    def install(self):
+        """
+        Handles SIGHUP, on Python 2 only by saying that restarting needs Python 3.
+        """
+        if hasattr(signal, "SIGHUP"):  # not on Windows
+            signal.signal(signal.SIGHUP, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        if not RESTART_SUPPORTED:
+            print("Restarting without downtime needs Python 3, SIGHUP ignored.")
+            return
+        with self._lock:
+            if self._restarting:
+                return
+            self._restarting = True
+        # starting the new process takes as long as loading the movie, keep serving meanwhile
+        thread = threading.Thread(target=self.restart)
+        thread.daemon = True
+        thread.start()
+
+    def restart(self):
+        """
+        Starts the new process and waits until it is ready, then stops this server.
+
+        Returns:
+            bool: True, when the new process took over, False when it failed to start
+        """
+        read_end, write_end = os.pipe()
+        env = dict(os.environ)
+        env[LISTEN_FDS] = ",".join("{0}={1}".format(name, sock.fileno()) for name, sock in self.sockets.items())
+        env[READY_FD] = str(write_end)
+        fds = [sock.fileno() for sock in self.sockets.values()] + [write_end]
+        try:
+            process = subprocess.Popen(self.command, env=env, pass_fds=fds)
+        except OSError as e:
+            print("Restart failed: {0}".format(e))
+            process = None
+        finally:
+            os.close(write_end)
+        try:
+            # the pipe closes without a byte, when the new process exits before serving
+            ready = process is not None and os.read(read_end, 1) == b"1"
+        finally:
+            os.close(read_end)
+        if not ready:
+            if process is not None:
+                print("Restart failed, the new server exited with status {0}.".format(process.wait()))
+            with self._lock:
+                self._restarting = False
+            return False
+        if self.verbose:
+            print("Restarted as pid {0}, finishing the connections in progress.".format(process.pid))
+        self.stop_accepting()
+        return True
@@ -0,0 +1,145 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+from __future__ import division, print_function
+
+import time
+
+try:
+    monotonic = time.monotonic
+except AttributeError:  # Py2
+    monotonic = time.time
+
+
+class RealClock(object):
+    """
+    The system's monotonic clock, playback takes as long as the movie.
+    """
+
+    def now(self):
+        return monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock(object):
+    def __init__(self, start=0.0):
+        """
+        A clock, which only advances when sleeping, so sleeping returns right away.
+        A player using it renders the whole movie as fast as possible, with the same
+        frames and timestamps as in real time, e.g. for tests and exporting recordings.
+
+        Args:
+            start (float): the initial time in seconds
+        """
+        self.time = start
+
+    def now(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self.time += max(0.0, seconds)
+
+
+real_clock = RealClock()
+
+
+class FrameScheduler(object):
+    def __init__(self, fps=15, clock=monotonic):
+        """
+        Computes absolute deadlines for frames, based on a monotonic clock.
+        Time spent on rendering and writing doesn't add up over the frames,
+        so the playback takes exactly as long as the movie's timeline.
+        It also keeps statistics, how late frames were shown.
+
+        Args:
+            fps (int): frame cycles per second
+            clock (callable): returns the current time in seconds
+        """
+        self.fps = fps
+        self.clock = clock
+        self._origin = None  # point in time of frame position 0
+
+        self.frames_shown = 0
+        self.frames_skipped = 0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+
+    def start(self, frame_pos=0):
+        """
+        Starts the timeline, so that the given frame position is due right now.
+        """
+        self._origin = self.clock() - frame_pos / self.fps
+
+    def shift(self, frame_pos):
+        """
+        Moves the timeline by the given frame positions, e.g. when a movie starts over.
+        """
+        self._origin += frame_pos / self.fps
+
+    def deadline(self, frame_pos):
+        """
+        Returns:
+            float: point in time, when the given frame position is due
+        """
+        return self._origin + frame_pos / self.fps
+
+    def position(self):
+        """
+        Returns:
+            float: the frame position, which is due right now
+        """
+        if self._origin is None:
+            return 0.0
+        return (self.clock() - self._origin) * self.fps
+
+    def is_due(self, frame_pos):
+        return self.clock() >= self.deadline(frame_pos)
+
+    def delay(self, frame_pos):
+        """
+        Returns:
+            float: seconds to wait until the given frame position is due, 0 if it's due already
+        """
+        return max(0.0, self.deadline(frame_pos) - self.clock())
+
+    def record(self, frame_pos):
+        """
+        Records that the frame at the given position is being shown now.
+        """
+        lateness = max(0.0, self.clock() - self.deadline(frame_pos))
+        self.frames_shown += 1
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        return lateness
+
+    @property
+    def mean_lateness(self):
+        if not self.frames_shown:
+            return 0.0
+        return self.total_lateness / self.frames_shown
@@ -27,10 +27,23 @@
 from __future__ import division, print_function
 
 import errno
+import math
+import select
 import socket
+import threading
+from collections import deque
 
-from ascii_telnet.ascii_movie import Movie
-from ascii_telnet.ascii_player import VT100Player
+from ascii_telnet.ascii_admission import client_ip, reject
+from ascii_telnet.ascii_catalog import MovieMenu
+from ascii_telnet.ascii_handoff import HandoffReceiver
+from ascii_telnet.ascii_metrics import server_stats
+from ascii_telnet.ascii_movie import movie_registry
+from ascii_telnet.ascii_pacing import SEND_BUFFER_BYTES, LinkPacer, unsent_bytes
+from ascii_telnet.ascii_player import PlaybackControls, VT100Player, WindowResizes
+from ascii_telnet.ascii_protocol import (CHARACTER_MODE, DO_NAWS, REQUEST_USER, WILL_COMPRESS2, StreamCompressor,
+                                         TelnetParser, shared_blocks)
+from ascii_telnet.ascii_restart import wait_for_connections
+from ascii_telnet.ascii_scheduler import monotonic
 
 try:
     # noinspection PyCompatibility
@@ -40,8 +53,120 @@ except ImportError:  # Py2
     from SocketServer import StreamRequestHandler, ThreadingMixIn, TCPServer
 
 
+class _SocketPoller(object):
+    """
+    Waits until a socket can be read or written.
+    select.select can't watch file descriptors of 1024 and above, which a server with a thousand clients
+    reaches, so poll is used where the platform has it.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._poll = select.poll() if hasattr(select, "poll") else None
+
+    def wait(self, readable, timeout):
+        """
+        Returns:
+            bool: True, when the socket became readable (or writable) within the timeout
+        """
+        timeout = max(timeout, 0)
+        if self._poll is None:
+            if readable:
+                return bool(select.select([self.sock], [], [], timeout)[0])
+            return bool(select.select([], [self.sock], [], timeout)[1])
+        # registering again only modifies the events of the socket
+        self._poll.register(self.sock, select.POLLIN if readable else select.POLLOUT)
+        return bool(self._poll.poll(int(math.ceil(timeout * 1000))))
+
+
 class ThreadedTCPServer(ThreadingMixIn, TCPServer):
     daemon_threads = True
+    request_queue_size = 1024  # bursts of new connections must not overflow the listen backlog
+    reuse_port = False  # allow several processes to bind the same port, see SO_REUSEPORT
+    admission = None  # optional AdmissionControl, connections above its limits get the busy screen
+
+    def __init__(self, server_address, RequestHandlerClass, bind_and_activate=True, sock=None):
+        """
+        Args:
+            sock (socket.socket): optional listening socket to use, e.g. inherited from a parent process
+        """
+        TCPServer.__init__(self, server_address, RequestHandlerClass, bind_and_activate and sock is None)
+        if sock is not None:
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
+        self._handoff = None
+        self._draining = False
+        self._drain_timeout = None
+
+    def serve_forever(self, poll_interval=0.5):
+        TCPServer.serve_forever(self, poll_interval)
+        if self._draining:
+            self.server_close()
+            remaining = wait_for_connections(self._drain_timeout)
+            if remaining:
+                print("Closing {0} connections, which didn't finish in time.".format(remaining))
+
+    def stop_accepting(self, drain_timeout=None):
+        """
+        Makes serve_forever() stop accepting connections and return, once the connections in progress
+        finished. Can be called from any thread and from signal handlers.
+
+        Args:
+            drain_timeout (float): seconds to wait for the connections in progress at most, forever when None
+        """
+        self._draining = True
+        self._drain_timeout = drain_timeout
+        if self._handoff is not None:
+            self._handoff.stop()
+        # shutdown() waits for serve_forever() to return, which may run in the calling thread
+        thread = threading.Thread(target=self.shutdown)
+        thread.daemon = True
+        thread.start()
+
+    def serve_handoffs(self, sock):
+        """
+        Also serves connections, which inetd stubs hand over, see ascii_handoff.
+
+        Args:
+            sock (socket.socket): listening Unix domain socket of the stubs
+        """
+        self._handoff = HandoffReceiver(sock, self.adopt)
+        self._handoff.start()
+
+    def process_request(self, request, client_address):
+        # runs in the accepting thread, rejected connections don't cost a thread
+        if self.admission is not None and not self.admission.admit(client_ip(client_address)):
+            reject(request)
+            return
+        try:
+            ThreadingMixIn.process_request(self, request, client_address)
+        except Exception:
+            if self.admission is not None:
+                self.admission.release(client_ip(client_address))
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            if self.admission is not None:
+                self.admission.release(client_ip(client_address))
+
+    def adopt(self, request):
+        """
+        Serves a connection, which was accepted by another process, see ascii_handoff.
+        Thread safe, each connection gets its own thread anyway.
+
+        Args:
+            request (socket.socket): the connected socket
+        """
+        self.process_request(request, request.getpeername())
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        TCPServer.server_bind(self)
 
 
 class TelnetRequestHandler(StreamRequestHandler):
@@ -51,22 +176,311 @@ class TelnetRequestHandler(StreamRequestHandler):
     """
 
     filename = None  # filename is set once, so it's immutable and safe for multi threading
+    catalog = None  # optional MovieCatalog, the clients choose a movie of it instead of playing filename
+    render_cache = None  # optional RenderCacheRegistry, rendered frames per screen size shared by all connections
+    channel = None  # optional BroadcastChannel, all connections watch the same live playback
+    delta = False  # send only the changed parts of the screen
+    compress = False  # offer MCCP2 compression to the clients
+    adaptive = False  # measure the round trip time and lower the frame rate on slow links, see ascii_pacing
+    max_queued_frames = 1  # frames waiting behind the one being sent, older frames are dropped
+    send_buffer_bytes = SEND_BUFFER_BYTES  # SO_SNDBUF of the client sockets, see ascii_pacing
+    stall_timeout = 30.0  # seconds without progress in sending, before a client is disconnected
+    naws_timeout = 1.0  # seconds to wait for the client's window size, before playing at the movie's size
+    menu_timeout = 60.0  # seconds a client may take to choose a movie
+
+    def setup(self):
+        StreamRequestHandler.setup(self)
+        # writes never block, a slow client can't pin this thread and frames queue up in here instead
+        self.request.setblocking(False)
+        if self.send_buffer_bytes:
+            self.request.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer_bytes)
+        self._poller = _SocketPoller(self.request)
+        self._queue = deque()
+        self._pending = None  # memoryview of the not yet sent rest of the current frame
+        self._disconnected = False
+        self.compressor = None  # StreamCompressor, once the client accepted compression
+        self._last_progress = monotonic()
+        self.telnet = TelnetParser()
+        self.player = None
+        self.controls = None
+        self.pacer = LinkPacer() if self.adaptive else None
+        server_stats.increment("connections_total")
+        server_stats.increment("connections_active")
+
+    def finish(self):
+        server_stats.increment("connections_active", -1)
+        StreamRequestHandler.finish(self)
 
     def handle(self):
-        movie = Movie()
-        movie.load(TelnetRequestHandler.filename)
+        if TelnetRequestHandler.channel is not None:
+            self.watch_channel(TelnetRequestHandler.channel)
+            return
+
+        if not self.negotiate_window_size():
+            return
+        filename = TelnetRequestHandler.filename
+        if TelnetRequestHandler.catalog is not None:
+            filename = self.choose_movie(TelnetRequestHandler.catalog)
+            if filename is None:
+                return
+        self.movie = movie_registry.get(filename)
+        width, height = self.telnet.window_size or (self.movie.screen_width, self.movie.screen_height)
 
-        self.player = VT100Player(movie)
+        self.player = VT100Player(self.movie, self._render_cache(width, height), TelnetRequestHandler.delta,
+                                  (width, height))
         self.player.draw_frame = self.draw_frame
-        self.player.play()
+        self.controls = PlaybackControls(self.player)
+        self.resizes = WindowResizes(self.player, self._render_cache)
+        admission = self.server.admission
+        for delay in self.player.steps():
+            if admission is not None:
+                self.player.degrade(admission.degraded)
+            if self.pacer is not None:
+                self.player.adapt(*self.pacer.update(self._unsent_bytes()))
+            self.resizes.apply()
+            if not self._flush(delay):
+                self.player.stop()
+                break
+        else:
+            # the movie ended, the last frames still have to go out
+            while (self._pending is not None or self._queue) and self._flush(1):
+                pass
+        if self.player.delta is not None:
+            print("Delta encoding saved {0} of {1} bytes.".format(self.player.delta.bytes_saved,
+                                                                 self.player.delta.bytes_full))
+        if self.pacer is not None:
+            print(self.pacer.summary())
 
     def draw_frame(self, screen_buffer):
         """
-        Gets the current screen buffer and writes it to the socket.
+        Gets the current screen buffer and queues it for the socket.
+        """
+        start = monotonic()
+        queued = self._enqueue(screen_buffer.read(), self.player.delta is not None, self.player.frame_shared)
+        if queued is None:
+            self.player.stop()
+        elif not queued:
+            self.player.invalidate()
+        server_stats.observe("write_seconds", monotonic() - start)
+
+    def negotiate_window_size(self):
+        """
+        Asks the client for its window size (telnet NAWS) and waits a moment for the answer.
+        Also switches the client to character mode, for the playback controls, offers compression
+        and asks for the USER variable, which may name the movie to play from the catalog.
+
+        Returns:
+            bool: False, when the client disconnected
+        """
+        self._enqueue(DO_NAWS + CHARACTER_MODE + (WILL_COMPRESS2 if self.compress else b"") +
+                      (REQUEST_USER if self.catalog is not None else b""), False)
+        deadline = monotonic() + self.naws_timeout
+        while not (self.telnet.naws_negotiated and (self.catalog is None or self.telnet.environ_negotiated)):
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                break
+            if not self._receive(timeout):
+                return False
+        return True
+
+    def choose_movie(self, catalog):
+        """
+        Plays the movie named by the client's USER variable ('telnet -l TITLE'), or lets the client
+        choose one from a menu.
+
+        Returns:
+            str: file path of the chosen movie, None when the client disconnected or didn't choose
+        """
+        path = catalog.path((self.telnet.environ or {}).get("USER"))
+        if path is not None:
+            return path
+        menu = MovieMenu(catalog, lambda data: self._enqueue(data, False))
+        self.controls = menu
+        menu.show()
+        deadline = monotonic() + self.menu_timeout
+        while menu.choice is None:
+            if monotonic() > deadline or not self._flush(0.1):
+                return None
+        self.controls = None
+        return catalog.path(menu.choice)
+
+    def resize(self, width, height):
+        """
+        The client's window changed its size, the movie is centered anew, see WindowResizes.
+        """
+        self.resizes.request(width, height)
+
+    def _render_cache(self, width, height):
+        if TelnetRequestHandler.render_cache is None:
+            return None
+        return TelnetRequestHandler.render_cache.get(self.movie, width, height)
+
+    def watch_channel(self, channel):
+        """
+        Sends the frames of a live channel, starting with a full screen sync frame.
+        """
+        if self.compress:
+            self._enqueue(WILL_COMPRESS2, False)
+        sequence, frame = channel.sync_frame()
+        shared = False  # the sync frame is made for this viewer, the following frames are the same for all viewers
+        while True:
+            queued = True if frame is None else self._enqueue(frame, channel.delta, shared)
+            if queued is None:
+                return
+            if not queued:
+                sequence = -1  # frames were dropped, the next frame from the channel is a full one
+            if self._pending is not None or self._queue:
+                if not self._flush(1 / 15):
+                    return
+                sequence, frame = channel.wait_for_frame(sequence, timeout=0)
+            else:
+                if not self._receive(0):
+                    return
+                sequence, frame = channel.wait_for_frame(sequence, timeout=1)
+            shared = True
+
+    def _enqueue(self, data, is_delta, shared=False):
+        """
+        Queues data for sending. When the queue is full, the stale frames are dropped.
+        Frames are compressed only when they are sent, so dropped frames never reach the compressed stream.
+
+        Args:
+            data (bytes): VT100 stream of a frame
+            is_delta (bool): the frame only contains changes to the previous frames
+            shared (bool): the very same bytes are sent to other clients, so they are compressed only once
+
+        Returns:
+            bool: False, when frames were dropped and the next frame needs to be a full one,
+                  None when the client disconnected
+        """
+        if self._disconnected:
+            return None
+        if len(self._queue) >= self.max_queued_frames:
+            dropped = len(self._queue)
+            self._queue.clear()
+            if is_delta:
+                # this frame only makes sense on top of the dropped ones
+                server_stats.increment("frames_dropped", dropped + 1)
+                return False
+            server_stats.increment("frames_dropped", dropped)
+        self._queue.append((data, shared))
+        return True if self._send() else None
+
+    def _send(self):
+        """
+        Sends as much of the queued data as the socket takes, without blocking.
+
+        Returns:
+            bool: False, when the client disconnected
+        """
+        if self._disconnected:
+            return False
+        while True:
+            if self._pending is None:
+                if not self._queue:
+                    self._last_progress = monotonic()
+                    return True
+                data, shared = self._queue.popleft()
+                if self.pacer is not None and self.player is not None:
+                    # the timing mark follows this frame, whichever frames are dropped later
+                    probe = self.pacer.rtt.probe()
+                    if probe:
+                        data, shared = data + probe, False
+                if self.compressor is not None:
+                    data = self._compress(data, shared)
+                self._pending = memoryview(data)
+            try:
+                sent = self.request.send(self._pending)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return True
+                print("Client Disconnected.")
+                self._disconnected = True
+                return False
+            self._last_progress = monotonic()
+            server_stats.increment("bytes_sent", sent)
+            if sent < len(self._pending):
+                self._pending = self._pending[sent:]
+            else:
+                self._pending = None
+                server_stats.increment("frames_sent")
+
+    def _compress(self, data, shared):
+        if shared:
+            compressed = self.compressor.splice(data, shared_blocks.get(data))
+        else:
+            compressed = self.compressor.compress(data)
+        server_stats.increment("compression_saved_bytes", len(data) - len(compressed))
+        return compressed
+
+    def _receive(self, timeout):
+        """
+        Waits for data from the client and processes the telnet commands and keystrokes in it.
+
+        Returns:
+            bool: False, when the client disconnected
         """
+        if self._disconnected:
+            return False
+        if not self._poller.wait(True, timeout):
+            return True
         try:
-            self.wfile.write(screen_buffer.read())
+            data = self.request.recv(4096)
         except socket.error as e:
-            if e.errno == errno.EPIPE:
-                print("Client Disconnected.")
-                self.player.stop()
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return True
+            data = b""
+        if not data:
+            print("Client Disconnected.")
+            self._disconnected = True
+            return False
+        window_size = self.telnet.window_size
+        timing_marks = self.telnet.timing_marks
+        keys = self.telnet.feed(data)
+        if self.telnet.timing_marks != timing_marks and self.pacer is not None:
+            self.pacer.rtt.on_answer()
+        if self.telnet.compress2 and self.compress and self.compressor is None:
+            self.compressor = StreamCompressor()
+        if self.telnet.window_size != window_size and self.player is not None:
+            self.resize(*self.telnet.window_size)
+        if keys and self.controls is not None:
+            self.controls.feed(keys)
+        return True
+
+    def _unsent_bytes(self):
+        """
+        Returns:
+            int: bytes of queued frames, which weren't sent yet
+        """
+        unsent = unsent_bytes(self.request) or 0
+        if self._pending is not None:
+            unsent += len(self._pending)
+        return unsent + sum(len(data) for data, _ in self._queue)
+
+    def _flush(self, timeout):
+        """
+        Keeps sending queued data for the given time.
+
+        Returns:
+            bool: False, when the client disconnected or was evicted
+        """
+        deadline = monotonic() + timeout
+        while True:
+            if not self._send():
+                return False
+            now = monotonic()
+            if self._pending is None and not self._queue:
+                while deadline > now:
+                    if not self._receive(deadline - now):
+                        return False
+                    if self.player is not None and self.player.interrupted:
+                        break  # the playback controls were used, the player takes the next step right away
+                    now = monotonic()
+                return True
+            if now - self._last_progress > self.stall_timeout:
+                print("Client evicted, stalled for {0:.0f} seconds.".format(now - self._last_progress))
+                server_stats.increment("clients_evicted")
+                return False
+            if now >= deadline:
+                return True
+            self._poller.wait(False, min(deadline - now, self.stall_timeout))
@@ -0,0 +1,90 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+  Writes the player's frames to a file descriptor, e.g. STDOUT when run from inetd.
+"""
+from __future__ import division, print_function
+
+import codecs
+import os
+
+
+class FrameWriter(object):
+    def __init__(self, stream, encoding="utf-8"):
+        """
+        Writes each frame's bytes with a single write to the stream's file descriptor.
+        The frames neither pass the stream's text layer nor its buffer, so each frame goes out
+        right away, without running Python unbuffered (python -u) and without decoding
+        and encoding it again.
+
+        Args:
+            stream (file): stream to write to, e.g. sys.stdout, its buffer is flushed first
+            encoding (str): encoding of the output, the player's frames are UTF-8 and are
+                            only transcoded for other encodings, e.g. 'latin-1'
+        """
+        stream.flush()
+        self.stream = stream
+        try:
+            self.fd = stream.fileno()
+        except (AttributeError, IOError, ValueError):
+            self.fd = None  # e.g. captured output, written through its binary buffer instead
+        self.encoding = codecs.lookup(encoding).name
+        self.transcode = self.encoding != "utf-8"
+        self.writes = 0  # system calls made, partial writes need more than one per frame
+
+    def write(self, screen_buffer):
+        """
+        Writes one frame, can be used as VT100Player.draw_frame.
+
+        Args:
+            screen_buffer (io.BytesIO): the frame's VT100 stream
+        """
+        data = screen_buffer.getvalue()  # the frame's bytes themselves, no copy
+        if self.transcode and not _is_ascii(data):
+            data = data.decode("utf-8").encode(self.encoding, "replace")
+        if self.fd is None:
+            stream = getattr(self.stream, "buffer", self.stream)
+            stream.write(data)
+            stream.flush()
+            self.writes += 1
+            return
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+            self.writes += 1
+
+
+def _is_ascii(data):
+    try:
+        return data.isascii()
+    except AttributeError:  # before Python 3.7
+        try:
+            data.decode("ascii")
+            return True
+        except UnicodeDecodeError:
+            return False
@@ -0,0 +1,315 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+Checks text movies in parallel and optionally compiles them (*.atm), e.g. before publishing a catalog.
+
+Each movie is split into chunks of whole frames, so the frames of one huge movie are checked
+by several processes as well. Problems are reported as 'FILE:LINE: error|warning: message',
+errors are the problems the server would fail to load the movie for.
+
+    python -m ascii_telnet.ascii_validate --compile movies/
+"""
+from __future__ import division, print_function
+
+import locale
+import mmap
+import os
+import re
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+from optparse import OptionParser
+
+from ascii_telnet.ascii_compiled import write_compiled
+from ascii_telnet.ascii_movie import Frame, Movie, TimeBar
+
+CHUNK_BYTES = 1 << 20  # chunks are cut at the first frame boundary after this many bytes
+ERROR = "error"
+WARNING = "warning"
+_CONTROL_CHARS = re.compile(u"[\x00-\x1f\x7f]")
+_CONTROL_BYTES = re.compile(b"[\x00-\x09\x0b-\x1f\x7f]")  # any but the line breaks
+
+
+class MovieReport(object):
+    def __init__(self, path):
+        """
+        The result of checking one movie.
+
+        Args:
+            path (str): Path of the text movie
+        """
+        self.path = path
+        self.display_times = []
+        self.problems = []  # (line number or None, ERROR or WARNING, message), in file order
+        self.compiled = None  # path of the compiled movie, if one was written
+
+    @property
+    def errors(self):
+        return sum(1 for problem in self.problems if problem[1] == ERROR)
+
+    @property
+    def warnings(self):
+        return sum(1 for problem in self.problems if problem[1] == WARNING)
+
+    def format_problems(self, warnings=True):
+        """
+        Returns:
+            list: the problems as 'FILE:LINE: severity: message' lines
+        """
+        lines = []
+        for line_num, severity, message in self.problems:
+            if severity == ERROR or warnings:
+                location = self.path if line_num is None else "{0}:{1}".format(self.path, line_num)
+                lines.append("{0}: {1}: {2}".format(location, severity, message))
+        return lines
+
+
+def split_movie(path, chunk_bytes=CHUNK_BYTES):
+    """
+    Splits a text movie into chunks of whole frames, only the line breaks are counted.
+
+    Args:
+        path (str): Path of the text movie
+        chunk_bytes (int): minimum chunk size, except for the last chunk
+
+    Returns:
+        list: (start offset, end offset, index of the first line) of each chunk
+    """
+    lines_per_frame = Movie()._frame_height + TimeBar.height
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return [(0, 0, 0)]
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        chunks = []
+        start = pos = first_line = line = 0
+        while pos < size:
+            end = min(pos + chunk_bytes, size)
+            line += buf[pos:end].count(b"\n")
+            pos = end
+            if pos < size and buf[pos - 1:pos] != b"\n":
+                pos, line = _next_line(buf, pos, size), line + 1
+            while line % lines_per_frame and pos < size:
+                pos, line = _next_line(buf, pos, size), line + 1
+            chunks.append((start, pos, first_line))
+            start, first_line = pos, line
+        return chunks
+    finally:
+        buf.close()
+
+
+def _next_line(buf, pos, size):
+    end = buf.find(b"\n", pos)
+    return size if end < 0 else end + 1
+
+
+def check_chunk(job):
+    """
+    Checks the frames of one chunk, runs in the worker processes.
+
+    Args:
+        job (tuple): path, start offset, end offset, index of the first line, screen width and height,
+                     whether to render the frames for compiling
+
+    Returns:
+        tuple: display times, frame payloads (None if not rendered) and problems of the chunk
+    """
+    path, start, end, first_line, width, height, render = job
+    movie = Movie(width, height)
+    lines_per_frame = movie._frame_height + TimeBar.height
+    encoding = locale.getpreferredencoding(False)
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    problems = []
+    lines = _decode_lines(data, encoding, first_line, problems)
+    # the same stripping as Movie.load, the amount of white space on the right is variable
+    lines = [line.rstrip() for line in lines]
+    display_times = [_check_delay(lines[index].strip(), first_line + index + 1, problems)
+                     for index in range(0, len(lines), lines_per_frame)]
+    # clean movies are checked with a single scan each, the lines are only looked at for a problem
+    if _CONTROL_BYTES.search(data) or max(map(len, lines or [u""])) > movie._frame_width:
+        for index, line in enumerate(lines):
+            if index % lines_per_frame:
+                _check_line(line, first_line + index + 1, movie._frame_width, problems)
+    if len(lines) % lines_per_frame:
+        problems.append((first_line + len(lines) - len(lines) % lines_per_frame + 1, WARNING,
+                         "last frame has {0} of {1} lines".format(len(lines) % lines_per_frame - 1,
+                                                                  lines_per_frame - 1)))
+    problems.sort(key=lambda problem: problem[0])
+    payloads = None
+    if render:
+        payloads = []
+        for frame_num, display_time in enumerate(display_times):
+            frame = Frame(display_time)
+            index = frame_num * lines_per_frame
+            frame.data = [movie._pad_line(line) for line in lines[index + 1:index + lines_per_frame]]
+            payloads.append(frame.encode())
+    return display_times, payloads, problems
+
+
+def _decode_lines(data, encoding, first_line, problems):
+    try:
+        lines = data.decode(encoding).split(u"\n")
+    except UnicodeDecodeError:
+        lines = []
+        for index, raw in enumerate(data.split(b"\n")):
+            try:
+                lines.append(raw.decode(encoding))
+            except UnicodeDecodeError as e:
+                problems.append((first_line + index + 1, ERROR,
+                                 "undecodable byte at column {0} ({1})".format(e.start + 1, encoding)))
+                lines.append(raw.decode(encoding, "replace"))
+    if lines[-1] == u"":
+        lines.pop()  # after the final line break
+    return lines
+
+
+def _check_line(line, line_num, frame_width, problems):
+    control = _CONTROL_CHARS.search(line)
+    if u"\r" in line:
+        # Movie.load reads in text mode, which splits lines at a carriage return as well
+        problems.append((line_num, ERROR, "carriage return within the line, it shifts all following frames"))
+    elif control:
+        problems.append((line_num, WARNING, "control character in column {0}".format(control.start() + 1)))
+    if len(line) > frame_width:
+        problems.append((line_num, WARNING, "line is {0} characters wide, frames are {1}".format(
+            len(line), frame_width)))
+
+
+def _check_delay(text, line_num, problems):
+    try:
+        delay = int(text)
+    except ValueError:
+        problems.append((line_num, ERROR, u"frame delay '{0}' is not a number".format(text)))
+        return 0
+    if delay < 0:
+        problems.append((line_num, ERROR, "frame delay {0} is negative".format(delay)))
+        return 0
+    if delay == 0:
+        problems.append((line_num, WARNING, "frame delay is 0, the frame is never shown"))
+    return delay
+
+
+def validate(paths, jobs=None, compile=False, width=80, height=24, chunk_bytes=CHUNK_BYTES):
+    """
+    Checks text movies with a pool of processes, the chunks of all movies are checked in parallel.
+
+    Args:
+        paths (list): Paths of the text movies
+        jobs (int): number of processes, defaults to the number of CPUs, 1 checks in this process
+        compile (bool): write a compiled movie (*.atm) beside each movie without errors
+        width (int): Screen width the compiled movies are centered for
+        height (int): Screen height the compiled movies are centered for
+        chunk_bytes (int): size of the chunks the movies are split into
+
+    Returns:
+        generator: a MovieReport for each movie, in the order of paths
+    """
+    chunk_counts, chunk_jobs, reports = [], [], []
+    for path in paths:
+        try:
+            chunks = split_movie(path, chunk_bytes)
+        except (IOError, OSError) as e:
+            report = MovieReport(path)
+            report.problems.append((None, ERROR, e.strerror or str(e)))
+            reports.append(report)
+            chunk_counts.append(0)
+            continue
+        reports.append(MovieReport(path))
+        chunk_counts.append(len(chunks))
+        chunk_jobs.extend((path, start, end, first_line, width, height, compile)
+                          for start, end, first_line in chunks)
+    jobs = jobs or cpu_count()
+    pool = Pool(jobs) if jobs > 1 and len(chunk_jobs) > 1 else None
+    try:
+        results = pool.imap(check_chunk, chunk_jobs) if pool else (check_chunk(job) for job in chunk_jobs)
+        for report, chunk_count in zip(reports, chunk_counts):
+            payloads = []
+            for _ in range(chunk_count):
+                display_times, chunk_payloads, problems = next(results)
+                report.display_times.extend(display_times)
+                report.problems.extend(problems)
+                if compile:
+                    payloads.extend(chunk_payloads)
+            if chunk_count and not report.display_times:
+                report.problems.append((None, ERROR, "no frames"))
+            if compile and not report.errors:
+                report.compiled = os.path.splitext(report.path)[0] + ".atm"
+                write_compiled(report.compiled, report.display_times, payloads, width, height)
+            yield report
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+
+def movie_paths(args):
+    """
+    Returns:
+        list: the given movie files, and the text movies (*.txt) of the given directories
+    """
+    paths = []
+    for arg in args:
+        if os.path.isdir(arg):
+            paths.extend(os.path.join(arg, name) for name in sorted(os.listdir(arg)) if name.endswith(".txt"))
+        else:
+            paths.append(arg)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="Usage: %prog [options] MOVIE_FILE|DIRECTORY...")
+    parser.add_option("-j", "--jobs", dest="jobs", type="int", default=None,
+                      help="Number of processes (default: number of CPUs)")
+    parser.add_option("-c", "--compile", dest="compile", action="store_true", default=False,
+                      help="Write a compiled movie (*.atm) beside each movie without errors")
+    parser.add_option("", "--width", dest="width", type="int", default=80,
+                      help="Screen width the compiled movies are centered for (default 80)")
+    parser.add_option("", "--height", dest="height", type="int", default=24,
+                      help="Screen height the compiled movies are centered for (default 24)")
+    parser.add_option("-q", "--quiet", dest="quiet", action="store_true", default=False,
+                      help="Report errors only")
+    options, args = parser.parse_args()
+    if not args:
+        parser.error("At least one movie file or directory is required.")
+    if options.jobs is not None and options.jobs < 1:
+        parser.error("--jobs must be at least 1.")
+    start = time.time()
+    movies = frames = errors = warnings = 0
+    for report in validate(movie_paths(args), options.jobs, options.compile, options.width, options.height):
+        for line in report.format_problems(warnings=not options.quiet):
+            print(line)
+        movies += 1
+        frames += len(report.display_times)
+        errors += report.errors
+        warnings += report.warnings
+    print("{0} movies, {1} frames, {2} errors, {3} warnings in {4:.2f}s".format(
+        movies, frames, errors, warnings, time.time() - start))
+    sys.exit(1 if errors else 0)
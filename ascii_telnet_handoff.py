@@ -0,0 +1,52 @@
+# coding=utf-8
+# !/usr/bin/env python
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+
+"""
+  Stub for inetd or xinetd, which hands the connection over to a resident server.
+
+  The server has to run with '--handoff-socket SOCKET'. The stub only imports the socket module
+  and exits right after the handoff, so a connection costs a few milliseconds instead of starting
+  a player, which parses the whole movie. When the server isn't running and a movie file is given,
+  the stub falls back to playing it with '--stdout'.
+
+  Usage: python -S ascii_telnet_handoff.py SOCKET [FILE]
+"""
+from __future__ import division, print_function
+
+import os
+import sys
+
+from ascii_telnet.ascii_handoff import send_socket
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("Usage: {0} SOCKET [FILE]".format(sys.argv[0]))
+    if not send_socket(sys.argv[1], sys.stdin.fileno()):
+        if len(sys.argv) < 3:
+            sys.exit("Error, no server is listening on {0}".format(sys.argv[1]))
+        server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ascii_telnet_server.py")
+        os.execv(sys.executable, [sys.executable, server, "--stdout", "-f", sys.argv[2]])
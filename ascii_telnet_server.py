@@ -43,16 +43,28 @@
 """
 from __future__ import division, print_function
 
+import codecs
 import os
 import sys
 from optparse import OptionParser
 
-from ascii_telnet.ascii_movie import Movie
-from ascii_telnet.ascii_player import VT100Player
+from ascii_telnet.ascii_admission import AdmissionControl
+from ascii_telnet.ascii_catalog import MovieCatalog
+from ascii_telnet.ascii_channel import BroadcastChannel
+from ascii_telnet.ascii_handoff import HANDOFF_SUPPORTED, listen
+from ascii_telnet.ascii_metrics import MetricsServer, server_stats
+from ascii_telnet.ascii_movie import movie_registry
+from ascii_telnet.ascii_player import RENDER_CACHE_BYTES, RenderCacheRegistry, VT100Player
+from ascii_telnet.ascii_prefork import PreforkSupervisor
+from ascii_telnet.ascii_restart import RESTART_SUPPORTED, GracefulRestart, bind, inherited_sockets, notify_ready
 from ascii_telnet.ascii_server import TelnetRequestHandler, ThreadedTCPServer
+from ascii_telnet.ascii_stdout import FrameWriter
 
 
-def runTcpServer(interface, port, filename):
+def runTcpServer(interface, port, filename, verbose=False, render_cache="lazy", engine="threads", channel=False,
+                 delta=False, stall_timeout=30.0, workers=1, reuse_port=False, render_cache_size=RENDER_CACHE_BYTES,
+                 metrics_port=None, compress=False, handoff_socket=None, max_connections=None, max_per_ip=None,
+                 degrade_at=None, drain_timeout=1200.0, pid_file=None, adaptive=False):
     """
     Start a TCP server that a client can connect to that streams the output of
      Ascii Player
@@ -60,27 +72,148 @@ def runTcpServer(interface, port, filename):
     Args:
         interface (str):  bind to this interface
         port (int): bind to this port
-        filename (str): file name of the ASCII movie
+        filename (str): file name of the ASCII movie, or a directory of movies the clients choose from
+        verbose (bool): print movie loading statistics
+        render_cache (str): 'off', 'lazy' or 'eager' rendering of the shared frame cache
+        engine (str): 'threads' for one thread per connection or 'asyncio' for a single event loop
+        channel (bool): broadcast one live playback to all connections, instead of a playback per connection
+        delta (bool): send only the changed parts of the screen
+        stall_timeout (float): seconds a client may not take any data, before it is disconnected
+        workers (int): number of server processes, more than one pre-forks worker processes
+        reuse_port (bool): with several workers, each worker binds the port itself using SO_REUSEPORT
+        render_cache_size (int): bytes of render caches to keep for all screen sizes, unlimited when None
+        metrics_port (int): serve Prometheus metrics on this port of localhost
+        compress (bool): offer MCCP2 compression to the clients
+        handoff_socket (str): also serve connections, which inetd stubs hand over on this Unix domain socket
+        max_connections (int): connections served at once per process, the others get a busy screen
+        max_per_ip (int): connections served at once per client IP and process
+        degrade_at (int): number of connections per process, from which on frame rate and bandwidth are lowered
+        drain_timeout (float): on SIGHUP the server restarts, and the old process finishes its connections
+                               for this many seconds at most
+        pid_file (str): write the process ID to this file, it changes on every restart
+        adaptive (bool): measure each client's round trip time and lower the frame rate on slow links
     """
-    TelnetRequestHandler.filename = filename
-    server = ThreadedTCPServer((interface, port), TelnetRequestHandler)
-    server.serve_forever()
+    catalog = None
+    movie = None
+    if os.path.isdir(filename):
+        # movies of a catalog are loaded, when a client chooses them first
+        catalog = MovieCatalog(filename)
+        if verbose:
+            print("Serving {0} movies from {1}".format(len(catalog.titles()), filename))
+    else:
+        # load the movie once upfront, every connection shares it
+        movie = movie_registry.get(filename)
+        if verbose:
+            print("Loaded {0} frames in {1:.0f} ms, using ~{2} KiB".format(len(movie.frames),
+                                                                         movie.load_time * 1000,
+                                                                         movie.memory_usage() // 1024))
+    caches = None
+    cache = None  # frames rendered for the movie's screen size
+    if render_cache != "off":
+        caches = RenderCacheRegistry(render_cache_size)
+        movie_registry.add_listener(caches.discard)  # reloaded and evicted movies
+    if movie is not None and caches is not None:
+        cache = caches.get(movie)
+        if render_cache == "eager":
+            cache.prerender()
+            if verbose:
+                print("Pre-rendered frames, using ~{0} KiB".format(cache.memory_usage() // 1024))
 
+    # sockets are bound before forking and the workers share them, after a restart they are inherited
+    inherited = inherited_sockets()
+    listener = inherited.get("telnet")
+    if listener is None and not (workers > 1 and reuse_port):
+        listener = bind((interface, port), reuse_port)
+    handoff = None
+    if handoff_socket:
+        handoff = inherited.get("handoff") or listen(handoff_socket)
 
-def runStdOut(filepath):
+    def create_server(sock=None):
+        # called in each worker process, threads like the channel's playback don't survive a fork
+        admission = None
+        if max_connections or max_per_ip or degrade_at:
+            admission = AdmissionControl(max_connections, max_per_ip, degrade_at)
+        live_channel = None
+        if channel:
+            live_channel = BroadcastChannel(movie, cache, delta)
+            live_channel.start()
+
+        if engine == "asyncio":
+            from ascii_telnet.ascii_async_server import AsyncTelnetServer
+            server = AsyncTelnetServer(interface, port, filename, caches, channel=live_channel, delta=delta,
+                                       stall_timeout=stall_timeout, sock=sock, reuse_port=reuse_port,
+                                       compress=compress, catalog=catalog, admission=admission,
+                                       adaptive=adaptive)
+        else:
+            TelnetRequestHandler.filename = filename
+            TelnetRequestHandler.catalog = catalog
+            TelnetRequestHandler.render_cache = caches
+            TelnetRequestHandler.channel = live_channel
+            TelnetRequestHandler.delta = delta
+            TelnetRequestHandler.compress = compress
+            TelnetRequestHandler.adaptive = adaptive
+            TelnetRequestHandler.stall_timeout = stall_timeout
+            ThreadedTCPServer.reuse_port = reuse_port
+            ThreadedTCPServer.admission = admission
+            server = ThreadedTCPServer((interface, port), TelnetRequestHandler, sock=sock)
+        if handoff is not None:
+            server.serve_handoffs(handoff)
+        return server
+
+    stats = server_stats.snapshot
+    try:
+        supervisor = None
+        server = None
+        if workers > 1:
+            supervisor = PreforkSupervisor(workers, create_server, (interface, port), reuse_port, verbose=verbose,
+                                           sock=listener, drain_timeout=drain_timeout)
+            stats = supervisor.stats
+        else:
+            server = create_server(listener)
+        metrics = None
+        if metrics_port:
+            metrics = MetricsServer(("127.0.0.1", metrics_port), stats, sock=inherited.get("metrics"))
+            metrics.start()
+            if verbose:
+                print("Serving metrics on http://127.0.0.1:{0}/metrics".format(metrics_port))
+        if handoff is not None and verbose:
+            print("Accepting connections from inetd on {0}".format(handoff_socket))
+
+        def stop_accepting():
+            # the new process is ready and serves the inherited sockets
+            if metrics is not None:
+                metrics.shutdown()
+                metrics.server_close()
+            if supervisor is not None:
+                supervisor.stop_accepting()
+            else:
+                server.stop_accepting(drain_timeout)
+
+        sockets = {"telnet": listener, "handoff": handoff, "metrics": metrics and metrics.socket}
+        GracefulRestart(dict((name, sock) for name, sock in sockets.items() if sock is not None), stop_accepting,
+                        verbose=verbose).install()
+        notify_ready(pid_file)
+        if supervisor is not None:
+            supervisor.serve_forever()
+        else:
+            server.serve_forever()
+    finally:
+        if verbose:
+            print("Frames dropped: {0}, clients evicted: {1}".format(stats().get("frames_dropped", 0),
+                                                                     stats().get("clients_evicted", 0)))
+
+
+def runStdOut(filepath, delta=False, encoding="utf-8"):
     """
     Stream the output of the Ascii Player to STDOUT
     Args:
         filepath (str): file path of the ASCII movie
+        delta (bool): send only the changed parts of the screen
+        encoding (str): encoding of the output, e.g. 'utf-8' or 'latin-1'
     """
-
-    def draw_frame_to_stdout(screen_buffer):
-        sys.stdout.write(screen_buffer.read().decode('iso-8859-15'))
-
-    movie = Movie()
-    movie.load(filepath)
-    player = VT100Player(movie)
-    player.draw_frame = draw_frame_to_stdout
+    movie = movie_registry.get(filepath)
+    player = VT100Player(movie, delta=delta)
+    player.draw_frame = FrameWriter(sys.stdout, encoding).write
     player.play()
 
 
@@ -91,17 +224,76 @@ if __name__ == "__main__":
                       help="Run as stand alone multi threaded TCP server (default)")
     parser.add_option("", "--stdout", dest="tcpserv", action="store_false",
                       help="Run with STDIN and STDOUT, for example in XINETD " +
-                           "instead of stand alone TCP server. " +
-                           "Use with python option '-u' for unbuffered " +
-                           "STDIN STDOUT communication")
+                           "instead of stand alone TCP server")
+    parser.add_option("", "--encoding", dest="encoding", metavar="ENCODING",
+                      help="With --stdout, the encoding of the output, e.g. 'latin-1' (default 'utf-8')")
     parser.add_option("-f", "--file", dest="filename", metavar="FILE",
-                      help="Text file containing the ASCII movie")
+                      help="Text file containing the ASCII movie, or a compiled movie (*.atm), " +
+                           "or a directory of movies, the viewers choose from")
+    parser.add_option("", "--shared-memory", dest="shared", action="store_true",
+                      help="Keep text movies compiled in shared memory, other server processes on this host " +
+                           "playing the same movie use the same copy")
+    parser.add_option("", "--movie-cache-size", dest="movie_cache_size", metavar="MB", type="int",
+                      help="Memory limit for the loaded movies of a directory, " +
+                           "the least recently watched movies are dropped (default unlimited)")
+    parser.add_option("", "--stream", dest="stream", action="store_true",
+                      help="Parse the movie while playing, so playback starts right away")
+    parser.add_option("", "--stream-window", dest="stream_window", metavar="FRAMES", type="int",
+                      help="With --stream, keep only this many parsed frames in memory (default all)")
     parser.add_option("-i", "--interface", dest="interface",
                       help="Bind to this interface (default '0.0.0.0', all interfaces)",
                       default="0.0.0.0")
     parser.add_option("-p", "--port", dest="port", metavar="PORT",
                       help="Bind to this port (default 23, Telnet)",
                       default=23, type="int")
+    parser.add_option("-w", "--workers", dest="workers", metavar="N", type="int",
+                      help="Number of server processes, to make use of several CPU cores (default 1)")
+    parser.add_option("", "--reuse-port", dest="reuse_port", action="store_true",
+                      help="With --workers, each worker binds the port itself using SO_REUSEPORT, " +
+                           "instead of sharing one listening socket")
+    parser.add_option("", "--engine", dest="engine", metavar="ENGINE",
+                      type="choice", choices=["threads", "asyncio"],
+                      help="Serve connections with 'threads' (default), one thread per " +
+                           "connection, or 'asyncio', a single event loop (Python 3.5+)")
+    parser.add_option("", "--channel", dest="channel", action="store_true",
+                      help="Broadcast the movie as a live channel in an endless loop, " +
+                           "all viewers watch the same playback")
+    parser.add_option("", "--delta", dest="delta", action="store_true",
+                      help="Send only the changed parts of the screen, saves bandwidth on slow links")
+    parser.add_option("", "--compress", dest="compress", action="store_true",
+                      help="Offer MCCP2 compression, which telnet clients of MUDs support")
+    parser.add_option("", "--adaptive", dest="adaptive", action="store_true",
+                      help="Measure each client's round trip time with telnet timing marks, and lower the " +
+                           "frame rate and send only the changed parts of the screen, when its link falls behind")
+    parser.add_option("", "--stall-timeout", dest="stall_timeout", metavar="SECONDS",
+                      help="Disconnect clients, which don't take any data for this long (default 30)",
+                      type="float")
+    parser.add_option("", "--max-connections", dest="max_connections", metavar="N", type="int",
+                      help="Connections served at once per process, others get a 'server busy' screen " +
+                           "(default unlimited)")
+    parser.add_option("", "--max-per-ip", dest="max_per_ip", metavar="N", type="int",
+                      help="Connections served at once from the same IP address per process (default unlimited)")
+    parser.add_option("", "--degrade-at", dest="degrade_at", metavar="N", type="int",
+                      help="From this many connections per process on, lower the frame rate and send only " +
+                           "the changed parts of the screen, until the load is gone (default never)")
+    parser.add_option("", "--render-cache", dest="render_cache", metavar="MODE",
+                      type="choice", choices=["off", "lazy", "eager"],
+                      help="Share rendered frames between connections: 'off', 'lazy' (default) " +
+                           "or 'eager' to render all frames at startup")
+    parser.add_option("", "--render-cache-size", dest="render_cache_size", metavar="MB", type="int",
+                      help="Memory limit for the rendered frames of all terminal sizes, " +
+                           "the least recently used sizes are dropped (default 64)")
+    parser.add_option("", "--metrics-port", dest="metrics_port", metavar="PORT", type="int",
+                      help="Serve Prometheus metrics on this port, only reachable from localhost")
+    parser.add_option("", "--handoff-socket", dest="handoff_socket", metavar="SOCKET",
+                      help="Also serve connections, which inetd hands over with ascii_telnet_handoff.py " +
+                           "on this Unix domain socket")
+    parser.add_option("", "--drain-timeout", dest="drain_timeout", metavar="SECONDS", type="float",
+                      help="On SIGHUP the server restarts without downtime: a new process takes over the " +
+                           "port and the old one finishes playing to its viewers for this long (default 1200, " +
+                           "Python 3)")
+    parser.add_option("", "--pid-file", dest="pid_file", metavar="FILE",
+                      help="Write the process ID to this file, it changes with every restart (Python 3)")
     parser.add_option("-v", "--verbose", action="store_true", dest="verbose",
                       help="Verbose (default for TCP server)")
     parser.add_option("-q", "--quiet", action="store_false", dest="verbose",
@@ -109,19 +301,54 @@ if __name__ == "__main__":
     parser.set_defaults(interface="0.0.0.0",
                         port=23,
                         tcpserv=True,
+                        workers=1,
+                        reuse_port=False,
+                        engine="threads",
+                        channel=False,
+                        delta=False,
+                        compress=False,
+                        adaptive=False,
+                        stream=False,
+                        encoding="utf-8",
+                        shared=False,
+                        stall_timeout=30.0,
+                        drain_timeout=1200.0,
+                        render_cache="lazy",
+                        render_cache_size=RENDER_CACHE_BYTES // (1024 * 1024),
                         verbose=True, )
     options = parser.parse_args()[0]
 
     if not (options.filename and os.path.exists(options.filename)):
         parser.exit(1, "Error, file not found! See --help for details.\n")
+    try:
+        codecs.lookup(options.encoding)
+    except LookupError:
+        parser.exit(1, "Error, unknown encoding {0}.\n".format(options.encoding))
+    if os.path.isdir(options.filename) and (options.channel or not options.tcpserv):
+        parser.exit(1, "Error, --channel and --stdout play a single movie file, not a directory.\n")
+    if options.handoff_socket and not HANDOFF_SUPPORTED:
+        parser.exit(1, "Error, --handoff-socket needs Python 3.\n")
+    if not RESTART_SUPPORTED and (options.pid_file or options.drain_timeout != parser.defaults["drain_timeout"]):
+        parser.exit(1, "Error, restarting without downtime (--pid-file, --drain-timeout) needs Python 3.\n")
+
+    movie_registry.streaming = options.stream
+    movie_registry.window = options.stream_window
+    movie_registry.shared = options.shared
+    movie_registry.max_bytes = options.movie_cache_size and options.movie_cache_size * 1024 * 1024
 
     try:
         if options.tcpserv:
             if options.verbose:
-                print("Running TCP server on {0}:{1}".format(options.interface, options.port))
+                print("Running {0} TCP server on {1}:{2}".format(options.engine, options.interface, options.port))
                 print("Playing movie {0}".format(options.filename))
-            runTcpServer(options.interface, options.port, options.filename)
+            runTcpServer(options.interface, options.port, options.filename, options.verbose,
+                         options.render_cache, options.engine, options.channel, options.delta,
+                         options.stall_timeout, options.workers, options.reuse_port,
+                         options.render_cache_size * 1024 * 1024,
+                         options.metrics_port, options.compress, options.handoff_socket,
+                         options.max_connections, options.max_per_ip, options.degrade_at,
+                         options.drain_timeout, options.pid_file, options.adaptive)
         else:
-            runStdOut(options.filename)
+            runStdOut(options.filename, options.delta, options.encoding)
     except KeyboardInterrupt:
         print("Ascii Player Quit.")
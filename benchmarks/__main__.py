@@ -0,0 +1,94 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+  Runs the microbenchmarks, the load test and the inetd startup benchmark and saves the results as JSON,
+  together with the revision, so runs of different revisions can be compared.
+
+  Usage: python -m benchmarks [-o results.json] [-- server options]
+         python -m benchmarks.compare baseline.json results.json
+"""
+from __future__ import division, print_function
+
+import json
+import platform
+import subprocess
+import time
+from optparse import OptionParser
+
+from benchmarks import load, micro, startup
+
+
+def revision():
+    """
+    Returns:
+        str: the git revision of the working tree, None outside a git checkout
+    """
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"],
+                                       stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="Usage: python -m benchmarks [options] [-- server options]")
+    parser.add_option("-f", "--file", dest="filename", metavar="FILE", default=micro.SW1,
+                      help="ASCII movie to benchmark with (default sample_movies/sw1.txt)")
+    parser.add_option("-c", "--clients", dest="clients", type="int", default=100,
+                      help="Number of simulated telnet clients (default 100)")
+    parser.add_option("-d", "--duration", dest="duration", type="float", default=10.0,
+                      help="Seconds the clients watch the movie (default 10)")
+    parser.add_option("-p", "--port", dest="port", type="int", default=2399,
+                      help="Port for the server under test (default 2399)")
+    parser.add_option("-n", "--startup-runs", dest="startup_runs", type="int", default=10,
+                      help="Connections to start for the inetd startup benchmark, 0 to skip it (default 10)")
+    parser.add_option("-o", "--output", dest="output", metavar="FILE", default="benchmark.json",
+                      help="Save the results as JSON (default benchmark.json)")
+    options, args = parser.parse_args()
+    if load.unsupported_options(args):
+        parser.error("Frames can't be counted with {0}, the frames leave out the time bar or are skipped.".format(
+            " ".join(load.unsupported_options(args))))
+
+    results = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "micro": micro.run(options.filename),
+    }
+    micro.report(results["micro"])
+    print()
+    results["load"] = load.run(options.clients, options.duration, options.filename, options.port, args)
+    load.report(results["load"])
+    if options.startup_runs:
+        print()
+        results["startup"] = startup.run(options.startup_runs, options.filename, options.port)
+        startup.report(results["startup"])
+    with open(options.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print("Saved results to {0}".format(options.output))
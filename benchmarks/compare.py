@@ -0,0 +1,98 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+  Compares two benchmark results and fails, when the second one regressed.
+
+  Usage: python -m benchmarks.compare [-t PERCENT] baseline.json results.json
+"""
+from __future__ import division, print_function
+
+import json
+import sys
+from optparse import OptionParser
+
+# results, which are better when higher, everything else is a duration or a resource
+HIGHER_IS_BETTER = ("connections_per_sec", "bytes_per_sec")
+# results, which describe the run instead of measuring it
+IGNORED = ("clients", "duration", "frames_received", "runs")
+
+
+def flatten(results, prefix=""):
+    """
+    Returns:
+        dict: "section.name" -> number, for all numbers in the nested results
+    """
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + name] = value
+    return flat
+
+
+def compare(baseline, results, threshold=10.0):
+    """
+    Args:
+        baseline (dict): results of the reference run
+        results (dict): results of the run to check
+        threshold (float): percentage a result may get worse, before it counts as regression
+
+    Returns:
+        list: (name, baseline value, value, change in percent, regressed) tuples
+    """
+    baseline, results = flatten(baseline), flatten(results)
+    rows = []
+    for name in sorted(set(baseline) & set(results)):
+        if name.split(".")[-1] in IGNORED:
+            continue
+        old, new = baseline[name], results[name]
+        change = (new - old) / old * 100 if old else 0.0
+        worse = -change if any(key in name for key in HIGHER_IS_BETTER) else change
+        rows.append((name, old, new, change, worse > threshold))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="Usage: python -m benchmarks.compare [options] baseline.json results.json")
+    parser.add_option("-t", "--threshold", dest="threshold", type="float", default=10.0,
+                      help="Percentage a result may get worse, before it counts as regression (default 10)")
+    options, args = parser.parse_args()
+    if len(args) != 2:
+        parser.error("Expected two result files.")
+    with open(args[0]) as f:
+        baseline = json.load(f)
+    with open(args[1]) as f:
+        results = json.load(f)
+
+    rows = compare(baseline, results, options.threshold)
+    for name, old, new, change, regressed in rows:
+        print("{0:<40} {1:>14.6g} {2:>14.6g} {3:>+8.1f}%{4}".format(name, old, new, change,
+                                                                 "  REGRESSION" if regressed else ""))
+    if any(row[-1] for row in rows):
+        sys.exit(1)
@@ -0,0 +1,255 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+  Load generator, which plays the movie to many simulated telnet clients at once.
+  The server runs as a separate process, so its CPU time and memory can be measured.
+
+  Usage: python -m benchmarks.load [-c CLIENTS] [-d SECONDS] [-o results.json] [-- server options]
+"""
+from __future__ import division, print_function
+
+import errno
+import json
+import os
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+from ascii_telnet.ascii_movie import Movie
+from ascii_telnet.ascii_protocol import IAC, NAWS, SB, SE, WILL
+
+SERVER = os.path.join(os.path.dirname(__file__), "..", "ascii_telnet_server.py")
+SW1 = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "sw1.txt")
+
+# the client's answer to the server's NAWS request: an 80x24 window
+WINDOW_SIZE = bytes(bytearray([IAC, WILL, NAWS, IAC, SB, NAWS, 0, 80, 0, 24, IAC, SE]))
+# every full frame draws the time bar in the last row
+FRAME_MARKER = b"\x1b[24;"
+# server options, which send frames without the time bar (delta frames leave unchanged rows out, an
+# unchanged frame is no bytes at all) or skip frames, so the frames and their jitter can't be measured
+UNSUPPORTED_OPTIONS = ("--delta", "--degrade-at", "--adaptive")
+
+
+class Client(object):
+    def __init__(self, sock):
+        """
+        One simulated telnet client, which records when frames arrive.
+        """
+        self.sock = sock
+        self.bytes_received = 0
+        self.frame_times = []
+        self._tail = b""  # end of the last chunk, in case a frame marker is split
+
+    def receive(self, now):
+        """
+        Returns:
+            bool: False, when the server closed the connection
+        """
+        try:
+            data = self.sock.recv(65536)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return True
+            return False
+        if not data:
+            return False
+        self.bytes_received += len(data)
+        data = self._tail + data
+        self.frame_times.extend([now] * data.count(FRAME_MARKER))
+        self._tail = data[-len(FRAME_MARKER) + 1:]
+        return True
+
+
+def percentiles(values, points=(50, 90, 99, 100)):
+    """
+    Returns:
+        dict: "p50" etc. -> value, using the nearest rank
+    """
+    values = sorted(values)
+    result = {}
+    for point in points:
+        rank = max(int(round(point / 100 * len(values))) - 1, 0)
+        result["p{0}".format(point)] = values[rank] if values else 0.0
+    return result
+
+
+def jitter(frame_times, frame_ends, fps=15):
+    """
+    Compares the arrival of each frame with the movie's schedule, starting at the first frame.
+
+    Args:
+        frame_times (list): arrival time of each frame
+        frame_ends (array): the movie's time index, see Movie.frame_ends()
+
+    Returns:
+        list: seconds each frame arrived off schedule
+    """
+    deviations = []
+    for index, arrival in enumerate(frame_times[1:len(frame_ends)]):
+        expected = frame_times[0] + frame_ends[index] / fps
+        deviations.append(abs(arrival - expected))
+    return deviations
+
+
+def unsupported_options(server_args):
+    """
+    Returns:
+        list: the server options, with which the frames can't be counted, see UNSUPPORTED_OPTIONS
+    """
+    return [arg for arg in server_args if arg.split("=")[0] in UNSUPPORTED_OPTIONS]
+
+
+def start_server(filepath, port, server_args):
+    server = subprocess.Popen([sys.executable, SERVER, "-f", filepath, "-i", "127.0.0.1", "-p", str(port), "-q"] +
+                              list(server_args), stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 1).close()
+            return server
+        except socket.error:
+            if server.poll() is not None:
+                raise RuntimeError("The server exited with status {0}".format(server.returncode))
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("The server didn't start listening on port {0}".format(port))
+
+
+def server_usage(server):
+    """
+    Stops the server and measures the resources it used, see getrusage(2).
+
+    Returns:
+        dict: CPU seconds and the peak resident memory in bytes
+    """
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    server.terminate()
+    server.wait()
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in KiB on Linux, but in bytes on macOS
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "cpu_seconds": (after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime),
+        "max_rss_bytes": after.ru_maxrss * rss_unit,
+    }
+
+
+def run(clients=100, duration=10.0, filepath=SW1, port=2399, server_args=()):
+    """
+    Starts the server, connects the clients and lets them watch for the given time.
+
+    Returns:
+        dict: the measured results
+    """
+    if unsupported_options(server_args):
+        raise ValueError("Frames can't be counted with {0}".format(" ".join(unsupported_options(server_args))))
+    movie = Movie()
+    movie.load(filepath)
+    frame_ends = movie.frame_ends()
+    server = start_server(filepath, port, server_args)
+    selector = selectors.DefaultSelector()
+    connected = []
+    try:
+        start = time.time()
+        for _ in range(clients):
+            sock = socket.create_connection(("127.0.0.1", port))
+            sock.sendall(WINDOW_SIZE)
+            sock.setblocking(False)
+            client = Client(sock)
+            connected.append(client)
+            selector.register(sock, selectors.EVENT_READ, client)
+        connect_time = time.time() - start
+
+        open_clients = len(connected)
+        deadline = time.time() + duration
+        while open_clients and time.time() < deadline:
+            for key, _ in selector.select(deadline - time.time()):
+                if not key.data.receive(time.time()):
+                    selector.unregister(key.fileobj)
+                    open_clients -= 1
+        watch_time = time.time() - start - connect_time
+    finally:
+        for client in connected:
+            client.sock.close()
+        selector.close()
+        usage = server_usage(server)
+
+    deviations = []
+    for client in connected:
+        deviations.extend(jitter(client.frame_times, frame_ends))
+    bytes_received = sum(client.bytes_received for client in connected)
+    result = {
+        "clients": clients,
+        "duration": watch_time,
+        "connections_per_sec": clients / connect_time if connect_time else 0.0,
+        "bytes_per_sec": bytes_received / watch_time,
+        "frames_received": sum(len(client.frame_times) for client in connected),
+        "jitter_seconds": percentiles(deviations),
+        "server_args": list(server_args),
+    }
+    result.update(usage)
+    result["cpu_percent"] = 100 * usage["cpu_seconds"] / watch_time
+    return result
+
+
+def report(result):
+    print("{0} clients, {1:.1f} s".format(result["clients"], result["duration"]))
+    print("connections/sec   {0:>12.0f}".format(result["connections_per_sec"]))
+    print("bytes/sec         {0:>12.0f}".format(result["bytes_per_sec"]))
+    print("frames received   {0:>12}".format(result["frames_received"]))
+    print("jitter ms         " + "  ".join("{0} {1:.1f}".format(name, seconds * 1000)
+                                            for name, seconds in sorted(result["jitter_seconds"].items())))
+    print("server CPU        {0:>11.1f}%".format(result["cpu_percent"]))
+    print("server max RSS    {0:>9} KiB".format(result["max_rss_bytes"] // 1024))
+
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="Usage: python -m benchmarks.load [options] [-- server options]")
+    parser.add_option("-c", "--clients", dest="clients", type="int", default=100,
+                      help="Number of simulated telnet clients (default 100)")
+    parser.add_option("-d", "--duration", dest="duration", type="float", default=10.0,
+                      help="Seconds the clients watch the movie (default 10)")
+    parser.add_option("-f", "--file", dest="filename", metavar="FILE", default=SW1,
+                      help="ASCII movie to play (default sample_movies/sw1.txt)")
+    parser.add_option("-p", "--port", dest="port", type="int", default=2399,
+                      help="Port for the server under test (default 2399)")
+    parser.add_option("-o", "--output", dest="output", metavar="FILE",
+                      help="Save the results as JSON")
+    options, args = parser.parse_args()
+    if unsupported_options(args):
+        parser.error("Frames can't be counted with {0}, the frames leave out the time bar or are skipped.".format(
+            " ".join(unsupported_options(args))))
+    result = run(options.clients, options.duration, options.filename, options.port, args)
+    report(result)
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump({"load": result}, f, indent=2, sort_keys=True)
@@ -0,0 +1,203 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+  Microbenchmarks of the movie loading and the frame rendering.
+
+  Usage: python -m benchmarks.micro [-f MOVIE] [-o results.json]
+"""
+from __future__ import division, print_function
+
+import json
+import os
+import time
+import tracemalloc
+from optparse import OptionParser
+
+from ascii_telnet.ascii_movie import Movie, TimeBar
+from ascii_telnet.ascii_player import FrameRenderCache, VT100Player
+from ascii_telnet.ascii_scheduler import VirtualClock
+from ascii_telnet.ascii_stdout import FrameWriter
+
+try:
+    timer = time.perf_counter
+except AttributeError:  # Py2
+    timer = time.time
+
+SW1 = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "sw1.txt")
+
+
+def measure(func, repeat=5, number=1):
+    """
+    Runs func number times per round, for the given rounds.
+
+    Returns:
+        dict: best and mean seconds per call
+    """
+    rounds = []
+    for _ in range(repeat):
+        start = timer()
+        for _ in range(number):
+            func()
+        rounds.append((timer() - start) / number)
+    return {"best": min(rounds), "mean": sum(rounds) / len(rounds)}
+
+
+def bench_movie_load(filepath, repeat=5):
+    def load():
+        Movie().load(filepath)
+
+    return measure(load, repeat)
+
+
+def bench_movie_memory(filepath):
+    """
+    Returns:
+        dict: bytes allocated for a loaded movie, as traced by tracemalloc
+    """
+    tracemalloc.start()
+    try:
+        movie = Movie()
+        movie.load(filepath)
+        allocated, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"bytes": allocated, "peak_bytes": peak}
+
+
+def bench_load_frame(movie, repeat=5, render_cache=None, delta=False):
+    """
+    Returns:
+        dict: best and mean seconds per frame for VT100Player._load_frame
+    """
+    frames = movie.frames
+    frame_ends = movie.frame_ends()
+
+    def play():
+        player = VT100Player(movie, render_cache, delta)
+        player.draw_frame = lambda screen_buffer: None
+        for index, frame in enumerate(frames):
+            player._load_frame(frame, frame_ends[index], index)
+
+    result = measure(play, repeat)
+    return dict((name, seconds / len(frames)) for name, seconds in result.items())
+
+
+def bench_play(movie, repeat=5, render_cache=None):
+    """
+    Plays the whole movie with a virtual clock, including the player's scheduling.
+
+    Returns:
+        dict: best and mean seconds per frame
+    """
+    def play():
+        player = VT100Player(movie, render_cache, clock=VirtualClock())
+        player.draw_frame = lambda screen_buffer: None
+        player.play()
+
+    result = measure(play, repeat)
+    return dict((name, seconds / len(movie.frames)) for name, seconds in result.items())
+
+
+def bench_stdout(movie, repeat=5):
+    """
+    Plays the whole movie with a virtual clock to /dev/null, the way --stdout writes the frames.
+
+    Returns:
+        dict: best and mean seconds per frame
+    """
+    with open(os.devnull, "w") as devnull:
+        writer = FrameWriter(devnull)
+
+        def play():
+            player = VT100Player(movie, clock=VirtualClock())
+            player.draw_frame = writer.write
+            player.play()
+
+        result = measure(play, repeat)
+    return dict((name, seconds / len(movie.frames)) for name, seconds in result.items())
+
+
+def bench_timebar(movie, repeat=5, number=10000):
+    timebar = TimeBar(movie.duration, movie.screen_width)
+    positions = [frame_pos % movie.duration for frame_pos in range(0, number * 7, 7)]
+
+    def get_timebars():
+        for frame_pos in positions:
+            timebar.get_timebar(frame_pos)
+
+    result = measure(get_timebars, repeat)
+    return dict((name, seconds / number) for name, seconds in result.items())
+
+
+def run(filepath=SW1, repeat=5):
+    """
+    Runs all microbenchmarks.
+
+    Returns:
+        dict: benchmark name -> best and mean seconds per operation, or bytes for memory benchmarks
+    """
+    movie = Movie()
+    movie.load(filepath)
+    cache = FrameRenderCache(movie)
+    cache.prerender()
+    return {
+        "movie_load": bench_movie_load(filepath, repeat),
+        "movie_memory": bench_movie_memory(filepath),
+        "load_frame": bench_load_frame(movie, repeat),
+        "load_frame_cached": bench_load_frame(movie, repeat, cache),
+        "load_frame_delta": bench_load_frame(movie, repeat, cache, delta=True),
+        "play_cached": bench_play(movie, repeat, cache),
+        "play_stdout": bench_stdout(movie, repeat),
+        "get_timebar": bench_timebar(movie, repeat),
+    }
+
+
+def report(results):
+    for name, result in sorted(results.items()):
+        if "bytes" in result:
+            print("{0:<20} {1:>10} KiB   peak {2:>10} KiB".format(name, result["bytes"] // 1024,
+                                                               result["peak_bytes"] // 1024))
+            continue
+        print("{0:<20} best {1:>10.2f} us   mean {2:>10.2f} us".format(name, result["best"] * 1e6,
+                                                                  result["mean"] * 1e6))
+
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="Usage: python -m benchmarks.micro [options]")
+    parser.add_option("-f", "--file", dest="filename", metavar="FILE", default=SW1,
+                      help="ASCII movie to benchmark with (default sample_movies/sw1.txt)")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int", default=5,
+                      help="Rounds per benchmark, the best round counts (default 5)")
+    parser.add_option("-o", "--output", dest="output", metavar="FILE",
+                      help="Save the results as JSON")
+    options = parser.parse_args()[0]
+    results = run(options.filename, options.repeat)
+    report(results)
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump({"micro": results}, f, indent=2, sort_keys=True)
@@ -0,0 +1,137 @@
+# coding=utf-8
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  Copyright (c) 2008, Martin W. Kirst All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#  Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+#  IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+#  TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+#  PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+#  TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+#  PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+#  LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+#  NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+#  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+  Measures the startup of a connection under inetd: the time to the first frame and the memory
+  of the process, which inetd starts for each connection. Either that process plays the movie
+  itself (--stdout), or it's the stub, which hands the connection over to a resident server.
+
+  Usage: python -m benchmarks.startup [-n RUNS] [-o results.json]
+"""
+from __future__ import division, print_function
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+from benchmarks.load import FRAME_MARKER, SERVER, SW1, WINDOW_SIZE, percentiles, start_server
+
+STUB = os.path.join(os.path.dirname(__file__), "..", "ascii_telnet_handoff.py")
+
+
+def first_frame(command, timeout=30.0):
+    """
+    Starts the command like inetd does, with a connected socket as stdin and stdout,
+    and waits for the first frame.
+
+    Returns:
+        tuple: (seconds to the first frame, peak resident memory of the process in bytes)
+    """
+    client, server_side = socket.socketpair()
+    client.sendall(WINDOW_SIZE)  # the answer to the NAWS request, a real client sends it right away as well
+    client.settimeout(timeout)
+    start = time.time()
+    process = subprocess.Popen(command, stdin=server_side, stdout=server_side)
+    server_side.close()
+    data = b""
+    try:
+        while FRAME_MARKER not in data:
+            chunk = client.recv(65536)
+            if not chunk:
+                raise RuntimeError("No frame received from {0}".format(" ".join(command)))
+            data += chunk
+        seconds = time.time() - start
+    finally:
+        client.close()
+        if process.poll() is None:
+            process.kill()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = status
+    # ru_maxrss is in KiB on Linux, but in bytes on macOS
+    return seconds, usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def measure(command, runs):
+    seconds, rss = zip(*[first_frame(command) for _ in range(runs)])
+    return {
+        "first_frame_seconds": percentiles(seconds),
+        "max_rss_bytes": sorted(rss)[len(rss) // 2],
+    }
+
+
+def run(runs=10, filepath=SW1, port=2399):
+    """
+    Measures both ways to serve inetd connections, the resident server is started beforehand.
+
+    Returns:
+        dict: the measured results
+    """
+    results = {"runs": runs, "stdout": measure([sys.executable, SERVER, "--stdout", "-f", filepath], runs)}
+    socket_path = os.path.join(tempfile.mkdtemp(), "handoff.sock")
+    server = start_server(filepath, port, ["--handoff-socket", socket_path])
+    try:
+        results["handoff"] = measure([sys.executable, "-S", STUB, socket_path], runs)
+    finally:
+        server.terminate()
+        server.wait()
+        os.unlink(socket_path)
+        os.rmdir(os.path.dirname(socket_path))
+    return results
+
+
+def report(results):
+    print("inetd startup, {0} runs".format(results["runs"]))
+    for name in ("stdout", "handoff"):
+        result = results[name]
+        print("{0:<8} first frame ms  {1}   max RSS {2:>6} KiB".format(
+            name, "  ".join("{0} {1:.1f}".format(point, seconds * 1000)
+                            for point, seconds in sorted(result["first_frame_seconds"].items(),
+                                                                    key=lambda item: int(item[0][1:]))),
+            result["max_rss_bytes"] // 1024))
+
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="Usage: python -m benchmarks.startup [options]")
+    parser.add_option("-n", "--runs", dest="runs", type="int", default=10,
+                      help="Connections to start each way (default 10)")
+    parser.add_option("-f", "--file", dest="filename", metavar="FILE", default=SW1,
+                      help="ASCII movie to play (default sample_movies/sw1.txt)")
+    parser.add_option("-p", "--port", dest="port", type="int", default=2399,
+                      help="Port for the resident server (default 2399)")
+    parser.add_option("-o", "--output", dest="output", metavar="FILE",
+                      help="Save the results as JSON")
+    options = parser.parse_args()[0]
+    results = run(options.runs, options.filename, options.port)
+    report(results)
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump({"startup": results}, f, indent=2, sort_keys=True)
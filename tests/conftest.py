@@ -0,0 +1,11 @@
+# coding=utf-8
+import sys
+
+# the asyncio engine is written with async/await, which older interpreters can't even parse
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append("test_async_server.py")
+
+# the benchmarks use selectors and tracemalloc
+if sys.version_info < (3, 4):
+    collect_ignore.append("test_benchmarks.py")
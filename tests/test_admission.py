@@ -0,0 +1,90 @@
+# coding=utf-8
+from __future__ import division
+
+import os
+import socket
+
+import pytest
+
+from ascii_telnet.ascii_admission import BUSY_SCREEN, AdmissionControl, client_ip, reject
+from ascii_telnet.ascii_metrics import server_stats
+from ascii_telnet.ascii_movie import Movie
+from ascii_telnet.ascii_player import VT100Player
+from ascii_telnet.ascii_scheduler import VirtualClock
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+class TestAdmissionControl(object):
+    def test_max_connections(self):
+        admission = AdmissionControl(max_connections=2)
+        rejected = server_stats.connections_rejected
+        assert admission.admit("10.0.0.1")
+        assert admission.admit("10.0.0.2")
+        assert not admission.admit("10.0.0.3")
+        assert server_stats.connections_rejected == rejected + 1
+        admission.release("10.0.0.1")
+        assert admission.admit("10.0.0.3")
+
+    def test_max_per_ip(self):
+        admission = AdmissionControl(max_per_ip=1)
+        assert admission.admit("10.0.0.1")
+        assert not admission.admit("10.0.0.1")
+        assert admission.admit("10.0.0.2")
+        admission.release("10.0.0.1")
+        assert admission.admit("10.0.0.1")
+
+    def test_degraded(self):
+        admission = AdmissionControl(degrade_at=2)
+        admission.admit("10.0.0.1")
+        assert not admission.degraded
+        admission.admit("10.0.0.1")
+        assert admission.degraded
+        admission.release("10.0.0.1")
+        assert not admission.degraded
+        assert not AdmissionControl().degraded
+
+    def test_client_ip(self):
+        assert client_ip(("10.0.0.1", 2323)) == "10.0.0.1"
+        assert client_ip("") == ""
+
+    def test_reject(self):
+        server_side, client = socket.socketpair()
+        client.sendall(b"unread input")
+        reject(server_side)
+        assert client.recv(1000) == BUSY_SCREEN
+        assert client.recv(1000) == b""
+
+
+class TestDegradedPlayer(object):
+    def setup_method(self, method):
+        self.movie = Movie()
+        self.movie.load(SHORT_INTRO)
+
+    def play(self, player):
+        clock = player.clock
+        shown = []
+        player.draw_frame = lambda screen_buffer: shown.append(clock.now())
+        player.play()
+        return shown
+
+    def test_frames_are_merged(self):
+        normal = self.play(VT100Player(self.movie, clock=VirtualClock()))
+        player = VT100Player(self.movie, clock=VirtualClock())
+        player.degrade(True)
+        degraded = self.play(player)
+        assert len(degraded) < len(normal)
+        # at most 5 frames per second, the movie still takes as long
+        assert all(b - a >= 3 / 15 - 1e-9 for a, b in zip(degraded[:-2], degraded[1:-1]))
+        assert player.clock.now() == pytest.approx(self.movie.duration / 15)
+
+    def test_delta_is_restored(self):
+        player = VT100Player(self.movie)
+        player.degrade(True)
+        assert player.delta is not None and player.min_frame_cycles == player.degraded_frame_cycles
+        player.degrade(False)
+        assert player.delta is None and player.min_frame_cycles == 1
+        player = VT100Player(self.movie, delta=True)
+        player.degrade(True)
+        player.degrade(False)
+        assert player.delta is not None
@@ -0,0 +1,220 @@
+# coding=utf-8
+import asyncio
+import os
+import shutil
+import socket
+import threading
+import time
+
+import pytest
+
+from ascii_telnet.ascii_admission import BUSY_SCREEN, AdmissionControl
+from ascii_telnet.ascii_async_server import AsyncTelnetServer, _Connection
+from ascii_telnet.ascii_catalog import MovieCatalog
+from ascii_telnet.ascii_channel import BroadcastChannel
+from ascii_telnet.ascii_metrics import server_stats
+from ascii_telnet.ascii_movie import Movie
+from ascii_telnet.ascii_protocol import CHARACTER_MODE, DO_NAWS
+
+SAMPLE_MOVIES = os.path.join(os.path.dirname(__file__), "..", "sample_movies")
+SHORT_INTRO = os.path.join(SAMPLE_MOVIES, "short_intro.txt")
+SW1 = os.path.join(SAMPLE_MOVIES, "sw1.txt")
+NAWS_100X30 = b"\xff\xfb\x1f\xff\xfa\x1f\x00\x64\x00\x1e\xff\xf0"  # WILL NAWS, 100x30
+
+
+@pytest.fixture
+def serve():
+    """
+    Runs AsyncTelnetServers on free ports in background threads.
+    """
+    servers = []
+
+    def start(filename=SHORT_INTRO, **kwargs):
+        kwargs.setdefault("naws_timeout", 0.05)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(16)
+        server = AsyncTelnetServer("127.0.0.1", 0, filename, sock=sock, **kwargs)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        servers.append((server, thread))
+        return server
+
+    yield start
+    for server, thread in servers:
+        if not server._loop.is_closed():
+            server.stop_accepting(5)
+            thread.join(10)
+
+
+@pytest.fixture
+def fast_movie(tmpdir):
+    """
+    A movie, which changes on every frame cycle.
+    """
+    path = tmpdir.join("fast.txt")
+    path.write("".join("1\n" + "".join("{0:67d}\n".format(i * 13 + row) for row in range(13)) for i in range(1000)))
+    return str(path)
+
+
+def connect(server, rcvbuf=None):
+    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if rcvbuf is not None:
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    client.connect(server.sock.getsockname())
+    client.settimeout(5)
+    return client
+
+
+def receive(client, until, limit=1000000):
+    data = b""
+    while until not in data and len(data) < limit:
+        chunk = client.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+class TestAsyncTelnetServer(object):
+    def test_frames_are_sent(self, serve):
+        client = connect(serve())
+        frames_sent = server_stats.frames_sent
+        assert client.recv(len(DO_NAWS + CHARACTER_MODE)) == DO_NAWS + CHARACTER_MODE
+        data = receive(client, b"\x1b[24;1H")
+        assert data.startswith(b"\x1b[2J")  # clear screen before the first frame
+        assert server_stats.frames_sent > frames_sent
+        client.close()
+
+    def test_movie_to_the_end(self, serve):
+        movie = Movie()
+        movie.load(SHORT_INTRO)
+        client = connect(serve())
+        data = receive(client, b"not in the movie")
+        assert data.count(b"\x1b[24;1H") == len(movie.frames)
+        client.close()
+
+    def test_negotiated_window_size(self, serve):
+        client = connect(serve(naws_timeout=5))
+        client.sendall(NAWS_100X30)
+        data = receive(client, b"\x1b[30;1H")
+        assert b"\x1b[30;1H" in data
+        assert b"\x1b[24;1H" not in data
+        client.close()
+
+    def test_movie_chosen_from_menu(self, serve, tmpdir):
+        shutil.copy(SHORT_INTRO, str(tmpdir.join("intro.txt")))
+        client = connect(serve(catalog=MovieCatalog(str(tmpdir))))
+        assert b"1) intro" in receive(client, b"1) intro")
+        client.sendall(b"1\r")
+        assert b"\x1b[24;1H" in receive(client, b"\x1b[24;1H")
+        client.close()
+
+    def test_busy_screen(self, serve):
+        rejected = server_stats.connections_rejected
+        client = connect(serve(admission=AdmissionControl(max_connections=0)))
+        assert receive(client, b"not on the busy screen") == BUSY_SCREEN
+        assert server_stats.connections_rejected == rejected + 1
+        client.close()
+
+    def test_stale_frames_are_dropped(self, serve, fast_movie):
+        dropped = server_stats.frames_dropped
+        client = connect(serve(fast_movie, send_buffer_bytes=4096), rcvbuf=4096)
+        try:
+            wait_for(lambda: server_stats.frames_dropped > dropped)
+        finally:
+            client.close()
+
+    def test_stalled_client_is_evicted(self, serve, fast_movie):
+        evicted = server_stats.clients_evicted
+        client = connect(serve(fast_movie, send_buffer_bytes=4096, stall_timeout=0.2), rcvbuf=4096)
+        try:
+            wait_for(lambda: server_stats.clients_evicted > evicted)
+        finally:
+            client.close()
+
+    def test_channel_fan_out(self, serve):
+        movie = Movie()
+        movie.load(SW1)
+        channel = BroadcastChannel(movie)
+        channel.start()
+        try:
+            server = serve(channel=channel)
+            clients = [connect(server) for _ in range(2)]
+            for client in clients:
+                assert receive(client, b"\x1b[24;1H").startswith(b"\x1b[2J")  # the sync frame
+            for client in clients:
+                # then the live frames, the very same for all viewers
+                assert b"\x1b[24;1H" in receive(client, b"\x1b[24;1H")
+                client.close()
+        finally:
+            channel.stop()
+
+    def test_drain(self, serve, monkeypatch):
+        monkeypatch.setattr(server_stats, "connections_active", 0)  # other tests' handlers are never finished
+        server = serve(SW1)
+        client = connect(server)
+        receive(client, b"\x1b[24;1H")
+        server.stop_accepting()
+        wait_for(lambda: server._draining)
+        with pytest.raises(socket.error):
+            connect(server)
+        # the connection in progress keeps playing
+        assert b"\x1b[24;1H" in receive(client, b"\x1b[24;1H")
+        client.close()
+        wait_for(server._loop.is_closed)
+
+
+class TestConnection(object):
+    def test_newest_frame_is_kept(self):
+        server_side, client = socket.socketpair()
+        loop = asyncio.new_event_loop()
+
+        async def write_frames():
+            writer = (await asyncio.open_connection(sock=server_side))[1]
+            connection = _Connection(writer)
+            for i in range(100):
+                assert connection.write(b"x" * 10000 + str(i).encode())
+            return connection
+
+        try:
+            dropped = server_stats.frames_dropped
+            connection = loop.run_until_complete(write_frames())
+            assert connection._pending[0].endswith(b"99")
+            assert server_stats.frames_dropped > dropped
+            client.setblocking(False)
+            data = b""
+            while not data.endswith(b"99"):
+                loop.run_until_complete(asyncio.sleep(0.01))
+                try:
+                    data += client.recv(1000000)
+                except socket.error:
+                    pass
+            assert connection._pending is None
+            assert data.count(b"x" * 10000) < 100
+        finally:
+            client.close()
+            loop.close()
+
+    def test_dropped_delta_requires_full_frame(self):
+        server_side, client = socket.socketpair()
+        loop = asyncio.new_event_loop()
+
+        async def write_frames():
+            writer = (await asyncio.open_connection(sock=server_side))[1]
+            connection = _Connection(writer)
+            return [connection.write(b"x" * 10000, is_delta=True) for _ in range(100)]
+
+        try:
+            assert False in loop.run_until_complete(write_frames())
+        finally:
+            client.close()
+            loop.close()
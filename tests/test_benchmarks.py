@@ -0,0 +1,58 @@
+# coding=utf-8
+import os
+
+import pytest
+
+from benchmarks import compare, load, micro, startup
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+class TestBenchmarks(object):
+    def test_micro(self):
+        results = micro.run(SHORT_INTRO, repeat=1)
+        memory = results.pop("movie_memory")
+        assert 0 < memory["bytes"] <= memory["peak_bytes"]
+        assert set(results) == {"movie_load", "load_frame", "load_frame_cached", "load_frame_delta",
+                                "play_cached", "play_stdout", "get_timebar"}
+        assert all(0 < result["best"] <= result["mean"] for result in results.values())
+
+    def test_percentiles(self):
+        assert load.percentiles(list(range(1, 101))) == {"p50": 50, "p90": 90, "p99": 99, "p100": 100}
+        assert load.percentiles([]) == {"p50": 0.0, "p90": 0.0, "p99": 0.0, "p100": 0.0}
+
+    def test_jitter(self):
+        # frames of 15, 30 and 15 cycles, the third frame arrives 0.1 seconds late
+        assert load.jitter([10.0, 11.0, 13.1], [15, 45, 60]) == pytest.approx([0.0, 0.1])
+
+    def test_client_counts_frames(self):
+        class Socket(object):
+            chunks = [b"\x1b[5;1Hframe\x1b[24", b";1H<o  >\x1b[24;1H", b""]
+
+            def recv(self, size):
+                return self.chunks.pop(0)
+
+        client = load.Client(Socket())
+        assert client.receive(1.0)
+        assert client.receive(2.0)
+        assert not client.receive(3.0)
+        assert client.frame_times == [2.0, 2.0]
+
+    def test_unsupported_server_options(self):
+        assert load.unsupported_options(["--engine=asyncio", "--delta", "--degrade-at=50", "--compress"]) == \
+            ["--delta", "--degrade-at=50"]
+        with pytest.raises(ValueError):
+            load.run(clients=1, duration=0.1, server_args=["--adaptive"])
+
+    def test_compare(self):
+        baseline = {"micro": {"load_frame": {"best": 1.0}}, "load": {"bytes_per_sec": 100.0, "clients": 10}}
+        faster = {"micro": {"load_frame": {"best": 0.5}}, "load": {"bytes_per_sec": 80.0, "clients": 20}}
+        rows = compare.compare(baseline, faster, threshold=10)
+        assert rows == [("load.bytes_per_sec", 100.0, 80.0, -20.0, True),
+                        ("micro.load_frame.best", 1.0, 0.5, -50.0, False)]
+
+    def test_startup(self):
+        results = startup.run(runs=1, filepath=SHORT_INTRO, port=2398)
+        for name in ("stdout", "handoff"):
+            assert results[name]["first_frame_seconds"]["p50"] > 0
+            assert results[name]["max_rss_bytes"] > 0
@@ -0,0 +1,64 @@
+# coding=utf-8
+import os
+import shutil
+
+import pytest
+
+from ascii_telnet.ascii_catalog import MovieCatalog, MovieMenu
+from ascii_telnet.ascii_movie import MovieRegistry
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+@pytest.fixture
+def catalog(tmpdir):
+    shutil.copy(SHORT_INTRO, str(tmpdir.join("intro.txt")))
+    shutil.copy(SHORT_INTRO, str(tmpdir.join("another.txt")))
+    tmpdir.join("notes.md").write("not a movie")
+    return MovieCatalog(str(tmpdir), MovieRegistry())
+
+
+class TestMovieCatalog(object):
+    def test_titles(self, catalog):
+        assert catalog.titles() == ["another", "intro"]
+        assert catalog.path("intro").endswith("intro.txt")
+        assert catalog.path("notes") is None
+        assert catalog.path(None) is None
+
+    def test_compiled_movies_are_preferred(self, catalog, tmpdir):
+        tmpdir.join("intro.atm").write("")
+        assert catalog.titles() == ["another", "intro"]
+        assert catalog.path("intro").endswith("intro.atm")
+
+    def test_get(self, catalog):
+        movie = catalog.get("intro")
+        assert len(movie.frames) == 45
+        assert catalog.get("intro") is movie
+        assert catalog.get("missing") is None
+
+
+class TestMovieMenu(object):
+    def test_choose_by_number(self, catalog):
+        sent = []
+        menu = MovieMenu(catalog, sent.append)
+        menu.show()
+        assert b"1) another" in sent[0] and b"2) intro" in sent[0]
+        menu.feed(b"2")
+        assert menu.choice is None
+        menu.feed(b"\r\x00")
+        assert menu.choice == "intro"
+        assert b"".join(sent[1:]) == b"2\r\n"
+
+    def test_choose_by_title(self, catalog):
+        menu = MovieMenu(catalog, lambda data: None)
+        menu.show()
+        menu.feed(b"inx\x7ftro\r\n")
+        assert menu.choice == "intro"
+
+    def test_no_such_movie(self, catalog):
+        sent = []
+        menu = MovieMenu(catalog, sent.append)
+        menu.show()
+        menu.feed(b"7\r")
+        assert menu.choice is None
+        assert b"No such movie" in sent[-1]
@@ -0,0 +1,61 @@
+# coding=utf-8
+import os
+from io import BytesIO
+
+from ascii_telnet.ascii_channel import BroadcastChannel
+from ascii_telnet.ascii_movie import Movie
+from ascii_telnet.ascii_player import VT100Player
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+class TestBroadcastChannel(object):
+    def setup_method(self, method):
+        movie = Movie()
+        movie.load(SHORT_INTRO)
+        self.channel = BroadcastChannel(movie)
+
+    def test_sync_frame_clears_screen(self):
+        self.channel._publish(BytesIO(b"frame 1"))
+        assert self.channel.sync_frame() == (1, VT100Player.CLEARSCRN.encode() + b"frame 1")
+
+    def test_wait_for_frame_returns_latest(self):
+        self.channel._publish(BytesIO(b"frame 1"))
+        self.channel._publish(BytesIO(b"frame 2"))
+        assert self.channel.wait_for_frame(0) == (2, b"frame 2")
+
+    def test_wait_for_frame_timeout(self):
+        self.channel._publish(BytesIO(b"frame 1"))
+        assert self.channel.wait_for_frame(1, timeout=0.01) == (1, None)
+
+    def test_listeners_get_same_bytes(self):
+        received = []
+        self.channel.add_listener(received.append)
+        self.channel.add_listener(received.append)
+        self.channel._publish(BytesIO(b"frame 1"))
+        assert received == [b"frame 1", b"frame 1"]
+        assert received[0] is received[1]
+
+    def test_repeat(self):
+        player = VT100Player(self.channel._player._movie)
+        player.draw_frame = lambda screen_buffer: None
+        steps = player.steps(repeat=True)
+        frame_count = len(player._movie.frames)
+        for _ in range(frame_count + 1):
+            next(steps)
+        assert player._cursor == player._movie.frames[0].display_time
+
+    def test_delta_channel_sends_full_frame_after_gap(self):
+        channel = BroadcastChannel(self.channel._player._movie, delta=True)
+        steps = channel._player.steps()
+        next(steps)
+        next(steps)
+        sequence, sync = channel.sync_frame()
+        next(steps)
+        assert channel.wait_for_frame(sequence) == (3, channel._frame)
+        next(steps)
+        next(steps)
+        sequence, frame = channel.wait_for_frame(sequence)
+        assert sequence == 5
+        assert frame == channel._player.current_frame_data()
+        assert frame != channel._frame
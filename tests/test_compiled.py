@@ -0,0 +1,112 @@
+# coding=utf-8
+import fcntl
+import gc
+import os
+
+import pytest
+
+from ascii_telnet.ascii_compiled import CompiledMovie, compile_movie, load_shared
+from ascii_telnet.ascii_movie import Movie, load_movie
+from ascii_telnet.ascii_player import VT100Player
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+@pytest.fixture
+def compiled(tmpdir):
+    target = str(tmpdir.join("short_intro.atm"))
+    compile_movie(SHORT_INTRO, target)
+    return target
+
+
+class TestCompiledMovie(object):
+    def test_same_frames_as_text_movie(self, compiled):
+        text_movie = Movie()
+        text_movie.load(SHORT_INTRO)
+        movie = load_movie(compiled)
+        assert isinstance(movie, CompiledMovie)
+        assert len(movie.frames) == len(text_movie.frames)
+        assert movie.duration == text_movie.duration
+        for frame, text_frame in zip(movie.frames, text_movie.frames):
+            assert frame.display_time == text_frame.display_time
+            assert frame.data == text_frame.data
+            assert bytes(frame.encode()) == text_frame.encode()
+
+    def test_same_rendering_as_text_movie(self, compiled):
+        text_movie = Movie()
+        text_movie.load(SHORT_INTRO)
+        movie = load_movie(compiled)
+        player, text_player = VT100Player(movie), VT100Player(text_movie)
+        assert player.render_frame(movie.frames[-1], 100) == text_player.render_frame(text_movie.frames[-1], 100)
+
+    def test_index_out_of_range(self, compiled):
+        movie = load_movie(compiled)
+        with pytest.raises(IndexError):
+            movie.frames[len(movie.frames)]
+
+    def test_wrong_screen_size(self, compiled):
+        with pytest.raises(ValueError):
+            load_movie(compiled, 100, 30)
+
+    def test_not_a_compiled_movie(self, tmpdir):
+        target = tmpdir.join("bad.atm")
+        target.write(b"x" * 100, mode="wb")
+        with pytest.raises(ValueError):
+            load_movie(str(target))
+
+    @pytest.mark.parametrize("size", [10, 100, -1])
+    def test_truncated_movie(self, compiled, tmpdir, size):
+        target = tmpdir.join("truncated.atm")
+        with open(compiled, "rb") as f:
+            target.write(f.read()[:size], mode="wb")
+        with pytest.raises(ValueError):
+            load_movie(str(target))
+
+    def test_close(self, compiled):
+        movie = load_movie(compiled)
+        frame = movie.frames[3]
+        data = frame.data
+        movie.close()
+        assert movie.memory_usage() == 0
+        assert frame.data == data  # frames taken before stay valid
+        # a player still holding the movie maps the file again
+        assert movie.frames[3].data == data
+        assert movie.memory_usage() > 0
+        movie.close()
+
+
+class TestSharedMovie(object):
+    def test_processes_share_one_copy(self, tmpdir):
+        directory = str(tmpdir)
+        movie = load_shared(SHORT_INTRO, directory=directory)
+        other = load_shared(SHORT_INTRO, directory=directory)
+        assert isinstance(movie, CompiledMovie)
+        assert len(movie.frames) == 45
+        copies = [name for name in os.listdir(directory) if name.endswith(".atm")]
+        assert len(copies) == 1
+        assert bytes(movie.frames[3].encode()) == bytes(other.frames[3].encode())
+        # the last one releasing the movie deletes the copy
+        del movie
+        gc.collect()
+        assert os.listdir(directory) == copies
+        del other
+        gc.collect()
+        assert os.listdir(directory) == []
+
+    def test_stale_copies_are_deleted(self, tmpdir):
+        stale = tmpdir.join("ascii-telnet-0123456789-80x24.atm")
+        stale.write("")
+        used = tmpdir.join("ascii-telnet-9876543210-80x24.atm")
+        used.write("")
+        with open(str(used), "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)  # held by a running server
+            movie = load_shared(SHORT_INTRO, directory=str(tmpdir))
+            assert not stale.check()
+            assert used.check()
+        assert len(movie.frames) == 45
+
+    def test_registry(self, tmpdir, monkeypatch):
+        monkeypatch.setattr("ascii_telnet.ascii_compiled.SHARED_DIR", str(tmpdir))
+        movie = load_movie(SHORT_INTRO, shared=True)
+        assert isinstance(movie, CompiledMovie)
+        assert len(os.listdir(str(tmpdir))) == 1
@@ -0,0 +1,36 @@
+# coding=utf-8
+import socket
+import threading
+
+import pytest
+
+from ascii_telnet.ascii_handoff import HANDOFF_SUPPORTED, HandoffReceiver, listen, send_socket
+
+
+class TestHandoff(object):
+    @pytest.mark.skipif(not HANDOFF_SUPPORTED, reason="handing over connections needs Python 3")
+    def test_connection_is_handed_over(self, tmpdir):
+        path = str(tmpdir.join("handoff.sock"))
+        adopted = []
+        received = threading.Event()
+
+        def adopt(sock):
+            adopted.append(sock)
+            received.set()
+
+        HandoffReceiver(listen(path), adopt).start()
+        client, server_side = socket.socketpair()
+        assert send_socket(path, server_side.fileno())
+        server_side.close()  # like the stub exiting, the server's duplicate keeps the connection open
+        assert received.wait(5)
+        adopted[0].sendall(b"frame")
+        assert client.recv(100) == b"frame"
+
+    def test_stale_socket_file_is_replaced(self, tmpdir):
+        path = str(tmpdir.join("handoff.sock"))
+        listen(path).close()
+        listen(path).close()
+
+    def test_no_server(self, tmpdir):
+        client, server_side = socket.socketpair()
+        assert not send_socket(str(tmpdir.join("missing.sock")), server_side.fileno())
@@ -0,0 +1,64 @@
+# coding=utf-8
+try:
+    # noinspection PyCompatibility
+    from urllib.request import urlopen
+except ImportError:  # Py2
+    # noinspection PyCompatibility,PyUnresolvedReferences
+    from urllib2 import urlopen
+
+from ascii_telnet.ascii_metrics import Histogram, MetricsServer, ServerStats, exposition
+
+
+class TestHistogram(object):
+    def test_cumulative_buckets(self):
+        histogram = Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 7):
+            histogram.observe(value)
+        assert histogram.snapshot("x") == {'x_bucket{le="0.1"}': 2, 'x_bucket{le="1"}': 3,
+                                           'x_bucket{le="+Inf"}': 4, "x_sum": 7.65, "x_count": 4}
+
+
+class TestServerStats(object):
+    def test_snapshot(self):
+        stats = ServerStats()
+        stats.increment("connections_total")
+        stats.increment("connections_active", 2)
+        stats.increment("connections_active", -1)
+        stats.observe("render_seconds", 0.002)
+        snapshot = stats.snapshot()
+        assert snapshot["connections_total"] == 1
+        assert snapshot["connections_active"] == 1
+        assert snapshot["frames_dropped"] == 0
+        assert snapshot["render_seconds_count"] == 1
+        assert snapshot['render_seconds_bucket{le="0.001"}'] == 0
+        assert snapshot['render_seconds_bucket{le="0.0025"}'] == 1
+
+
+class TestExposition(object):
+    def test_format(self):
+        stats = ServerStats()
+        stats.increment("bytes_sent", 1234)
+        stats.observe("lateness_seconds", 0.2)
+        text = exposition(stats.snapshot())
+        assert "# TYPE ascii_telnet_bytes_sent_total counter\nascii_telnet_bytes_sent_total 1234\n" in text
+        assert "# TYPE ascii_telnet_connections_active gauge\n" in text
+        assert 'ascii_telnet_frame_lateness_seconds_bucket{le="0.1"} 0\n' in text
+        assert 'ascii_telnet_frame_lateness_seconds_bucket{le="0.25"} 1\n' in text
+        assert 'ascii_telnet_frame_lateness_seconds_bucket{le="+Inf"} 1\n' in text
+        assert "ascii_telnet_frame_lateness_seconds_count 1\n" in text
+
+    def test_missing_values_are_zero(self):
+        assert "ascii_telnet_frames_sent_total 0\n" in exposition({})
+
+
+class TestMetricsServer(object):
+    def test_serves_metrics(self):
+        server = MetricsServer(("127.0.0.1", 0), lambda: {"connections_active": 3})
+        server.start()
+        try:
+            response = urlopen("http://127.0.0.1:{0}/metrics".format(server.server_address[1]))
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert b"ascii_telnet_connections_active 3\n" in response.read()
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,180 @@
+# coding=utf-8
+import os
+import shutil
+import threading
+import time
+
+from ascii_telnet import ascii_movie
+from ascii_telnet.ascii_movie import Movie, MovieRegistry, StreamingMovie
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+class TestMovie(object):
+    def test_load(self):
+        movie = Movie()
+        assert movie.load(SHORT_INTRO)
+        assert len(movie.frames) == 45
+        assert all(len(frame.data) == 13 for frame in movie.frames)
+        assert movie.load_time > 0
+        assert movie.memory_usage() > 0
+
+    def test_load_twice(self):
+        movie = Movie()
+        assert movie.load(SHORT_INTRO)
+        assert not movie.load(SHORT_INTRO)
+
+    def test_loaded_frames_are_immutable(self):
+        movie = Movie()
+        movie.load(SHORT_INTRO)
+        assert isinstance(movie.frames, tuple)
+        assert isinstance(movie.frames[0].data, tuple)
+
+    def test_compact_frames(self):
+        movie = Movie()
+        movie.load(SHORT_INTRO)
+        frame = movie.frames[3]
+        assert not hasattr(frame, "__dict__")
+        assert all(len(line) == movie.left_margin + 67 and line.startswith(" " * movie.left_margin)
+                   for line in frame.data)
+        assert frame.encode() == "".join(line + "\r\n" for line in frame.data).encode()
+        with open(SHORT_INTRO) as f:
+            lines = f.read().splitlines()
+        assert [line.strip() for line in frame.data] == [line.strip() for line in lines[3 * 14 + 1:4 * 14]]
+
+    def test_time_index(self):
+        movie = Movie()
+        movie.load(SHORT_INTRO)
+        frame_ends = movie.frame_ends()
+        assert len(frame_ends) == len(movie.frames)
+        assert frame_ends[-1] == movie.duration
+        assert movie.frame_at(0) == 0
+        assert movie.frame_at(-5) == 0
+        for index, frame_end in enumerate(frame_ends):
+            assert movie.frame_at(frame_end - 1) == index
+            assert movie.frame_at(frame_end - movie.frames[index].display_time) == index
+        assert movie.frame_at(movie.duration + 100) == len(movie.frames) - 1
+
+
+class TestMovieRegistry(object):
+    def test_same_movie_is_shared(self):
+        registry = MovieRegistry()
+        assert registry.get(SHORT_INTRO) is registry.get(SHORT_INTRO)
+
+    def test_movie_per_screen_size(self):
+        registry = MovieRegistry()
+        assert registry.get(SHORT_INTRO) is not registry.get(SHORT_INTRO, 100, 30)
+
+    def test_clear(self):
+        registry = MovieRegistry()
+        movie = registry.get(SHORT_INTRO)
+        registry.clear()
+        assert registry.get(SHORT_INTRO) is not movie
+
+    def test_memory_limit(self):
+        registry = MovieRegistry()
+        dropped = []
+        registry.add_listener(dropped.append)
+        movie = registry.get(SHORT_INTRO)
+        registry.max_bytes = registry.memory_usage() + 1
+        registry.get(SHORT_INTRO, 100, 30)
+        assert dropped == [movie]
+        assert registry.memory_usage() < registry.max_bytes
+        assert registry.get(SHORT_INTRO) is not movie
+
+    def test_reload_changed_file(self, tmpdir):
+        path = str(tmpdir.join("movie.txt"))
+        shutil.copy(SHORT_INTRO, path)
+        registry = MovieRegistry()
+        dropped = []
+        registry.add_listener(dropped.append)
+        movie = registry.get(path)
+        with open(SHORT_INTRO) as f:
+            first_frame = f.read().splitlines(True)[:14]
+        with open(path, "w") as f:
+            f.writelines(first_frame)
+        # the current version is played, until the new one is loaded in the background
+        deadline = time.time() + 5
+        while registry.get(path) is movie and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(registry.get(path).frames) == 1
+        assert dropped == [movie]
+        assert len(movie.frames) == 45
+
+    def test_slow_load_blocks_only_its_movie(self, tmpdir, monkeypatch):
+        slow = str(tmpdir.join("slow.txt"))
+        shutil.copy(SHORT_INTRO, slow)
+        registry = MovieRegistry()
+        loaded = registry.get(SHORT_INTRO)
+        release = threading.Event()
+        loads = []
+
+        def load_movie(filepath, *args):
+            loads.append(filepath)
+            release.wait(5)
+            return original_load_movie(filepath, *args)
+
+        original_load_movie = ascii_movie.load_movie
+        monkeypatch.setattr(ascii_movie, "load_movie", load_movie)
+        movies = []
+        threads = [threading.Thread(target=lambda: movies.append(registry.get(slow))) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while not loads:
+            time.sleep(0.01)
+        # other movies are available, while the slow one is loaded
+        start = time.time()
+        assert registry.get(SHORT_INTRO) is loaded
+        assert time.time() - start < 1
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert loads == [slow]
+        assert movies[0] is movies[1]
+
+
+class TestStreamingMovie(object):
+    def test_same_frames_as_movie(self):
+        movie = Movie()
+        movie.load(SHORT_INTRO)
+        streaming = StreamingMovie()
+        streaming.load(SHORT_INTRO)
+        assert streaming.duration == movie.duration
+        assert list(streaming.display_times()) == movie.display_times()
+        assert len(streaming.frames) == len(movie.frames)
+        for frame, streamed in zip(movie.frames, streaming.frames):
+            assert streamed.display_time == frame.display_time
+            assert streamed.data == frame.data
+        assert streaming.frames[-1].data == movie.frames[-1].data
+
+    def test_frames_are_parsed_on_demand(self):
+        streaming = StreamingMovie()
+        streaming.load(SHORT_INTRO)
+        assert len(streaming._parsed) == 0
+        assert streaming.frames[3] is streaming.frames[3]
+        assert len(streaming._parsed) == 1
+
+    def test_window(self):
+        streaming = StreamingMovie(window=5)
+        streaming.load(SHORT_INTRO)
+        for _ in streaming.frames:
+            assert len(streaming._parsed) <= 5
+        assert sorted(streaming._parsed) == list(range(len(streaming.frames) - 5, len(streaming.frames)))
+
+    def test_lines_split_like_movie(self, tmpdir):
+        path = tmpdir.join("movie.txt")
+        path.write("1\n" + "form\x0cfeed\x1cseparator\n" * 13 + "2\n" + "line\n" * 13)
+        movie = Movie()
+        movie.load(str(path))
+        streaming = StreamingMovie()
+        streaming.load(str(path))
+        for frame, streamed in zip(movie.frames, streaming.frames):
+            assert streamed.data == frame.data
+
+    def test_closed_when_dropped(self):
+        registry = MovieRegistry(streaming=True)
+        movie = registry.get(SHORT_INTRO)
+        registry.clear()
+        assert movie._file is None
+        # players still holding the movie keep playing it
+        assert movie.frames[5].data == registry.get(SHORT_INTRO).frames[5].data
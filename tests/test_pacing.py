@@ -0,0 +1,84 @@
+# coding=utf-8
+import os
+
+from ascii_telnet.ascii_movie import Movie
+from ascii_telnet.ascii_pacing import LinkPacer, RoundTripTimer
+from ascii_telnet.ascii_player import VT100Player
+from ascii_telnet.ascii_protocol import DO_TIMING_MARK
+from ascii_telnet.ascii_scheduler import VirtualClock
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+class TestRoundTripTimer(object):
+    def test_round_trip(self):
+        clock = VirtualClock()
+        rtt = RoundTripTimer(clock.now)
+        assert rtt.probe() == DO_TIMING_MARK
+        assert rtt.probe() == b""  # one outstanding timing mark at most
+        clock.sleep(0.1)
+        rtt.on_answer()
+        assert rtt.samples == 1 and rtt.srtt == rtt.min_rtt == rtt.current == 0.1
+        assert rtt.probe() == b""
+        clock.sleep(rtt.probe_interval)
+        assert rtt.probe() == DO_TIMING_MARK
+        clock.sleep(0.5)
+        assert rtt.current == 0.5  # the outstanding timing mark takes longer already
+        rtt.on_answer()
+        assert 0.1 < rtt.srtt < 0.5 and rtt.min_rtt == 0.1
+
+    def test_unasked_answer(self):
+        rtt = RoundTripTimer()
+        rtt.on_answer()
+        assert rtt.samples == 0 and rtt.current is None
+
+
+class TestLinkPacer(object):
+    def answer(self, pacer, clock, rtt):
+        pacer.rtt.probe()
+        clock.sleep(rtt)
+        pacer.rtt.on_answer()
+        clock.sleep(pacer.rtt.probe_interval)
+
+    def test_frame_rate_follows_the_link(self):
+        clock = VirtualClock()
+        pacer = LinkPacer(clock.now)
+        self.answer(pacer, clock, 0.01)
+        assert pacer.update() == (1, False)
+        self.answer(pacer, clock, 0.5)  # frames queue up in front of the client
+        assert pacer.update() == (2, True)
+        assert pacer.update() == (2, True)  # the lower frame rate takes a round trip to show
+        clock.sleep(1)
+        assert pacer.update() == (4, True)
+        self.answer(pacer, clock, 0.01)  # caught up
+        for _ in range(3):
+            clock.sleep(pacer.recover_interval)
+            pacer.update()
+        assert pacer.update() == (1, False)
+        assert pacer.slowdowns == 2
+
+    def test_full_send_queue(self):
+        pacer = LinkPacer(VirtualClock().now)
+        assert pacer.update(unsent=100) == (1, False)
+        assert pacer.update(unsent=pacer.max_unsent_bytes + 1) == (2, True)
+
+    def test_delta_on_high_latency(self):
+        clock = VirtualClock()
+        pacer = LinkPacer(clock.now)
+        for _ in range(3):
+            self.answer(pacer, clock, 0.5)  # steady, nothing queues up
+            pacer.update()
+        assert pacer.update() == (1, True)
+
+    def test_player_takes_the_stronger_limit(self):
+        movie = Movie()
+        movie.load(SHORT_INTRO)
+        player = VT100Player(movie)
+        player.adapt(2, True)
+        assert player.min_frame_cycles == 2 and player.delta is not None
+        player.degrade(True)
+        assert player.min_frame_cycles == player.degraded_frame_cycles
+        player.adapt(1, False)
+        assert player.delta is not None
+        player.degrade(False)
+        assert player.min_frame_cycles == 1 and player.delta is None
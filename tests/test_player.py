@@ -0,0 +1,192 @@
+# coding=utf-8
+import os
+import re
+
+from ascii_telnet.ascii_movie import Movie
+from ascii_telnet.ascii_player import (RENDER_CACHE_BYTES, DeltaEncoder, FrameRenderCache, RenderCacheRegistry,
+                                       VT100Player, WindowResizes)
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+def record(player):
+    screens = []
+    player.draw_frame = lambda screen_buffer: screens.append(screen_buffer.read())
+    for index, frame in enumerate(player._movie.frames):
+        player._cursor += frame.display_time
+        player._load_frame(frame, player._cursor, index)
+    return screens
+
+
+def emulate(screen, stream):
+    """
+    Minimal VT100 emulation, just enough to apply the player's output to a screen (dict of (row, col) -> char)
+    """
+    row, col = 1, 1
+    for token in re.findall(r"\x1b\[2J|\x1b\[\d+;\d+H|\r|\n|[^\x1b\r\n]", stream.decode()):
+        if token == "\x1b[2J":
+            screen.clear()
+        elif token.startswith("\x1b["):
+            row, col = [int(n) for n in token[2:-1].split(";")]
+        elif token == "\r":
+            col = 1
+        elif token == "\n":
+            row += 1
+        else:
+            screen[(row, col)] = token
+            col += 1
+    return screen
+
+
+class TestFrameRenderCache(object):
+    def setup_method(self, method):
+        self.movie = Movie()
+        self.movie.load(SHORT_INTRO)
+
+    def test_cached_output_equals_rendered_output(self):
+        rendered = record(VT100Player(self.movie))
+        cached = record(VT100Player(self.movie, FrameRenderCache(self.movie)))
+        assert rendered == cached
+        assert rendered[0].startswith(VT100Player.CLEARSCRN.encode())
+        assert not rendered[1].startswith(VT100Player.CLEARSCRN.encode())
+
+    def test_frames_are_shared(self):
+        cache = FrameRenderCache(self.movie)
+        assert cache.get(3) is cache.get(3)
+
+    def test_prerender(self):
+        cache = FrameRenderCache(self.movie)
+        empty = cache.memory_usage()
+        assert empty > 0  # the frame list and the renderer
+        cache.prerender()
+        assert cache.memory_usage() > empty
+
+
+class TestScreenSize(object):
+    def setup_method(self, method):
+        self.movie = Movie()
+        self.movie.load(SHORT_INTRO)
+
+    def text(self, screen, row):
+        return "".join(screen.get((row, col), " ") for col in range(1, 200)).rstrip()
+
+    def test_default_size_is_unchanged(self):
+        assert record(VT100Player(self.movie, screen_size=(80, 24))) == record(VT100Player(self.movie))
+
+    def test_frames_are_centered(self):
+        frame = self.movie.frames[0]
+        screen = emulate({}, record(VT100Player(self.movie, screen_size=(120, 40)))[0])
+        left, top = self.movie.margins(120, 40)
+        assert (left, top) == (26, 13)
+        for row, line in enumerate(frame.data):
+            assert self.text(screen, top + row) == (" " * left + line[self.movie.left_margin:]).rstrip()
+        assert self.text(screen, 40).startswith("<") and self.text(screen, 40).endswith(">")
+        assert len(self.text(screen, 40)) == 120
+
+    def test_small_screen_is_clipped(self):
+        screen = emulate({}, record(VT100Player(self.movie, screen_size=(40, 10)))[0])
+        assert max(col for row, col in screen) <= 40
+        assert max(row for row, col in screen) == 10
+
+    def test_resize_redraws(self):
+        player = VT100Player(self.movie, delta=True)
+        screens = record(player)
+        player.resize(100, 30)
+        frame = self.movie.frames[-1]
+        player._load_frame(frame, player._cursor, len(self.movie.frames) - 1)
+        assert len(screens) == len(self.movie.frames) + 1
+        assert screens[-1].startswith(VT100Player.CLEARSCRN.encode())
+        assert emulate({}, screens[-1]) == emulate({}, record(VT100Player(self.movie, screen_size=(100, 30)))[-1])
+
+
+class TestRenderCacheRegistry(object):
+    def setup_method(self, method):
+        self.movie = Movie()
+        self.movie.load(SHORT_INTRO)
+
+    def test_caches_are_shared_per_size(self):
+        caches = RenderCacheRegistry()
+        assert caches.get(self.movie) is caches.get(self.movie, 80, 24)
+        assert caches.get(self.movie, 100, 30) is not caches.get(self.movie)
+        player = VT100Player(self.movie, caches.get(self.movie, 100, 30), screen_size=(100, 30))
+        assert record(player) == record(VT100Player(self.movie, screen_size=(100, 30)))
+
+    def test_least_recently_used_sizes_are_evicted(self):
+        caches = RenderCacheRegistry()
+        small = caches.get(self.movie, 60, 20)
+        small.prerender()
+        caches.get(self.movie, 100, 30).prerender()
+        caches.get(self.movie).prerender()
+        caches.max_bytes = caches.memory_usage() - 1
+        large = caches.get(self.movie, 100, 30)
+        assert caches.memory_usage() <= caches.max_bytes
+        assert caches.get(self.movie, 100, 30) is large
+        assert caches.get(self.movie, 60, 20) is not small
+
+    def test_empty_caches_count(self):
+        caches = RenderCacheRegistry()
+        assert caches.max_bytes == RENDER_CACHE_BYTES
+        caches.max_bytes = 10 * FrameRenderCache(self.movie).memory_usage()
+        for width in range(100, 200):
+            caches.get(self.movie, width, 30)  # a client cycling through window sizes
+        assert len(caches._caches) <= 10
+        assert caches.memory_usage() <= caches.max_bytes
+
+
+class TestWindowResizes(object):
+    def test_resizes_are_limited(self):
+        movie = Movie()
+        movie.load(SHORT_INTRO)
+        player = VT100Player(movie)
+        now = [0.0]
+        sizes = []
+        resizes = WindowResizes(player, lambda width, height: sizes.append((width, height)), lambda: now[0])
+        resizes.request(100, 30)
+        assert player.screen_width == 100
+        for width in range(101, 120):
+            resizes.request(width, 30)
+        assert player.screen_width == 100
+        now[0] += resizes.min_interval
+        resizes.apply()
+        assert (player.screen_width, player.screen_height) == (119, 30)
+        assert sizes == [(100, 30), (119, 30)]
+
+
+class TestDeltaEncoder(object):
+    def setup_method(self, method):
+        self.movie = Movie()
+        self.movie.load(SHORT_INTRO)
+
+    def test_delta_draws_same_screens(self):
+        full_screen, delta_screen = {}, {}
+        full = record(VT100Player(self.movie))
+        player = VT100Player(self.movie, delta=True)
+        delta = record(player)
+        for full_frame, delta_frame in zip(full, delta):
+            assert emulate(full_screen, full_frame) == emulate(delta_screen, delta_frame)
+        assert player.delta.bytes_saved > 0
+        assert sum(len(frame) for frame in delta) < sum(len(frame) for frame in full)
+
+    def test_first_frame_and_reset_are_full(self):
+        encoder = DeltaEncoder()
+        assert encoder.encode([(1, "abc")], b"full") == b"full"
+        assert encoder.encode([(1, "abd")], b"full frame") == b"\x1b[1;3Hd"
+        encoder.reset()
+        assert encoder.encode([(1, "abe")], b"full frame") == b"full frame"
+
+    def test_unchanged_frame_is_empty(self):
+        encoder = DeltaEncoder()
+        encoder.encode([(1, "abc")], b"full")
+        assert encoder.encode([(1, "abc")], b"full") == b""
+        assert encoder.bytes_saved == 4
+
+    def test_delta_larger_than_full_frame(self):
+        encoder = DeltaEncoder()
+        encoder.encode([(1, "abc")], b"full")
+        assert encoder.encode([(1, "xyz")], b"full") == b"full"
+
+    def test_spans_are_merged_across_small_gaps(self):
+        encoder = DeltaEncoder(max_gap=2)
+        encoder.encode([(5, "a" * 20)], b"x" * 100)
+        assert encoder.encode([(5, "b" + "a" * 2 + "b" + "a" * 15 + "b")], b"x" * 100) == \
+            b"\x1b[5;1Hbaab\x1b[5;20Hb"
@@ -0,0 +1,69 @@
+# coding=utf-8
+import os
+import signal
+import threading
+import time
+
+from ascii_telnet.ascii_metrics import server_stats
+from ascii_telnet.ascii_prefork import PreforkSupervisor
+
+
+class IdleServer(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.stopped = threading.Event()
+
+    def serve_forever(self):
+        while not self.stopped.wait(0.05):
+            pass
+
+    def stop_accepting(self, drain_timeout=None):
+        self.stopped.set()
+
+
+def create_server(sock):
+    # runs in the workers, each reports the same counters
+    server_stats.frames_sent = 7
+    server_stats.connections_active = 1
+    return IdleServer(sock)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+class TestPreforkSupervisor(object):
+    def test_crashed_worker_is_restarted(self):
+        supervisor = PreforkSupervisor(2, create_server, ("127.0.0.1", 0), stats_interval=0.05)
+        results = {}
+
+        def crash_worker():
+            try:
+                wait_for(lambda: supervisor.stats().get("frames_sent") == 2 * 7)
+                results["pids"] = dict(supervisor._pids)
+                crashed = min(supervisor._pids)
+                os.kill(crashed, signal.SIGKILL)
+                wait_for(lambda: crashed not in supervisor._pids and len(supervisor._pids) == 2)
+                wait_for(lambda: supervisor.stats().get("frames_sent") == 3 * 7)
+                results["respawned"] = dict(supervisor._pids)
+                results["stats"] = supervisor.stats()
+            finally:
+                supervisor.stop_accepting()
+
+        thread = threading.Thread(target=crash_worker)
+        thread.start()
+        sigterm = signal.getsignal(signal.SIGTERM)
+        try:
+            supervisor.serve_forever()
+        finally:
+            signal.signal(signal.SIGTERM, sigterm)
+            thread.join()
+        assert sorted(results["respawned"].values()) == [0, 1]
+        assert len(set(results["respawned"]) - set(results["pids"])) == 1
+        # the crashed worker's counters are kept, gauges only count the running workers
+        assert results["stats"]["frames_sent"] == 3 * 7
+        assert results["stats"]["connections_active"] == 2
+        assert supervisor._pids == {}
@@ -0,0 +1,84 @@
+# coding=utf-8
+import zlib
+
+from ascii_telnet.ascii_protocol import (COMPRESS2, DO, DONT, IAC, NAWS, SB, SE, START_COMPRESS2, TIMING_MARK, WILL,
+                                         WONT, BlockCache, StreamCompressor, TelnetParser)
+
+
+def naws(width, height):
+    return bytes(bytearray([IAC, SB, NAWS, width >> 8, width & 0xff, height >> 8, height & 0xff, IAC, SE]))
+
+
+class TestTelnetParser(object):
+    def test_window_size(self):
+        parser = TelnetParser()
+        assert not parser.naws_negotiated
+        assert parser.feed(b"a" + naws(132, 43) + b"b") == b"ab"
+        assert parser.window_size == (132, 43)
+        assert parser.naws_negotiated
+
+    def test_commands_split_across_chunks(self):
+        parser = TelnetParser()
+        data = naws(100, 30)
+        assert parser.feed(data[:4]) == b""
+        assert parser.window_size is None
+        assert parser.feed(data[4:]) == b""
+        assert parser.window_size == (100, 30)
+
+    def test_escaped_iac(self):
+        parser = TelnetParser()
+        assert parser.feed(bytes(bytearray([IAC, IAC, DO, NAWS]))) == bytes(bytearray([IAC, DO, NAWS]))
+        # a width of 255 is sent as 0x00 0xff, the 0xff doubled within the subnegotiation
+        parser.feed(bytes(bytearray([IAC, SB, NAWS, 0, IAC, IAC, 0, 40, IAC, SE])))
+        assert parser.window_size == (255, 40)
+
+    def test_refused(self):
+        parser = TelnetParser()
+        parser.feed(bytes(bytearray([IAC, WONT, NAWS])))
+        assert parser.naws_refused
+        assert parser.naws_negotiated
+        assert parser.window_size is None
+
+    def test_unknown_and_extreme_sizes(self):
+        parser = TelnetParser()
+        parser.feed(naws(0, 0))
+        assert parser.window_size is None
+        parser.feed(naws(1, 1))
+        assert parser.window_size == parser.min_size
+        parser.feed(naws(60000, 60000))
+        assert parser.window_size == parser.max_size
+
+    def test_compress2(self):
+        parser = TelnetParser()
+        assert parser.compress2 is None
+        parser.feed(bytes(bytearray([IAC, DO, COMPRESS2])))
+        assert parser.compress2
+        parser.feed(bytes(bytearray([IAC, DONT, COMPRESS2])))
+        assert parser.compress2 is False
+
+    def test_timing_marks(self):
+        parser = TelnetParser()
+        assert parser.feed(bytes(bytearray([IAC, WONT, TIMING_MARK])) + b"q" +
+                           bytes(bytearray([IAC, WILL, TIMING_MARK]))) == b"q"
+        assert parser.timing_marks == 2
+
+
+class TestStreamCompressor(object):
+    def test_spliced_blocks(self):
+        compressor = StreamCompressor()
+        cache = BlockCache()
+        shared = b"\x1b[H" + b"shared frame " * 100
+        frames = [b"own frame", shared, b"own frame", shared, shared, b"end"]
+        data = b"".join(compressor.splice(frame, cache.get(frame)) if frame is shared else compressor.compress(frame)
+                        for frame in frames)
+        assert data.startswith(START_COMPRESS2)
+        assert zlib.decompressobj().decompress(data[len(START_COMPRESS2):]) == b"".join(frames)
+        assert compressor.bytes_in == sum(len(frame) for frame in frames)
+        assert compressor.bytes_out == len(data)
+
+    def test_block_cache(self):
+        cache = BlockCache(max_blocks=1)
+        first = b"first frame" * 10
+        assert cache.get(first) is cache.get(first)
+        cache.get(b"second frame" * 10)
+        assert len(cache._blocks) == 1
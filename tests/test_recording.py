@@ -0,0 +1,46 @@
+# coding=utf-8
+from __future__ import division
+
+import io
+import os
+
+import pytest
+
+from ascii_telnet.ascii_movie import Movie
+from ascii_telnet.ascii_player import VT100Player
+from ascii_telnet.ascii_recording import read_recording, record
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+class TestRecording(object):
+    def setup_method(self, method):
+        self.movie = Movie()
+        self.movie.load(SHORT_INTRO)
+
+    def test_frames_and_timestamps(self):
+        output = io.StringIO()
+        duration = record(self.movie, output, title="intro")
+        output.seek(0)
+        header, frames = read_recording(output)
+        assert header == {"version": 2, "width": 80, "height": 24, "title": "intro"}
+        assert duration == pytest.approx(self.movie.duration / 15)
+
+        screens = []
+        player = VT100Player(self.movie)
+        player.draw_frame = lambda screen_buffer: screens.append(screen_buffer.read())
+        for index, frame in enumerate(self.movie.frames):
+            player._cursor += frame.display_time
+            player._load_frame(frame, player._cursor, index)
+        assert [data for _, data in frames] == screens
+        # each frame is shown, when the previous one's display time ended
+        starts = [0] + list(self.movie.frame_ends())[:-1]
+        assert [seconds for seconds, _ in frames] == pytest.approx([start / 15 for start in starts])
+
+    def test_screen_size(self):
+        output = io.StringIO()
+        record(self.movie, output, screen_size=(100, 30), delta=True)
+        output.seek(0)
+        header, frames = read_recording(output)
+        assert (header["width"], header["height"]) == (100, 30)
+        assert len(frames) == len(self.movie.frames)
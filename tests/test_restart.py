@@ -0,0 +1,97 @@
+# coding=utf-8
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+from ascii_telnet import ascii_restart
+from ascii_telnet.ascii_metrics import server_stats
+from ascii_telnet.ascii_restart import LISTEN_FDS, RESTART_SUPPORTED, GracefulRestart, bind, inherited_sockets
+from ascii_telnet.ascii_server import ThreadedTCPServer
+
+try:
+    # noinspection PyCompatibility
+    from socketserver import BaseRequestHandler
+except ImportError:  # Py2
+    # noinspection PyCompatibility,PyUnresolvedReferences
+    from SocketServer import BaseRequestHandler
+
+# the new server process: serves one connection on the inherited socket
+NEW_PROCESS = """
+import sys
+sys.path.insert(0, {0!r})
+from ascii_telnet.ascii_restart import inherited_sockets, notify_ready
+sock = inherited_sockets()["telnet"]
+notify_ready()
+conn = sock.accept()[0]
+conn.sendall(b"new process")
+conn.close()
+"""
+
+
+class HoldingHandler(BaseRequestHandler):
+    def handle(self):
+        server_stats.increment("connections_active")
+        try:
+            self.request.recv(1)
+        finally:
+            server_stats.increment("connections_active", -1)
+
+
+py3_only = pytest.mark.skipif(not RESTART_SUPPORTED, reason="restarting needs Python 3")
+
+
+class TestRestart(object):
+    @py3_only
+    def test_inherited_sockets(self, monkeypatch):
+        sock = bind(("127.0.0.1", 0))
+        monkeypatch.setenv(LISTEN_FDS, "telnet={0}".format(os.dup(sock.fileno())))
+        inherited = inherited_sockets()
+        assert inherited["telnet"].getsockname() == sock.getsockname()
+        assert LISTEN_FDS not in os.environ
+        assert inherited_sockets() == {}
+
+    @py3_only
+    def test_new_process_takes_over(self):
+        sock = bind(("127.0.0.1", 0))
+        stopped = []
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        restart = GracefulRestart({"telnet": sock}, lambda: stopped.append(True),
+                                  [sys.executable, "-c", NEW_PROCESS.format(root)])
+        assert restart.restart()
+        assert stopped
+        client = socket.create_connection(sock.getsockname(), timeout=5)
+        assert client.recv(100) == b"new process"
+
+    @py3_only
+    def test_failed_restart_keeps_serving(self):
+        stopped = []
+        restart = GracefulRestart({"telnet": bind(("127.0.0.1", 0))}, lambda: stopped.append(True),
+                                  [sys.executable, "-c", "import sys; sys.exit(1)"])
+        assert not restart.restart()
+        assert not stopped
+
+    def test_unsupported_interpreter(self, monkeypatch):
+        monkeypatch.setattr(ascii_restart, "RESTART_SUPPORTED", False)
+        restarts = []
+        restart = GracefulRestart({}, lambda: None)
+        monkeypatch.setattr(restart, "restart", lambda: restarts.append(True))
+        restart._on_signal(None, None)
+        assert not restarts
+        assert not restart._restarting
+
+    def test_connections_finish_after_stop_accepting(self):
+        server = ThreadedTCPServer(("127.0.0.1", 0), HoldingHandler)
+        serving = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05})
+        serving.start()
+        client = socket.create_connection(server.server_address, timeout=5)
+        while server_stats.connections_active == 0:
+            threading.Event().wait(0.01)
+        server.stop_accepting(drain_timeout=5)
+        serving.join(0.5)
+        assert serving.is_alive()  # still playing to the client
+        client.sendall(b"q")
+        serving.join(5)
+        assert not serving.is_alive()
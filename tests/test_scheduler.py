@@ -0,0 +1,159 @@
+# coding=utf-8
+from __future__ import division
+
+import os
+
+import pytest
+
+from ascii_telnet.ascii_movie import Movie
+from ascii_telnet.ascii_player import PlaybackControls, VT100Player
+from ascii_telnet.ascii_scheduler import FrameScheduler, VirtualClock
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFrameScheduler(object):
+    def test_deadlines_are_absolute(self):
+        clock = FakeClock()
+        scheduler = FrameScheduler(fps=10, clock=clock)
+        scheduler.start()
+        assert scheduler.deadline(5) == pytest.approx(100.5)
+        clock.now = 100.2
+        assert scheduler.delay(5) == pytest.approx(0.3)
+        clock.now = 101
+        assert scheduler.delay(5) == 0
+        assert scheduler.is_due(5)
+
+    def test_start_at_frame_position(self):
+        clock = FakeClock()
+        scheduler = FrameScheduler(fps=10, clock=clock)
+        scheduler.start(10)
+        assert scheduler.deadline(10) == pytest.approx(100)
+
+    def test_lateness_statistics(self):
+        clock = FakeClock()
+        scheduler = FrameScheduler(fps=10, clock=clock)
+        scheduler.start()
+        scheduler.record(0)
+        clock.now = 100.3
+        assert scheduler.record(1) == pytest.approx(0.2)
+        assert scheduler.frames_shown == 2
+        assert scheduler.max_lateness == pytest.approx(0.2)
+        assert scheduler.mean_lateness == pytest.approx(0.1)
+
+
+class TestVirtualClock(object):
+    def test_play_faster_than_real_time(self):
+        movie = Movie()
+        movie.load(SHORT_INTRO)
+        clock = VirtualClock(start=100.0)
+        player = VT100Player(movie, clock=clock)
+        times = []
+        player.draw_frame = lambda screen_buffer: times.append(clock.now())
+        player.play()
+        assert len(times) == len(movie.frames)
+        assert times[0] == 100.0
+        assert clock.now() == pytest.approx(100.0 + movie.duration / 15)
+        assert player.scheduler.frames_skipped == 0
+
+    def test_sleep(self):
+        clock = VirtualClock()
+        clock.sleep(1.5)
+        clock.sleep(-1)
+        assert clock.now() == 1.5
+
+
+class TestPlayerScheduling(object):
+    def setup_method(self, method):
+        self.movie = Movie()
+        self.movie.load(SHORT_INTRO)
+        self.clock = FakeClock()
+        self.player = VT100Player(self.movie)
+        self.player.scheduler = FrameScheduler(clock=self.clock)
+        self.frame_positions = []
+        self.player.draw_frame = lambda screen_buffer: self.frame_positions.append(self.player._cursor)
+
+    def play(self, seconds_per_frame):
+        for delay in self.player.steps():
+            self.clock.now += delay + seconds_per_frame
+
+    def test_play_in_time(self):
+        self.play(0)
+        assert len(self.frame_positions) == len(self.movie.frames)
+        assert self.player.scheduler.frames_skipped == 0
+        assert self.player.scheduler.max_lateness == 0
+
+    def test_skip_frames_when_behind(self):
+        duration = sum(frame.display_time for frame in self.movie.frames) / 15
+        self.play(1)
+        assert self.player.scheduler.frames_skipped > 0
+        assert len(self.frame_positions) + self.player.scheduler.frames_skipped == len(self.movie.frames)
+        assert self.frame_positions[-1] == self.player._frame_count
+        # lateness doesn't add up, playback takes only as long as the movie plus drawing the last frames
+        assert self.clock.now - 100 <= duration + 2
+
+
+class TestPlaybackControls(object):
+    def setup_method(self, method):
+        self.movie = Movie()
+        self.movie.load(SHORT_INTRO)
+        self.clock = FakeClock()
+        self.player = VT100Player(self.movie, delta=True)
+        self.player.scheduler = FrameScheduler(clock=self.clock)
+        self.screens = []
+        self.player.draw_frame = lambda screen_buffer: self.screens.append((self.player._current[2],
+                                                                            screen_buffer.read()))
+        self.controls = PlaybackControls(self.player)
+        self.steps = self.player.steps()
+
+    def step(self):
+        self.clock.now += next(self.steps)
+
+    def test_seek_repaints_once(self):
+        self.step()
+        self.step()
+        del self.screens[:]
+        self.controls.feed(b"5")
+        assert self.player.interrupted
+        self.step()
+        index = self.movie.frame_at(self.player._frame_count // 2)
+        assert len(self.screens) == 1
+        assert self.screens[0][0] == index
+        full = self.player.render_frame(self.movie.frames[index], self.movie.frame_ends()[index])
+        assert self.screens[0][1] == full
+        assert not self.player.interrupted
+
+    def test_seek_by_arrow_keys(self):
+        self.controls.seek_seconds = 1  # the movie is only 50 cycles long
+        self.step()
+        position = self.player.position
+        self.controls.feed(b"\x1b[")
+        self.controls.feed(b"C")
+        self.step()
+        assert self.player.position >= position + 15
+        self.controls.feed(b"\x1bOD,")
+        self.step()
+        assert self.screens[-1][0] == 0
+
+    def test_pause_and_resume(self):
+        self.step()
+        self.step()
+        self.controls.feed(b" ")
+        drawn = len(self.screens)
+        position = self.player.position
+        for _ in range(20):
+            self.step()
+        assert len(self.screens) == drawn
+        assert self.player.position == position
+        self.controls.feed(b"p")
+        self.step()
+        assert len(self.screens) == drawn + 1
+        assert self.player.scheduler.frames_skipped == 0
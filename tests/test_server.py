@@ -0,0 +1,192 @@
+# coding=utf-8
+import os
+import shutil
+import socket
+import threading
+import zlib
+
+import pytest
+
+from ascii_telnet.ascii_admission import BUSY_SCREEN, AdmissionControl
+from ascii_telnet.ascii_catalog import MovieCatalog
+from ascii_telnet.ascii_movie import Movie
+from ascii_telnet.ascii_pacing import LinkPacer
+from ascii_telnet.ascii_player import VT100Player
+from ascii_telnet.ascii_protocol import (CHARACTER_MODE, DO_NAWS, DO_TIMING_MARK, IAC, REQUEST_USER, START_COMPRESS2,
+                                         TIMING_MARK, WILL_COMPRESS2, WONT)
+from ascii_telnet.ascii_server import TelnetRequestHandler, ThreadedTCPServer, server_stats
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+class UnservedHandler(TelnetRequestHandler):
+    def __init__(self, request):
+        # the base class would handle the request right away
+        self.request = request
+        self.setup()
+
+
+def create_handler():
+    server_side, client_side = socket.socketpair()
+    return UnservedHandler(server_side), client_side
+
+
+class TestBackpressure(object):
+    def test_frames_are_sent(self):
+        handler, client = create_handler()
+        frames_sent = server_stats.frames_sent
+        assert handler._enqueue(b"frame", False)
+        assert client.recv(100) == b"frame"
+        assert server_stats.frames_sent == frames_sent + 1
+
+    def test_stale_frames_are_dropped(self):
+        handler, client = create_handler()
+        dropped = server_stats.frames_dropped
+        frame = b"x" * 10000
+        for i in range(100):
+            assert handler._enqueue(frame + str(i).encode(), False)
+        assert len(handler._queue) <= handler.max_queued_frames
+        assert handler._queue[-1][0].endswith(b"99")
+        assert server_stats.frames_dropped > dropped
+
+    def test_dropped_delta_requires_full_frame(self):
+        handler, client = create_handler()
+        frame = b"x" * 10000
+        results = [handler._enqueue(frame, True) for _ in range(100)]
+        assert False in results
+
+    def test_stalled_client_is_evicted(self):
+        handler, client = create_handler()
+        handler.stall_timeout = 0.1
+        evicted = server_stats.clients_evicted
+        handler._enqueue(b"x" * 1000000, False)
+        assert not handler._flush(1)
+        assert server_stats.clients_evicted == evicted + 1
+
+    def test_disconnected_client(self):
+        handler, client = create_handler()
+        client.close()
+        dropped = server_stats.frames_dropped
+        for _ in range(10):
+            assert handler._enqueue(b"frame", True) is None  # not a dropped frame
+        assert server_stats.frames_dropped == dropped
+        assert not handler._flush(0.1)
+        assert not handler._receive(0.1)
+
+    def test_disconnected_client_stops_player(self):
+        handler, client = create_handler()
+        movie = Movie()
+        movie.load(SHORT_INTRO)
+        handler.player = VT100Player(movie)
+        handler.player.draw_frame = handler.draw_frame
+        client.close()
+        assert len(list(handler.player.steps())) == 1
+
+
+class TestWindowSize(object):
+    def test_negotiated_window_size(self):
+        handler, client = create_handler()
+        client.sendall(b"\xff\xfb\x1f\xff\xfa\x1f\x00\x64\x00\x1e\xff\xf0")  # WILL NAWS, 100x30
+        assert handler.negotiate_window_size()
+        assert client.recv(100) == DO_NAWS + CHARACTER_MODE
+        assert handler.telnet.window_size == (100, 30)
+
+    def test_client_without_naws(self):
+        handler, client = create_handler()
+        handler.naws_timeout = 0.05
+        assert handler.negotiate_window_size()
+        assert handler.telnet.window_size is None
+
+
+class TestCompression(object):
+    def test_compressed_frames(self):
+        handler, client = create_handler()
+        handler.compress = True
+        client.sendall(b"\xff\xfb\x1f\xff\xfa\x1f\x00\x64\x00\x1e\xff\xf0\xff\xfd\x56")  # NAWS, DO COMPRESS2
+        assert handler.negotiate_window_size()
+        assert client.recv(100) == DO_NAWS + CHARACTER_MODE + WILL_COMPRESS2
+        assert handler._flush(0.05)
+        assert handler.compressor is not None
+        saved = server_stats.compression_saved_bytes
+        frame = b"frame " * 100
+        assert handler._enqueue(frame, False, shared=True)
+        assert handler._enqueue(frame, False)
+        data = client.recv(10000)
+        assert data.startswith(START_COMPRESS2)
+        assert zlib.decompressobj().decompress(data[len(START_COMPRESS2):]) == frame * 2
+        assert server_stats.compression_saved_bytes > saved
+
+
+class TestCatalog(object):
+    def test_movie_chosen_by_user_variable(self, tmpdir):
+        shutil.copy(SHORT_INTRO, str(tmpdir.join("intro.txt")))
+        handler, client = create_handler()
+        handler.catalog = MovieCatalog(str(tmpdir))
+        client.sendall(b"\xff\xfc\x1f\xff\xfb\x27\xff\xfa\x27\x00\x00USER\x01intro\xff\xf0")  # WONT NAWS, USER=intro
+        assert handler.negotiate_window_size()
+        assert client.recv(100) == DO_NAWS + CHARACTER_MODE + REQUEST_USER
+        assert handler.choose_movie(handler.catalog).endswith("intro.txt")
+
+    def test_movie_chosen_from_menu(self, tmpdir):
+        shutil.copy(SHORT_INTRO, str(tmpdir.join("intro.txt")))
+        handler, client = create_handler()
+        client.sendall(b"1\r")
+        assert handler.choose_movie(MovieCatalog(str(tmpdir))).endswith("intro.txt")
+        assert b"1) intro" in client.recv(1000)
+
+
+class TestAdmission(object):
+    def test_busy_screen(self):
+        server = ThreadedTCPServer(("127.0.0.1", 0), TelnetRequestHandler)
+        server.admission = AdmissionControl(max_connections=0)
+        try:
+            server_side, client = socket.socketpair()
+            server.process_request(server_side, ("10.0.0.1", 2323))
+            assert client.recv(1000) == BUSY_SCREEN
+            assert server.admission.active == 0
+        finally:
+            server.server_close()
+
+
+class TestServerPacing(object):
+    def test_timing_mark_follows_frame(self):
+        handler, client = create_handler()
+        handler.pacer = LinkPacer()
+        handler.player = object()  # playing
+        handler._enqueue(b"frame", False)
+        assert client.recv(100) == b"frame" + DO_TIMING_MARK
+        client.sendall(bytes(bytearray([IAC, WONT, TIMING_MARK])))
+        assert handler._receive(1)
+        assert handler.pacer.rtt.samples == 1
+
+
+class TestManyClients(object):
+    def test_file_descriptors_above_1024(self, monkeypatch):
+        resource = pytest.importorskip("resource")
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < 2048:
+            if hard != resource.RLIM_INFINITY and hard < 2048:
+                pytest.skip("can't open 2048 files")
+            resource.setrlimit(resource.RLIMIT_NOFILE, (2048, hard))
+        monkeypatch.setattr(TelnetRequestHandler, "filename", SHORT_INTRO)
+        monkeypatch.setattr(TelnetRequestHandler, "naws_timeout", 0.05)
+        server = ThreadedTCPServer(("127.0.0.1", 0), TelnetRequestHandler)
+        thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        files = [os.open(os.devnull, os.O_RDONLY) for _ in range(1100)]
+        try:
+            client = socket.create_connection(server.server_address)
+            client.settimeout(5)
+            data = b""
+            while b"\x1b[24;1H" not in data:
+                chunk = client.recv(65536)
+                assert chunk, "the server closed the connection"
+                data += chunk
+            client.close()
+        finally:
+            for fd in files:
+                os.close(fd)
+            server.shutdown()
+            server.server_close()
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
@@ -0,0 +1,23 @@
+# coding=utf-8
+import io
+import os
+
+from ascii_telnet.ascii_stdout import FrameWriter
+
+
+class TestFrameWriter(object):
+    def test_one_write_per_frame(self):
+        read_end, write_end = os.pipe()
+        with os.fdopen(write_end, "w") as stream:
+            writer = FrameWriter(stream)
+            writer.write(io.BytesIO(b"\x1b[H frame \xe2\x96\x88"))
+            assert writer.writes == 1
+            assert os.read(read_end, 100) == b"\x1b[H frame \xe2\x96\x88"
+        os.close(read_end)
+
+    def test_latin1(self):
+        stream = io.TextIOWrapper(io.BytesIO())  # without a file descriptor
+        writer = FrameWriter(stream, "latin-1")
+        writer.write(io.BytesIO(u"café █".encode("utf-8")))
+        writer.write(io.BytesIO(b"ascii"))
+        assert stream.buffer.getvalue() == b"caf\xe9 ?ascii"
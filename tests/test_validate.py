@@ -0,0 +1,99 @@
+# coding=utf-8
+import locale
+import os
+
+import pytest
+
+from ascii_telnet.ascii_compiled import compile_movie
+from ascii_telnet.ascii_movie import Movie, StreamingMovie
+from ascii_telnet.ascii_validate import ERROR, WARNING, split_movie, validate
+
+SHORT_INTRO = os.path.join(os.path.dirname(__file__), "..", "sample_movies", "short_intro.txt")
+
+
+def write_movie(tmpdir, frames, name="movie.txt"):
+    path = tmpdir.join(name)
+    path.write_binary(b"".join(delay + b"\n" + b"".join(line + b"\n" for line in lines)
+                               for delay, lines in frames))
+    return str(path)
+
+
+class TestValidate(object):
+    def test_sample_movie(self):
+        report, = validate([SHORT_INTRO], jobs=1)
+        movie = Movie()
+        movie.load(SHORT_INTRO)
+        assert report.display_times == movie.display_times()
+        assert report.errors == 0
+
+    def test_problems_with_line_numbers(self, tmpdir):
+        path = write_movie(tmpdir, [(b"3", [b"ok"] * 13),
+                                    (b"x", [b"a\tb", b"y" * 70] + [b""] * 11),
+                                    (b"0", [b"\xff"] + [b""] * 12)])
+        report, = validate([path], jobs=1)
+        assert report.problems == [
+            (15, ERROR, "frame delay 'x' is not a number"),
+            (16, WARNING, "control character in column 2"),
+            (17, WARNING, "line is 70 characters wide, frames are 67"),
+            (29, WARNING, "frame delay is 0, the frame is never shown"),
+            (30, ERROR, "undecodable byte at column 1 ({0})".format(locale.getpreferredencoding(False))),
+        ]
+        assert report.format_problems(warnings=False) == [
+            path + ":15: error: frame delay 'x' is not a number",
+            path + ":30: error: undecodable byte at column 1 ({0})".format(locale.getpreferredencoding(False)),
+        ]
+
+    def test_trailing_blank_line(self, tmpdir):
+        path = write_movie(tmpdir, [(b"1", [b"frame"] * 13)])
+        with open(path, "ab") as f:
+            f.write(b"\n")
+        report, = validate([path], jobs=1)
+        assert (15, ERROR, "frame delay '' is not a number") in report.problems
+        with pytest.raises(ValueError, match=":15: invalid frame delay"):
+            Movie().load(path)
+        with pytest.raises(ValueError, match=":15: invalid frame delay"):
+            StreamingMovie().load(path)
+
+    def test_missing_and_empty_files(self, tmpdir):
+        empty = tmpdir.join("empty.txt")
+        empty.write("")
+        missing, empty = validate([str(tmpdir.join("missing.txt")), str(empty)], jobs=1)
+        assert missing.errors == 1
+        assert empty.problems == [(None, ERROR, "no frames")]
+
+
+class TestChunks(object):
+    def test_chunks_end_at_frame_boundaries(self):
+        chunks = split_movie(SHORT_INTRO, chunk_bytes=500)
+        assert len(chunks) > 1
+        with open(SHORT_INTRO, "rb") as f:
+            data = f.read()
+        assert chunks[0][0] == 0 and chunks[-1][1] == len(data)
+        for (_, end, _), (start, _, first_line) in zip(chunks, chunks[1:]):
+            assert end == start
+            assert data[:start].count(b"\n") == first_line
+            assert first_line % 14 == 0
+
+    def test_chunks_in_processes(self, tmpdir):
+        path = write_movie(tmpdir, [(str(delay).encode(), [b"frame"] * 13) for delay in range(1, 40)]
+                           + [(b"-1", [b"x" * 80] * 13)])
+        whole, = validate([path], jobs=1)
+        chunked, = validate([path], jobs=2, chunk_bytes=100)
+        assert chunked.display_times == whole.display_times
+        assert chunked.problems == whole.problems
+        assert (547, ERROR, "frame delay -1 is negative") in chunked.problems
+
+    def test_compiled_same_as_compile_movie(self, tmpdir):
+        source = str(tmpdir.join("short_intro.txt"))
+        with open(SHORT_INTRO, "rb") as f:
+            tmpdir.join("short_intro.txt").write_binary(f.read())
+        compile_movie(source, str(tmpdir.join("expected.atm")))
+        report, = validate([source], jobs=2, compile=True, chunk_bytes=500)
+        assert report.compiled == str(tmpdir.join("short_intro.atm"))
+        assert tmpdir.join("short_intro.atm").read_binary() == tmpdir.join("expected.atm").read_binary()
+
+    def test_no_compiled_movie_on_errors(self, tmpdir):
+        path = write_movie(tmpdir, [(b"nan", [b"frame"] * 13)])
+        report, = validate([path], jobs=1, compile=True)
+        assert report.compiled is None
+        assert not tmpdir.join("movie.atm").exists()